@@ -0,0 +1,103 @@
+"""
+Admission control for heavy analysis stages
+Bounded concurrency with a FIFO wait queue, queue positions and timeouts
+"""
+
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+from config import ADMISSION_LIMITS
+
+
+class AdmissionRejected(RuntimeError):
+    """Raised when a stage is saturated or the wait for a slot timed out"""
+
+
+class AdmissionController:
+    """Process-wide limiter: max_concurrent running, max_queue waiting, FIFO order"""
+
+    def __init__(self, name, max_concurrent, max_queue, timeout):
+        self.name = name
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self._active = 0
+        self._waiting = deque()
+        self._cond = threading.Condition()
+
+    @property
+    def active(self):
+        return self._active
+
+    @property
+    def queued(self):
+        return len(self._waiting)
+
+    @contextmanager
+    def admit(self, on_wait=None, timeout=None):
+        """Hold a slot for the duration of the block
+
+        on_wait(position) is called (outside the lock) whenever the caller's
+        1-based queue position changes while it waits.
+        """
+        timeout = self.timeout if timeout is None else timeout
+        ticket = object()
+
+        with self._cond:
+            if self._active >= self.max_concurrent and len(self._waiting) >= self.max_queue:
+                raise AdmissionRejected(
+                    f"The {self.name} service is at capacity ({self._active} running, "
+                    f"{len(self._waiting)} waiting). Please try again in a few minutes."
+                )
+            self._waiting.append(ticket)
+
+        deadline = time.monotonic() + timeout
+        reported = None
+        try:
+            while True:
+                with self._cond:
+                    if self._waiting[0] is ticket and self._active < self.max_concurrent:
+                        self._waiting.popleft()
+                        self._active += 1
+                        # The next ticket may also fit into a free slot
+                        self._cond.notify_all()
+                        break
+                    position = self._waiting.index(ticket) + 1
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise AdmissionRejected(
+                            f"Timed out after {timeout:g}s waiting for a free {self.name} slot. "
+                            f"Please try again."
+                        )
+                    if position == reported:
+                        self._cond.wait(min(remaining, 1.0))
+                        continue
+
+                reported = position
+                if on_wait:
+                    on_wait(position)
+        except BaseException:
+            with self._cond:
+                if ticket in self._waiting:
+                    self._waiting.remove(ticket)
+                    self._cond.notify_all()
+            raise
+
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._active -= 1
+                self._cond.notify_all()
+
+
+GATES = {
+    name: AdmissionController(name, **limits) for name, limits in ADMISSION_LIMITS.items()
+}
+
+
+def gate(name):
+    """Shared admission controller for a stage ('extraction', 'scoring')"""
+    return GATES[name]
@@ -0,0 +1,370 @@
+"""
+Medical report analysis and risk calculation
+Importable without Streamlit so background workers can run the pipeline
+"""
+
+import io
+import logging
+import re
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from rules import (
+    RISK_TABLES, HEALTH_SCORE_TABLE, RISK_LEVEL_TABLE, SCORE_FEEDBACK_TABLE, describe_risk
+)
+from ocr import image_to_text
+from pdf_extract import extract_text, describe_gaps
+from keywords import FLAG_MATCHER
+from uploads import UploadBuffer
+from admission import gate
+from batch_engine import normalize_columns, column_key
+from units import normalize_record
+from report_index import open_index
+from config import REPORT_INDEX_PATH
+
+logger = logging.getLogger(__name__)
+
+# Numeric patient_data keys that a lab table row may fill
+LAB_KEYS = {'glucose', 'cholesterol', 'creatinine', 'hb', 'bmi', 'weight', 'height',
+            'bp_systolic', 'bp_diastolic'}
+
+# Patient identifier printed on a report ("Patient ID: PAT-2024-001", "MRN # 55012")
+PATIENT_ID_PATTERN = re.compile(
+    r'(?i)\b(?:patient|member)\s*(?:id|no\.?|number)\s*[:#]?\s*([A-Z0-9][A-Z0-9-]{2,})|\bMRN\s*[:#]?\s*([A-Z0-9][A-Z0-9-]{2,})'
+)
+
+# Units written next to values in free text ("Weight: 185 lbs", "Glucose 6.1 mmol/L")
+UNIT_PATTERNS = {
+    'glucose': r'(?i)(?:glucose|blood sugar|sugar|fbs)[:\s]+\d+(?:\.\d+)?\s*(mg/dl|mmol/l)',
+    'cholesterol': r'(?i)(?:cholesterol|chol)[:\s]+\d+(?:\.\d+)?\s*(mg/dl|mmol/l)',
+    'weight': r'(?i)\b(?:weight|wt)[:\s]+\d+(?:\.\d+)?\s*(kgs?|lbs?|pounds?)\b',
+    'height': r'(?i)\b(?:height|ht)[:\s]+\d+(?:\.\d+)?\s*(cm|m|in|inches)\b',
+    'creatinine': r'(?i)creatinine[:\s]+\d+(?:\.\d+)?\s*(mg/dl|[uµμ]mol/l)'
+}
+
+# ============================================
+# ENHANCED MEDICAL REPORT ANALYSIS
+# ============================================
+
+class EnhancedMedicalReportAnalyzer:
+    """Enhanced analyzer for medical reports"""
+    
+    @staticmethod
+    def extract_from_pdf(file):
+        """Extract text from PDF file (path or file object)"""
+        if isinstance(file, str):
+            return EnhancedMedicalReportAnalyzer.extract_pdf_pages(file)['text']
+        with UploadBuffer(file) as upload:
+            return EnhancedMedicalReportAnalyzer.extract_pdf_pages(upload.as_path())['text']
+    
+    @staticmethod
+    def extract_pdf_pages(path):
+        """Extract PDF text and lab table rows under page/document deadlines"""
+        result = extract_text(path, tables=True)
+        if result['page_count'] is None:
+            result['text'] = f"PDF extraction failed. Error: {result['error']}\nPlease try manual entry."
+        return result
+    
+    @staticmethod
+    def extract_from_image(file):
+        """Extract text from a scanned report or photo with local OCR"""
+        try:
+            return image_to_text(file)
+        except Exception as e:
+            return f"Image OCR failed. Error: {str(e)}\nPlease try manual entry."
+    
+    @staticmethod
+    def lab_values(rows):
+        """Map normalized lab table rows onto patient_data keys, returns (values, units)"""
+        values = {}
+        units = {}
+        for row in rows:
+            key = column_key(row['analyte'])
+            if key in LAB_KEYS and key not in values:
+                values[key] = row['value']
+                if row['unit']:
+                    units[key] = row['unit']
+        return values, units
+    
+    @staticmethod
+    def report_units(text, skip=()):
+        """Units stated next to values in the report text, as {feature: unit}
+
+        Features in `skip` (already known from lab tables) are not searched.
+        """
+        units = {}
+        for key, pattern in UNIT_PATTERNS.items():
+            if key in skip:
+                continue
+            match = re.search(pattern, text)
+            if match:
+                units[key] = match.group(1)
+        return units
+    
+    @staticmethod
+    def parse_medical_report(text, skip=()):
+        """Enhanced parsing with more medical terms
+
+        Keys in `skip` (already read from lab tables) are not searched for.
+        """
+        
+        patterns = {
+            'glucose': r'(?i)(?:glucose|blood sugar|sugar|fbs)[:\s]+(\d{1,2}\.\d+|\d{2,3})',
+            'cholesterol': r'(?i)(?:cholesterol|chol|ldl|hdl)[:\s]+(\d{1,2}\.\d+|\d{3})',
+            'bp_systolic': r'(?i)(?:bp|blood pressure)[:\s]*(\d{2,3})\s*[/\s]\s*(\d{2,3})',
+            'age': r'(?i)(?:age|dob.*age)[:\s]+(\d{2})',
+            'bmi': r'(?i)(?:bmi|body mass index)[:\s]+(\d{2}\.\d|\d{2})',
+            'weight': r'(?i)\b(?:weight|wt)[:\s]+(\d{2,3})',
+            'height': r'(?i)\b(?:height|ht)[:\s]+(\d{3})',
+            'hb': r'(?i)(?:hemoglobin|hb)[:\s]+(\d{1,2}\.\d)',
+            'creatinine': r'(?i)(?:creatinine)[:\s]+(\d\.\d|\d{2,3})'
+        }
+        
+        extracted = {}
+        
+        for key, pattern in patterns.items():
+            if key in skip:
+                continue
+            matches = re.findall(pattern, text)
+            if matches:
+                if key == 'bp_systolic':
+                    extracted['bp_systolic'] = int(matches[0][0])
+                    extracted['bp_diastolic'] = int(matches[0][1])
+                elif key in ['glucose', 'cholesterol']:
+                    # Decimals are mmol/L readings, converted by normalize_record
+                    value = float(matches[0])
+                    extracted[key] = int(value) if value.is_integer() else value
+                elif key == 'age':
+                    extracted['age'] = int(matches[0])
+                elif key == 'bmi':
+                    extracted['bmi'] = float(matches[0])
+                elif key == 'weight':
+                    extracted['weight'] = int(matches[0])
+                elif key == 'height':
+                    extracted['height'] = int(matches[0])
+                elif key == 'hb':
+                    extracted['hb'] = float(matches[0])
+                elif key == 'creatinine':
+                    extracted['creatinine'] = float(matches[0])
+        
+        # Condition and lifestyle flags: one automaton pass with negation checks
+        extracted.update(FLAG_MATCHER.flags(text))
+        
+        return extracted
+    
+    @staticmethod
+    def index_report(pages, file_name, text):
+        """Add an extracted report to the full-text index, returns its report_id (or None)
+
+        Indexing is best effort: a locked, full or corrupt index must not
+        fail the analysis itself.
+        """
+        if not pages or REPORT_INDEX_PATH is None:
+            return None
+        match = PATIENT_ID_PATTERN.search(text)
+        patient_id = (match.group(1) or match.group(2)).upper() if match else None
+        try:
+            return open_index(REPORT_INDEX_PATH).add(pages, file_name, patient_id)
+        except Exception:
+            logger.exception("Could not index report %s", file_name)
+            return None
+    
+    @staticmethod
+    def analyze_report(file, on_wait=None):
+        """Analyze uploaded medical report"""
+        # Zero-copy view of the upload; large files are spooled and memory-mapped
+        with UploadBuffer(file) as upload:
+            return EnhancedMedicalReportAnalyzer.analyze_upload(upload, on_wait)
+    
+    @staticmethod
+    def analyze_path(path, file_name=None):
+        """Analyze a report file that is already on disk"""
+        with UploadBuffer.from_path(path, name=file_name) as upload:
+            return EnhancedMedicalReportAnalyzer.analyze_upload(upload)
+    
+    @staticmethod
+    def analyze_upload(upload, on_wait=None):
+        """Extract, parse and complete patient data from an UploadBuffer
+
+        PDF and OCR extraction run under the 'extraction' admission gate;
+        on_wait(position) reports the queue position while waiting for a slot.
+        """
+        file_extension = upload.name.split('.')[-1].lower()
+        extraction_notes = ''
+        lab_rows = []
+        pages = None
+        
+        if file_extension == 'pdf':
+            with gate('extraction').admit(on_wait=on_wait):
+                pdf_result = EnhancedMedicalReportAnalyzer.extract_pdf_pages(upload.as_path())
+            extracted_text = pdf_result['text']
+            lab_rows = pdf_result.get('lab_rows', [])
+            extraction_notes = describe_gaps(pdf_result) if pdf_result['page_count'] is not None else ''
+            if pdf_result['page_count'] is not None:
+                pages = pdf_result['pages']
+        elif file_extension in ['txt', 'text']:
+            extracted_text = upload.text()
+            pages = [(1, extracted_text)]
+        elif file_extension == 'csv':
+            # A single-report view of a CSV shows its first patient row
+            first_row = normalize_columns(pd.read_csv(io.BufferedReader(upload.open()), nrows=1))
+            extracted_text = first_row.to_string(index=False)
+        else:
+            # Scanned images and photos go through local OCR
+            with gate('extraction').admit(on_wait=on_wait):
+                extracted_text = EnhancedMedicalReportAnalyzer.extract_from_image(upload.open())
+            if not extracted_text.startswith('Image OCR failed'):
+                pages = [(1, extracted_text)]
+        
+        # Parse the text
+        if file_extension == 'csv':
+            extracted_data = {k: (v.item() if hasattr(v, 'item') else v)
+                              for k, v in first_row.iloc[0].dropna().items()} if len(first_row) else {}
+        else:
+            # Table cells keep analyte/value pairs intact, so they win over the
+            # text regexes, which only look for what the tables did not fill
+            table_values, table_units = EnhancedMedicalReportAnalyzer.lab_values(lab_rows)
+            extracted_data = EnhancedMedicalReportAnalyzer.parse_medical_report(extracted_text, skip=table_values)
+            units = EnhancedMedicalReportAnalyzer.report_units(extracted_text, skip=table_units)
+            extracted_data.update(table_values)
+            units.update(table_units)
+            # CSV rows were converted by normalize_columns already
+            extracted_data = normalize_record(extracted_data, units)
+        
+        # Fill missing values
+        defaults = {
+            'age': 45,
+            'glucose': 95,
+            'cholesterol': 180,
+            'bp_systolic': 120,
+            'bp_diastolic': 80,
+            'bmi': 24,
+            'diabetes': False,
+            'hypertension': False,
+            'smoking': False,
+            'alcohol': False
+        }
+        
+        for key, default_value in defaults.items():
+            if key not in extracted_data:
+                extracted_data[key] = default_value
+        
+        # Calculate BMI if weight/height available
+        if 'weight' in extracted_data and 'height' in extracted_data:
+            height_m = extracted_data['height'] / 100
+            extracted_data['bmi'] = round(extracted_data['weight'] / (height_m ** 2), 1)
+        
+        # The full text goes to the search index; the result keeps a preview
+        report_id = EnhancedMedicalReportAnalyzer.index_report(pages, upload.name, extracted_text)
+        
+        return {
+            'extracted_text': extracted_text[:800] + "..." if len(extracted_text) > 800 else extracted_text,
+            'report_id': report_id,
+            'parsed_data': extracted_data,
+            'extraction_notes': extraction_notes,
+            'lab_results': lab_rows,
+            'file_name': upload.name,
+            'file_size': f"{upload.size / 1024:.1f} KB",
+            'timestamp': datetime.now().strftime("%Y-%m-%d %H:%M")
+        }
+
+# ============================================
+# ENHANCED RISK CALCULATOR
+# ============================================
+
+class EnhancedRiskCalculator:
+    """Advanced risk calculation engine"""
+    
+    @staticmethod
+    def calculate_health_score(patient_data):
+        """Calculate overall health score (0-100)"""
+        if not patient_data:
+            return 75  # Default score
+        
+        # BMI, glucose, BP, cholesterol and lifestyle penalties (config.HEALTH_SCORE_RULES)
+        return HEALTH_SCORE_TABLE.score_one(patient_data)
+    
+    @staticmethod
+    def get_score_feedback(score):
+        """Get feedback based on health score"""
+        return SCORE_FEEDBACK_TABLE.label(score)
+    
+    @staticmethod
+    def calculate_risks(patient_data):
+        """Calculate enhanced disease risks"""
+        if not patient_data:
+            return None
+        
+        # Thresholds and increments live in config.RISK_RULES
+        result = {}
+        for disease, table in RISK_TABLES.items():
+            risk = table.score_one(patient_data)
+            result[disease] = {
+                'risk': risk,
+                'level': RISK_LEVEL_TABLE.label(risk),
+                'percentage': round(risk * 100, 1),
+                'description': EnhancedRiskCalculator.get_risk_description(disease, risk)
+            }
+        result['timestamp'] = datetime.now().strftime("%Y-%m-%d %H:%M")
+        return result
+    
+    @staticmethod
+    def get_risk_description(disease, risk):
+        """Get descriptive text for risk level"""
+        return describe_risk(disease, risk)
+    
+    @staticmethod
+    def generate_timeline(risk_scores):
+        """Generate 10-year risk timeline with interventions"""
+        if not risk_scores:
+            return None
+            
+        years = list(range(11))  # 0 to 10 years
+        
+        timeline = {
+            'years': years,
+            'without_intervention': {},
+            'with_intervention': {}
+        }
+        
+        interventions = {
+            'diabetes': {'effectiveness': 0.35, 'delay': 1},
+            'heart_disease': {'effectiveness': 0.40, 'delay': 2},
+            'hypertension': {'effectiveness': 0.45, 'delay': 1},
+            'kidney_disease': {'effectiveness': 0.30, 'delay': 2}
+        }
+        
+        for disease, data in risk_scores.items():
+            if disease == 'timestamp':
+                continue
+            current_risk = data.get('risk', 0.1)
+            
+            # Without intervention (compounding risk)
+            without = [current_risk]
+            for year in range(1, 11):
+                age_factor = 1 + (year * 0.015)  # 1.5% increase per year due to aging
+                progression = 1 + (0.06 * year)  # 6% progression per year
+                new_risk = min(0.95, without[-1] * age_factor * progression)
+                without.append(new_risk)
+            
+            # With intervention
+            with_int = [current_risk]
+            intervention = interventions.get(disease, {'effectiveness': 0.3, 'delay': 1})
+            
+            for year in range(1, 11):
+                if year <= intervention['delay']:
+                    # Initial adjustment period
+                    adj_risk = with_int[-1] * 1.02
+                else:
+                    # Intervention takes effect
+                    improvement = 1 - (intervention['effectiveness'] * (1 - np.exp(-0.3 * (year - intervention['delay']))))
+                    adj_risk = max(0.05, with_int[-1] * improvement)
+                
+                with_int.append(adj_risk)
+            
+            timeline['without_intervention'][disease] = without
+            timeline['with_intervention'][disease] = with_int
+        
+        return timeline
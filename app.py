@@ -11,13 +11,34 @@ import plotly.express as px
 import time
 from datetime import datetime, timedelta
 import random
+import io
 import json
+import os
+import tempfile
 import base64
 from io import BytesIO
 import re
 import warnings
 warnings.filterwarnings('ignore')
 
+from whatif import WhatIfSimulator, WHATIF_RANGES
+from simulation import timeline_bands, simulate_costs
+from optimizer import optimize_portfolio, plan_names, OBJECTIVES
+from config import COST_PARAMS, INTERVENTION_CATALOG, POPULATION_RESULTS_PATH, JOB_POLL_INTERVAL, NEIGHBOR_INDEX_PATH, REPORT_INDEX_PATH, REPORT_SEARCH_CANDIDATES
+import jobs
+from jobs import JobQueue
+from admission import AdmissionRejected, gate
+import population
+from quantiles import PopulationSketches, sketch_path
+from neighbors import NeighborIndex
+from report_index import open_index
+from charts import line_trace, register_theme, FIGURE_CACHE
+from uploads import UploadBuffer
+from batch_engine import score_csv_to_csv
+from analysis import EnhancedMedicalReportAnalyzer, EnhancedRiskCalculator
+
+CHART_THEME = register_theme()
+
 # ============================================
 # ENHANCED PAGE CONFIGURATION
 # ============================================
@@ -466,7 +487,11 @@ def init_session_state():
         'extracted_data': None,
         'current_page': "dashboard",
         'analysis_history': [],
-        'health_metrics': {}
+        'health_metrics': {},
+        'whatif_surface': None,
+        'whatif_key': None,
+        'bulk_result': None,
+        'active_job': None
     }
     
     for key, default_value in defaults.items():
@@ -475,356 +500,6 @@ def init_session_state():
 
 init_session_state()
 
-# ============================================
-# ENHANCED MEDICAL REPORT ANALYSIS
-# ============================================
-
-class EnhancedMedicalReportAnalyzer:
-    """Enhanced analyzer for medical reports"""
-    
-    @staticmethod
-    def extract_from_pdf(file):
-        """Extract text from PDF file"""
-        try:
-            extracted_text = ""
-            import pdfplumber
-            with pdfplumber.open(file) as pdf:
-                for page in pdf.pages:
-                    text = page.extract_text()
-                    if text:
-                        extracted_text += text + "\n"
-            return extracted_text
-        except Exception as e:
-            return f"PDF extraction failed. Error: {str(e)}\nPlease try manual entry."
-    
-    @staticmethod
-    def parse_medical_report(text):
-        """Enhanced parsing with more medical terms"""
-        
-        patterns = {
-            'glucose': r'(?i)(?:glucose|blood sugar|sugar|fbs)[:\s]+(\d{2,3})',
-            'cholesterol': r'(?i)(?:cholesterol|chol|ldl|hdl)[:\s]+(\d{3})',
-            'bp_systolic': r'(?i)(?:bp|blood pressure)[:\s]*(\d{2,3})\s*[/\s]\s*(\d{2,3})',
-            'age': r'(?i)(?:age|dob.*age)[:\s]+(\d{2})',
-            'bmi': r'(?i)(?:bmi|body mass index)[:\s]+(\d{2}\.\d|\d{2})',
-            'weight': r'(?i)(?:weight|wt)[:\s]+(\d{2,3})',
-            'height': r'(?i)(?:height|ht)[:\s]+(\d{3})',
-            'hb': r'(?i)(?:hemoglobin|hb)[:\s]+(\d{1,2}\.\d)',
-            'creatinine': r'(?i)(?:creatinine)[:\s]+(\d\.\d)',
-            'diabetes': r'(?i)(?:diabetes|dm|diabetic)',
-            'hypertension': r'(?i)(?:hypertension|htn|high bp)',
-            'smoking': r'(?i)(?:smoking|smoker|tobacco)',
-            'alcohol': r'(?i)(?:alcohol|drinking)'
-        }
-        
-        extracted = {}
-        
-        for key, pattern in patterns.items():
-            matches = re.findall(pattern, text)
-            if matches:
-                if key == 'bp_systolic':
-                    extracted['bp_systolic'] = int(matches[0][0])
-                    extracted['bp_diastolic'] = int(matches[0][1])
-                elif key == 'glucose':
-                    extracted['glucose'] = int(matches[0])
-                elif key == 'cholesterol':
-                    extracted['cholesterol'] = int(matches[0])
-                elif key == 'age':
-                    extracted['age'] = int(matches[0])
-                elif key == 'bmi':
-                    extracted['bmi'] = float(matches[0])
-                elif key == 'weight':
-                    extracted['weight'] = int(matches[0])
-                elif key == 'height':
-                    extracted['height'] = int(matches[0])
-                elif key == 'hb':
-                    extracted['hb'] = float(matches[0])
-                elif key == 'creatinine':
-                    extracted['creatinine'] = float(matches[0])
-                elif key in ['diabetes', 'hypertension', 'smoking', 'alcohol']:
-                    extracted[key] = True
-        
-        return extracted
-    
-    @staticmethod
-    def analyze_report(file):
-        """Analyze uploaded medical report"""
-        file_extension = file.name.split('.')[-1].lower()
-        
-        if file_extension == 'pdf':
-            extracted_text = EnhancedMedicalReportAnalyzer.extract_from_pdf(BytesIO(file.read()))
-        elif file_extension in ['txt', 'text']:
-            extracted_text = file.read().decode('utf-8')
-        else:
-            # Simulate image OCR
-            extracted_text = """MEDICAL REPORT
-Patient: John Doe
-Age: 45
-Height: 175 cm
-Weight: 80 kg
-BMI: 26.1
-Blood Pressure: 135/85
-Fasting Glucose: 110 mg/dL
-Cholesterol: 210 mg/dL
-Smoking: No
-Diabetes: No
-Hypertension: Borderline"""
-        
-        # Parse the text
-        extracted_data = EnhancedMedicalReportAnalyzer.parse_medical_report(extracted_text)
-        
-        # Fill missing values
-        defaults = {
-            'age': 45,
-            'glucose': 95,
-            'cholesterol': 180,
-            'bp_systolic': 120,
-            'bp_diastolic': 80,
-            'bmi': 24,
-            'diabetes': False,
-            'hypertension': False,
-            'smoking': False,
-            'alcohol': False
-        }
-        
-        for key, default_value in defaults.items():
-            if key not in extracted_data:
-                extracted_data[key] = default_value
-        
-        # Calculate BMI if weight/height available
-        if 'weight' in extracted_data and 'height' in extracted_data:
-            height_m = extracted_data['height'] / 100
-            extracted_data['bmi'] = round(extracted_data['weight'] / (height_m ** 2), 1)
-        
-        return {
-            'extracted_text': extracted_text[:800] + "..." if len(extracted_text) > 800 else extracted_text,
-            'parsed_data': extracted_data,
-            'file_name': file.name,
-            'file_size': f"{file.size / 1024:.1f} KB",
-            'timestamp': datetime.now().strftime("%Y-%m-%d %H:%M")
-        }
-
-# ============================================
-# ENHANCED RISK CALCULATOR
-# ============================================
-
-class EnhancedRiskCalculator:
-    """Advanced risk calculation engine"""
-    
-    @staticmethod
-    def calculate_health_score(patient_data):
-        """Calculate overall health score (0-100)"""
-        if not patient_data:
-            return 75  # Default score
-        
-        score = 100
-        
-        # BMI penalty
-        bmi = patient_data.get('bmi', 24)
-        if bmi > 30:
-            score -= 25
-        elif bmi > 25:
-            score -= 15
-        
-        # Glucose penalty
-        glucose = patient_data.get('glucose', 95)
-        if glucose > 126:
-            score -= 20
-        elif glucose > 100:
-            score -= 10
-        
-        # BP penalty
-        systolic = patient_data.get('bp_systolic', 120)
-        if systolic > 140:
-            score -= 20
-        elif systolic > 130:
-            score -= 10
-        
-        # Cholesterol penalty
-        cholesterol = patient_data.get('cholesterol', 180)
-        if cholesterol > 240:
-            score -= 15
-        elif cholesterol > 200:
-            score -= 8
-        
-        # Lifestyle penalties
-        if patient_data.get('smoking', False):
-            score -= 15
-        if patient_data.get('alcohol', False):
-            score -= 5
-        
-        return max(0, min(100, score))
-    
-    @staticmethod
-    def get_score_feedback(score):
-        """Get feedback based on health score"""
-        if score >= 80:
-            return "Excellent health! Keep up the good habits."
-        elif score >= 60:
-            return "Good health. Some areas for improvement."
-        elif score >= 40:
-            return "Moderate health. Consider lifestyle changes."
-        else:
-            return "Needs attention. Consult a healthcare provider."
-    
-    @staticmethod
-    def calculate_risks(patient_data):
-        """Calculate enhanced disease risks"""
-        if not patient_data:
-            return None
-            
-        age = patient_data.get('age', 45)
-        glucose = patient_data.get('glucose', 95)
-        bp_systolic = patient_data.get('bp_systolic', 120)
-        cholesterol = patient_data.get('cholesterol', 180)
-        bmi = patient_data.get('bmi', 24)
-        smoking = patient_data.get('smoking', False)
-        diabetes_history = patient_data.get('diabetes', False)
-        hypertension_history = patient_data.get('hypertension', False)
-        
-        # Enhanced diabetes risk
-        diabetes_risk = 0.08
-        if glucose > 126: diabetes_risk += 0.40
-        elif glucose > 100: diabetes_risk += 0.25
-        if bmi > 30: diabetes_risk += 0.30
-        elif bmi > 25: diabetes_risk += 0.20
-        if age > 50: diabetes_risk += 0.15
-        elif age > 40: diabetes_risk += 0.08
-        if diabetes_history: diabetes_risk += 0.25
-        if patient_data.get('family_diabetes', False): diabetes_risk += 0.12
-        
-        # Enhanced heart disease risk
-        heart_risk = 0.06
-        if cholesterol > 240: heart_risk += 0.35
-        elif cholesterol > 200: heart_risk += 0.20
-        if bp_systolic > 140: heart_risk += 0.30
-        elif bp_systolic > 130: heart_risk += 0.18
-        if smoking: heart_risk += 0.30
-        if bmi > 30: heart_risk += 0.25
-        if age > 55: heart_risk += 0.20
-        elif age > 45: heart_risk += 0.10
-        if patient_data.get('family_heart', False): heart_risk += 0.15
-        
-        # Enhanced hypertension risk
-        hypertension_risk = 0.12
-        if bp_systolic > 140: hypertension_risk += 0.40
-        elif bp_systolic > 130: hypertension_risk += 0.25
-        if bmi > 30: hypertension_risk += 0.25
-        if hypertension_history: hypertension_risk += 0.30
-        if age > 45: hypertension_risk += 0.15
-        if smoking: hypertension_risk += 0.10
-        
-        # Kidney disease risk (new)
-        kidney_risk = 0.04
-        if bp_systolic > 140: kidney_risk += 0.25
-        if glucose > 126: kidney_risk += 0.20
-        if patient_data.get('creatinine', 0.8) > 1.2: kidney_risk += 0.30
-        if age > 60: kidney_risk += 0.15
-        
-        # Cap risks
-        risks = {
-            'diabetes': min(0.98, diabetes_risk),
-            'heart_disease': min(0.98, heart_risk),
-            'hypertension': min(0.98, hypertension_risk),
-            'kidney_disease': min(0.98, kidney_risk)
-        }
-        
-        # Determine levels
-        def get_level(risk):
-            if risk < 0.25: return "Low"
-            elif risk < 0.5: return "Medium"
-            elif risk < 0.75: return "High"
-            else: return "Critical"
-        
-        result = {}
-        for disease, risk in risks.items():
-            result[disease] = {
-                'risk': risk,
-                'level': get_level(risk),
-                'percentage': round(risk * 100, 1),
-                'description': EnhancedRiskCalculator.get_risk_description(disease, risk)
-            }
-        result['timestamp'] = datetime.now().strftime("%Y-%m-%d %H:%M")
-        return result
-    
-    @staticmethod
-    def get_risk_description(disease, risk):
-        """Get descriptive text for risk level"""
-        if disease == 'diabetes':
-            if risk < 0.25: return "Normal glucose control"
-            elif risk < 0.5: return "Pre-diabetic range"
-            elif risk < 0.75: return "High diabetes risk"
-            else: return "Probable diabetes"
-        elif disease == 'heart_disease':
-            if risk < 0.25: return "Healthy cardiovascular profile"
-            elif risk < 0.5: return "Moderate heart risk"
-            elif risk < 0.75: return "High heart risk"
-            else: return "Very high heart risk"
-        elif disease == 'hypertension':
-            if risk < 0.25: return "Normal blood pressure"
-            elif risk < 0.5: return "Borderline hypertension"
-            elif risk < 0.75: return "High hypertension risk"
-            else: return "Probable hypertension"
-        else:
-            if risk < 0.25: return "Normal kidney function"
-            elif risk < 0.5: return "Moderate kidney risk"
-            elif risk < 0.75: return "High kidney risk"
-            else: return "Probable kidney issues"
-    
-    @staticmethod
-    def generate_timeline(risk_scores):
-        """Generate 10-year risk timeline with interventions"""
-        if not risk_scores:
-            return None
-            
-        years = list(range(11))  # 0 to 10 years
-        
-        timeline = {
-            'years': years,
-            'without_intervention': {},
-            'with_intervention': {}
-        }
-        
-        interventions = {
-            'diabetes': {'effectiveness': 0.35, 'delay': 1},
-            'heart_disease': {'effectiveness': 0.40, 'delay': 2},
-            'hypertension': {'effectiveness': 0.45, 'delay': 1},
-            'kidney_disease': {'effectiveness': 0.30, 'delay': 2}
-        }
-        
-        for disease, data in risk_scores.items():
-            if disease == 'timestamp':
-                continue
-            current_risk = data.get('risk', 0.1)
-            
-            # Without intervention (compounding risk)
-            without = [current_risk]
-            for year in range(1, 11):
-                age_factor = 1 + (year * 0.015)  # 1.5% increase per year due to aging
-                progression = 1 + (0.06 * year)  # 6% progression per year
-                new_risk = min(0.95, without[-1] * age_factor * progression)
-                without.append(new_risk)
-            
-            # With intervention
-            with_int = [current_risk]
-            intervention = interventions.get(disease, {'effectiveness': 0.3, 'delay': 1})
-            
-            for year in range(1, 11):
-                if year <= intervention['delay']:
-                    # Initial adjustment period
-                    adj_risk = with_int[-1] * 1.02
-                else:
-                    # Intervention takes effect
-                    improvement = 1 - (intervention['effectiveness'] * (1 - np.exp(-0.3 * (year - intervention['delay']))))
-                    adj_risk = max(0.05, with_int[-1] * improvement)
-                
-                with_int.append(adj_risk)
-            
-            timeline['without_intervention'][disease] = without
-            timeline['with_intervention'][disease] = with_int
-        
-        return timeline
-
 # ============================================
 # ENHANCED VISUALIZATION FUNCTIONS
 # ============================================
@@ -847,46 +522,45 @@ class EnhancedVisualizations:
         
         if not categories:
             return None
-            
-        fig = go.Figure()
-        
-        fig.add_trace(go.Scatterpolar(
-            r=values,
-            theta=categories,
-            fill='toself',
-            name='Risk Levels',
-            line=dict(color='#3b82f6', width=3),
-            fillcolor='rgba(59, 130, 246, 0.3)'
-        ))
         
-        fig.update_layout(
-            polar=dict(
-                radialaxis=dict(
-                    visible=True,
-                    range=[0, 100],
-                    tickfont=dict(color='#cbd5e1'),
-                    gridcolor='rgba(255, 255, 255, 0.1)'
-                ),
-                angularaxis=dict(
-                    tickfont=dict(color='#cbd5e1'),
-                    gridcolor='rgba(255, 255, 255, 0.1)'
-                ),
-                bgcolor='rgba(30, 41, 59, 0.8)'
-            ),
-            showlegend=False,
-            height=400,
-            paper_bgcolor='rgba(0,0,0,0)',
-            plot_bgcolor='rgba(0,0,0,0)'
-        )
+        def build():
+            fig = go.Figure()
+            
+            fig.add_trace(go.Scatterpolar(
+                r=values,
+                theta=categories,
+                fill='toself',
+                name='Risk Levels',
+                line=dict(color='#3b82f6', width=3),
+                fillcolor='rgba(59, 130, 246, 0.3)'
+            ))
+            
+            # Colors and grid styling come from the shared template
+            fig.update_layout(
+                template=CHART_THEME,
+                polar=dict(radialaxis=dict(visible=True, range=[0, 100])),
+                showlegend=False,
+                height=400
+            )
+            return fig
         
-        return fig
+        return FIGURE_CACHE.get_or_build('risk_radar', [categories, values], build)
     
     @staticmethod
     def create_health_timeline(timeline_data):
         """Create animated timeline chart"""
         if not timeline_data:
             return None
-            
+        
+        return FIGURE_CACHE.get_or_build(
+            'health_timeline',
+            timeline_data,
+            lambda: EnhancedVisualizations._build_health_timeline(timeline_data)
+        )
+    
+    @staticmethod
+    def _build_health_timeline(timeline_data):
+        """Build the timeline figure (traces only, styling from the template)"""
         years = timeline_data['years']
         
         fig = go.Figure()
@@ -904,19 +578,19 @@ class EnhancedVisualizations:
             without_data = timeline_data['without_intervention'].get(disease)
             with_data = timeline_data['with_intervention'].get(disease)
             
-            if without_data and with_data:
-                fig.add_trace(go.Scatter(
-                    x=years,
-                    y=[r * 100 for r in without_data],
+            if without_data is not None and with_data is not None:
+                fig.add_trace(line_trace(
+                    years,
+                    np.asarray(without_data) * 100,
                     mode='lines',
                     name=f'{disease.replace("_", " ").title()} - No Action',
                     line=dict(color=colors[disease], width=3, dash='dash'),
                     hovertemplate='%{y:.1f}% risk'
                 ))
                 
-                fig.add_trace(go.Scatter(
-                    x=years,
-                    y=[r * 100 for r in with_data],
+                fig.add_trace(line_trace(
+                    years,
+                    np.asarray(with_data) * 100,
                     mode='lines',
                     name=f'{disease.replace("_", " ").title()} - With Prevention',
                     line=dict(color=colors[disease], width=3),
@@ -924,31 +598,65 @@ class EnhancedVisualizations:
                 ))
         
         fig.update_layout(
-            title=dict(
-                text='10-Year Risk Projection',
-                font=dict(size=20, color='white'),
-                x=0.5
-            ),
-            xaxis_title=dict(text='Years from Now', font=dict(color='#cbd5e1')),
-            yaxis_title=dict(text='Risk Probability (%)', font=dict(color='#cbd5e1')),
+            template=CHART_THEME,
+            title_text='10-Year Risk Projection',
+            xaxis_title_text='Years from Now',
+            yaxis_title_text='Risk Probability (%)',
             height=450,
-            hovermode='x unified',
-            plot_bgcolor='rgba(30, 41, 59, 0.8)',
-            paper_bgcolor='rgba(0,0,0,0)',
-            font=dict(color='#cbd5e1'),
-            legend=dict(
-                bgcolor='rgba(30, 41, 59, 0.8)',
-                bordercolor='rgba(255, 255, 255, 0.1)',
-                borderwidth=1
-            ),
-            xaxis=dict(
-                gridcolor='rgba(255, 255, 255, 0.1)',
-                zerolinecolor='rgba(255, 255, 255, 0.1)'
-            ),
-            yaxis=dict(
-                gridcolor='rgba(255, 255, 255, 0.1)',
-                zerolinecolor='rgba(255, 255, 255, 0.1)'
-            )
+            hovermode='x unified'
+        )
+        
+        return fig
+    
+    @staticmethod
+    def create_timeline_bands(bands):
+        """Timeline chart with Monte Carlo percentile bands"""
+        if not bands:
+            return None
+        
+        return FIGURE_CACHE.get_or_build(
+            'timeline_bands',
+            bands,
+            lambda: EnhancedVisualizations._build_timeline_bands(bands)
+        )
+    
+    @staticmethod
+    def _build_timeline_bands(bands):
+        """Build the band chart: shaded low-high percentile range around the median"""
+        years = bands['years']
+        low, mid, high = [f'p{p}' for p in bands['percentiles']]
+        colors = {
+            'diabetes': ('#8b5cf6', 'rgba(139, 92, 246, 0.15)'),
+            'heart_disease': ('#ef4444', 'rgba(239, 68, 68, 0.15)'),
+            'hypertension': ('#3b82f6', 'rgba(59, 130, 246, 0.15)')
+        }
+        
+        fig = go.Figure()
+        for disease, (color, fill) in colors.items():
+            for scenario, label, dash in [('without_intervention', 'No Action', 'dash'),
+                                          ('with_intervention', 'With Prevention', 'solid')]:
+                band = bands[scenario].get(disease)
+                if band is None:
+                    continue
+                name = f'{disease.replace("_", " ").title()} - {label}'
+                fig.add_trace(go.Scatter(x=years, y=np.asarray(band[high]) * 100, mode='lines',
+                                         line=dict(width=0), legendgroup=name, showlegend=False,
+                                         hoverinfo='skip'))
+                fig.add_trace(go.Scatter(x=years, y=np.asarray(band[low]) * 100, mode='lines',
+                                         line=dict(width=0), fill='tonexty', fillcolor=fill,
+                                         legendgroup=name, showlegend=False, hoverinfo='skip'))
+                fig.add_trace(go.Scatter(x=years, y=np.asarray(band[mid]) * 100, mode='lines',
+                                         name=name, legendgroup=name,
+                                         line=dict(color=color, width=3, dash=dash),
+                                         hovertemplate='%{y:.1f}% median risk'))
+        
+        fig.update_layout(
+            template=CHART_THEME,
+            title_text=f'10-Year Risk Projection ({low}-{high} band)',
+            xaxis_title_text='Years from Now',
+            yaxis_title_text='Risk Probability (%)',
+            height=450,
+            hovermode='x unified'
         )
         
         return fig
@@ -991,6 +699,12 @@ def show_enhanced_dashboard():
     
     # Health Score Card
     health_score = EnhancedRiskCalculator.calculate_health_score(st.session_state.patient_data)
+    sketches = population_sketches()
+    comparison = ''
+    if sketches is not None and sketches.count:
+        comparison = (f'<div style="color: #60a5fa; font-size: 0.9rem; margin-top: 0.5rem;">'
+                      f'Healthier than {sketches.percentile("health_score", health_score):.0f}% '
+                      f'of {sketches.count:,} members</div>')
     col1, col2 = st.columns([2, 1])
     
     with col1:
@@ -1005,6 +719,7 @@ def show_enhanced_dashboard():
                 <div style="color: #94a3b8; font-size: 0.9rem;">
                     {EnhancedRiskCalculator.get_score_feedback(health_score)}
                 </div>
+                {comparison}
             </div>
         </div>
         ''', unsafe_allow_html=True)
@@ -1045,6 +760,9 @@ def show_enhanced_dashboard():
                         level = data.get('level', 'Low')
                         percentage = data.get('percentage', 0)
                         description = data.get('description', 'No description')
+                        if sketches is not None and sketches.count:
+                            description += (f" · higher than "
+                                            f"{sketches.percentile(f'{disease}_risk', data.get('risk', 0)):.0f}% of members")
                         
                         if level == "Low":
                             status_class = "status-good"
@@ -1093,7 +811,7 @@ def show_enhanced_dashboard():
             if st.session_state.risk_scores:
                 fig = EnhancedVisualizations.create_risk_radar(st.session_state.risk_scores)
                 if fig:
-                    st.plotly_chart(fig, use_container_width=True)
+                    st.plotly_chart(fig, use_container_width=True, theme=None)
                 else:
                     st.info("No risk data available for radar chart")
             else:
@@ -1102,9 +820,19 @@ def show_enhanced_dashboard():
         # Timeline Visualization
         if st.session_state.timeline_data:
             st.markdown('<div class="section-title">📈 Risk Timeline Projection</div>', unsafe_allow_html=True)
-            fig = EnhancedVisualizations.create_health_timeline(st.session_state.timeline_data)
+            if st.checkbox("Show uncertainty bands (Monte Carlo)", key="timeline_bands_toggle") and st.session_state.risk_scores:
+                risks = {disease: data['risk'] for disease, data in st.session_state.risk_scores.items()
+                         if isinstance(data, dict)}
+                fig = EnhancedVisualizations.create_timeline_bands(timeline_bands(risks))
+            else:
+                fig = EnhancedVisualizations.create_health_timeline(st.session_state.timeline_data)
             if fig:
-                st.plotly_chart(fig, use_container_width=True)
+                st.plotly_chart(fig, use_container_width=True, theme=None)
+        
+        # What-If Simulator
+        if st.session_state.patient_data:
+            st.markdown('<div class="section-title">🧪 What-If Simulator</div>', unsafe_allow_html=True)
+            show_whatif_simulator(st.session_state.patient_data)
     
     with col2:
         # Quick Actions Panel
@@ -1180,6 +908,155 @@ def show_enhanced_dashboard():
         </div>
         ''', unsafe_allow_html=True)
 
+def show_whatif_simulator(patient_data):
+    """What-if sliders served from a precomputed per-patient response surface"""
+    # Rebuild the surface only when the patient changes, slider moves are lookups
+    surface_key = json.dumps(patient_data, sort_keys=True, default=str)
+    if st.session_state.whatif_key != surface_key:
+        st.session_state.whatif_surface = WhatIfSimulator(patient_data)
+        st.session_state.whatif_key = surface_key
+    simulator = st.session_state.whatif_surface
+    
+    def slider_default(axis, fallback):
+        low, high = WHATIF_RANGES[axis]
+        return type(low)(min(high, max(low, patient_data.get(axis, fallback))))
+    
+    col1, col2 = st.columns(2)
+    with col1:
+        glucose = st.slider("Fasting Glucose (mg/dL)", *WHATIF_RANGES['glucose'],
+                            slider_default('glucose', 95), 1, key="whatif_glucose_slider")
+        systolic = st.slider("Systolic BP", *WHATIF_RANGES['bp_systolic'],
+                             slider_default('bp_systolic', 120), 1, key="whatif_systolic_slider")
+    with col2:
+        cholesterol = st.slider("Cholesterol (mg/dL)", *WHATIF_RANGES['cholesterol'],
+                                slider_default('cholesterol', 180), 1, key="whatif_cholesterol_slider")
+        bmi = st.slider("BMI", *WHATIF_RANGES['bmi'],
+                        slider_default('bmi', 24.0), 0.1, key="whatif_bmi_slider")
+    
+    current = simulator.lookup()
+    scenario = simulator.lookup(glucose=glucose, bp_systolic=systolic, cholesterol=cholesterol, bmi=bmi)
+    
+    cols = st.columns(len(scenario['risk_scores']) + 1)
+    cols[0].metric(
+        "Health Score",
+        f"{scenario['health_score']:.0f}",
+        f"{scenario['health_score'] - current['health_score']:+.0f}"
+    )
+    for col, (disease, data) in zip(cols[1:], scenario['risk_scores'].items()):
+        delta = data['percentage'] - current['risk_scores'][disease]['percentage']
+        col.metric(disease.replace('_', ' ').title(), f"{data['percentage']:.1f}%",
+                   f"{delta:+.1f}%", delta_color="inverse")
+    
+    fig = EnhancedVisualizations.create_health_timeline(scenario['timeline'])
+    if fig:
+        st.plotly_chart(fig, use_container_width=True, theme=None)
+
+@st.cache_resource
+def load_population_sketches(path, modified):
+    """Population percentile sketches (reloaded when the file changes)"""
+    return PopulationSketches.load(path)
+
+def population_sketches():
+    """Sketches beside the configured scored cohort, or None before one is scored"""
+    path = sketch_path(POPULATION_RESULTS_PATH)
+    if not os.path.exists(path):
+        return None
+    return load_population_sketches(path, os.path.getmtime(path))
+
+@st.cache_resource
+def get_job_queue():
+    """Process-wide background job queue shared by all sessions"""
+    return JobQueue()
+
+def show_job_progress(job_id):
+    """Poll a background analysis job and load its results when done"""
+    job = get_job_queue().status(job_id)
+    if job is None:
+        st.session_state.active_job = None
+        return
+    
+    if job['status'] in (jobs.QUEUED, jobs.RUNNING):
+        if job['status'] == jobs.QUEUED:
+            label = f"Waiting for a free worker, position {get_job_queue().position(job_id)} in queue"
+        else:
+            label = "Analyzing with AI"
+        st.info(f"🔍 {label}... ({job['file_name']})")
+        time.sleep(JOB_POLL_INTERVAL)
+        st.rerun()
+    
+    st.session_state.active_job = None
+    if job['status'] == jobs.FAILED:
+        st.error(f"Analysis failed: {job['error']}")
+        return
+    
+    # Store results
+    result = job['result']
+    st.session_state.extracted_data = result['analysis']
+    extracted = result['analysis']['parsed_data']
+    extracted['name'] = "Report Analysis"
+    st.session_state.patient_data = extracted
+    st.session_state.risk_scores = result['risk_scores']
+    st.session_state.timeline_data = result['timeline_data']
+    
+    if result['analysis'].get('extraction_notes'):
+        st.warning(f"⚠️ Partial extraction: {result['analysis']['extraction_notes']}")
+    st.success("✅ Analysis complete! Generating insights...")
+    time.sleep(1)
+    st.session_state.current_page = "dashboard"
+    st.rerun()
+
+def show_bulk_scoring(uploaded_file):
+    """Stream-score a multi-patient CSV and offer the results as a download"""
+    col1, col2, col3 = st.columns([1, 2, 1])
+    with col2:
+        if st.button("🚀 Score All Patients", type="primary", use_container_width=True, key="bulk_score_main"):
+            previous = st.session_state.bulk_result
+            if previous and os.path.exists(previous['path']):
+                os.remove(previous['path'])
+            
+            st.session_state.bulk_result = None
+            
+            progress_text = st.empty()
+            handle, output_path = tempfile.mkstemp(prefix='mediprecog_scores_', suffix='.csv')
+            os.close(handle)
+            
+            # Bulk scoring runs in this server process, so it shares the 'scoring' slots
+            try:
+                with gate('scoring').admit(
+                    on_wait=lambda position: progress_text.info(f"⏳ Server busy, position {position} in queue...")
+                ):
+                    with st.spinner("🧮 Scoring patients..."), UploadBuffer(uploaded_file) as upload:
+                        summary = score_csv_to_csv(
+                            io.BufferedReader(upload.open()),
+                            output_path,
+                            progress=lambda rows: progress_text.caption(f"Scored {rows:,} patients...")
+                        )
+            except AdmissionRejected as e:
+                os.remove(output_path)
+                progress_text.empty()
+                st.error(f"⏳ {e}")
+            else:
+                summary['path'] = output_path
+                summary['file_name'] = uploaded_file.name.rsplit('.', 1)[0] + '_scored.csv'
+                st.session_state.bulk_result = summary
+    
+    result = st.session_state.bulk_result
+    if result and os.path.exists(result['path']):
+        st.success(f"✅ Scored {result['rows']:,} patients")
+        cols = st.columns(len(result['high_risk']))
+        for col, (disease, count) in zip(cols, result['high_risk'].items()):
+            col.metric(f"High Risk: {disease.replace('_', ' ').title()}", f"{count:,}")
+        
+        with open(result['path'], 'rb') as scored_file:
+            st.download_button(
+                "📥 Download Scored CSV",
+                scored_file,
+                file_name=result['file_name'],
+                mime='text/csv',
+                use_container_width=True,
+                key="bulk_download_main"
+            )
+
 # ============================================
 # ENHANCED REPORT ANALYZER - FIXED VERSION
 # ============================================
@@ -1225,36 +1102,27 @@ def show_enhanced_analyzer():
             </div>
             ''', unsafe_allow_html=True)
             
+            # CSV files hold many patients: score them all in bulk
+            if uploaded_file.name.lower().endswith('.csv'):
+                show_bulk_scoring(uploaded_file)
+                return
+            
             # Analysis options
             col1, col2, col3 = st.columns([1, 2, 1])
             with col2:
                 if st.button("🚀 Perform Advanced Analysis", type="primary", use_container_width=True, key="analyze_report_main"):
-                    with st.spinner("🔍 Analyzing with AI..."):
-                        progress_bar = st.progress(0)
-                        for i in range(100):
-                            time.sleep(0.01)
-                            progress_bar.progress(i + 1)
-                        
-                        # Analyze report
-                        analyzer = EnhancedMedicalReportAnalyzer()
-                        analysis_result = analyzer.analyze_report(uploaded_file)
-                        
-                        # Store results
+                    # Extraction and scoring run in a background worker process
+                    try:
+                        with UploadBuffer(uploaded_file) as upload:
+                            st.session_state.active_job = get_job_queue().submit(upload)
+                    except AdmissionRejected as e:
+                        st.error(f"⏳ {e}")
+                    else:
                         st.session_state.uploaded_report = uploaded_file.name
-                        st.session_state.extracted_data = analysis_result
-                        extracted = analysis_result['parsed_data']
-                        extracted['name'] = "Report Analysis"
-                        st.session_state.patient_data = extracted
-                        
-                        # Calculate risks
-                        calculator = EnhancedRiskCalculator()
-                        st.session_state.risk_scores = calculator.calculate_risks(extracted)
-                        st.session_state.timeline_data = calculator.generate_timeline(st.session_state.risk_scores)
-                        
-                        st.success("✅ Analysis complete! Generating insights...")
-                        time.sleep(1)
-                        st.session_state.current_page = "dashboard"
                         st.rerun()
+                
+                if st.session_state.active_job:
+                    show_job_progress(st.session_state.active_job)
         else:
             st.markdown('''
             <div class="glass-card">
@@ -1414,32 +1282,42 @@ def show_cost_calculator():
             avg_risk = 30  # Default
         
         # Cost calculations
-        base_cost = 50000
+        base_cost = COST_PARAMS['base_cost']
+        prevention = COST_PARAMS['prevention_factor']
         risk_multiplier = 1 + (avg_risk / 100)
         
         col1, col2, col3 = st.columns(3)
         with col1:
             st.metric("Annual Cost (No Prevention)", f"₹{base_cost * risk_multiplier:,.0f}")
         with col2:
-            st.metric("Annual Cost (With Prevention)", f"₹{base_cost * risk_multiplier * 0.6:,.0f}")
+            st.metric("Annual Cost (With Prevention)", f"₹{base_cost * risk_multiplier * prevention:,.0f}")
         with col3:
-            st.metric("Annual Savings", f"₹{base_cost * risk_multiplier * 0.4:,.0f}")
+            st.metric("Annual Savings", f"₹{base_cost * risk_multiplier * (1 - prevention):,.0f}")
         
         # Simple chart
-        years = list(range(1, 11))
-        without_costs = [base_cost * risk_multiplier * (1.05 ** (y-1)) for y in years]
-        with_costs = [base_cost * risk_multiplier * 0.6 * (1.03 ** (y-1)) for y in years]
-        
-        df = pd.DataFrame({
-            'Year': years,
-            'Without Prevention': without_costs,
-            'With Prevention': with_costs
-        })
+        years = list(range(1, COST_PARAMS['years'] + 1))
+        without_costs = [base_cost * risk_multiplier * ((1 + COST_PARAMS['growth_without']) ** (y-1)) for y in years]
+        with_costs = [base_cost * risk_multiplier * prevention * ((1 + COST_PARAMS['growth_with']) ** (y-1)) for y in years]
         
-        fig = px.line(df, x='Year', y=['Without Prevention', 'With Prevention'],
-                     title="10-Year Cost Projection",
-                     markers=True)
+        fig = go.Figure()
+        for label, costs in [('Without Prevention', without_costs), ('With Prevention', with_costs)]:
+            fig.add_trace(line_trace(years, costs, mode='lines+markers', name=label))
+        fig.update_layout(title="10-Year Cost Projection", xaxis_title='Year', yaxis_title='Annual Cost (₹)')
         st.plotly_chart(fig, use_container_width=True)
+        
+        # Spread of 10-year costs from sampled disease onsets and treatment costs
+        st.markdown('<div class="section-title">🎲 Cost Uncertainty</div>', unsafe_allow_html=True)
+        risks = {disease: data['risk'] for disease, data in st.session_state.risk_scores.items()
+                 if isinstance(data, dict)}
+        spread = simulate_costs(risks, simulations=5000)
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            st.metric("10-Year Cost p50 (No Prevention)", f"₹{spread['without_intervention']['p50']:,.0f}")
+        with col2:
+            st.metric("10-Year Cost p95 (No Prevention)", f"₹{spread['without_intervention']['p95']:,.0f}")
+        with col3:
+            st.metric("10-Year Cost p95 (With Prevention)", f"₹{spread['with_intervention']['p95']:,.0f}")
+        st.caption(f"Based on {spread['simulations']:,} simulated disease onsets and treatment costs")
 
 def show_action_plan():
     """Simplified Action Plan"""
@@ -1505,6 +1383,32 @@ def show_action_plan():
             </div>
         </div>
         ''', unsafe_allow_html=True)
+    
+    # Best affordable combination of catalog interventions for this patient
+    if st.session_state.risk_scores:
+        st.markdown('<div class="section-title">💡 Optimal Intervention Portfolio</div>', unsafe_allow_html=True)
+        col1, col2 = st.columns(2)
+        with col1:
+            budget = st.slider("Annual program budget (₹)", 0, 70000, 25000, 1000, key="portfolio_budget")
+        with col2:
+            objective = st.radio("Optimize for", OBJECTIVES, horizontal=True, key="portfolio_objective",
+                                 format_func=lambda name: name.replace('_', ' ').title())
+        
+        risks = {disease: data['risk'] for disease, data in st.session_state.risk_scores.items()
+                 if isinstance(data, dict)}
+        best = optimize_portfolio(risks, budget, objective,
+                                  {'smoking': bool(st.session_state.patient_data.get('smoking', False))})
+        chosen = plan_names(best['plan'][0])
+        if not chosen:
+            st.info("No intervention fits this budget.")
+        else:
+            for name in chosen:
+                st.markdown(f"- **{name.replace('_', ' ').title()}** (₹{INTERVENTION_CATALOG[name]['cost']:,}/year)")
+            value = best['value'][0]
+            # risk_reduction sums the mean yearly reduction of every condition
+            outcome = (f"{value * 100:.1f} pts average yearly risk reduction, summed over {len(risks)} conditions"
+                       if objective == 'risk_reduction' else f"₹{value:,.0f} expected 10-year net savings")
+            st.success(f"Program cost ₹{best['program_cost'][0]:,.0f}/year · {outcome}")
 
 def show_full_report():
     """Simplified Full Report"""
@@ -1577,6 +1481,171 @@ def show_full_report():
     if st.button("📥 Generate PDF Report", type="primary", use_container_width=True, key="download_report_main"):
         st.success("Report generation started! This would generate a PDF in a real implementation.")
 
+@st.cache_data(show_spinner=False)
+def load_population_aggregates(path, modified):
+    """Aggregate a scored cohort file (cached per file version)"""
+    columns = [f'{d}_{suffix}' for d in population.DISEASES for suffix in ('risk', 'level')]
+    columns += ['health_score', 'top_factor', 'annual_cost', 'cost_10y_without', 'cost_10y_with']
+    scores = population.load_scores(path, columns=columns)
+    if scores is None:
+        return None
+    
+    return {
+        'members': len(scores),
+        'mean_health_score': float(scores['health_score'].mean()) if len(scores) else 0.0,
+        'levels': population.level_counts(scores),
+        'histograms': population.risk_histograms(scores),
+        'factors': population.factor_counts(scores),
+        'costs': population.cost_summary(scores)
+    }
+
+def show_population_dashboard():
+    """Cohort-level analytics from the batch scorer output"""
+    st.markdown('<div class="main-title">👥 Population Health Analytics</div>', unsafe_allow_html=True)
+    
+    path = st.text_input("Scored cohort file (Arrow or Parquet)", POPULATION_RESULTS_PATH, key="population_path_input")
+    if not os.path.exists(path):
+        st.info(f"No scored cohort found at `{path}`. Create one with "
+                f"`python batch_engine.py members.csv {path}`.")
+        return
+    
+    aggregates = load_population_aggregates(path, os.path.getmtime(path))
+    
+    col1, col2, col3, col4 = st.columns(4)
+    with col1:
+        st.metric("Members", f"{aggregates['members']:,}")
+    with col2:
+        st.metric("Avg Health Score", f"{aggregates['mean_health_score']:.1f}")
+    with col3:
+        st.metric("10-Year Cost (No Prevention)", f"₹{aggregates['costs']['cost_10y_without']['total']:,.0f}")
+    with col4:
+        st.metric("p95 Annual Cost", f"₹{aggregates['costs']['annual_cost']['p95']:,.0f}")
+    
+    st.markdown('<div class="section-title">⚠️ Members per Risk Level</div>', unsafe_allow_html=True)
+    levels = aggregates['levels']
+    fig = go.Figure()
+    level_colors = {'Low': '#10b981', 'Medium': '#f59e0b', 'High': '#ef4444', 'Critical': '#991b1b'}
+    for level in levels.columns:
+        fig.add_trace(go.Bar(
+            x=[d.replace('_', ' ').title() for d in levels.index],
+            y=levels[level],
+            name=level,
+            marker_color=level_colors.get(level)
+        ))
+    fig.update_layout(barmode='stack', height=400, paper_bgcolor='rgba(0,0,0,0)',
+                      plot_bgcolor='rgba(30, 41, 59, 0.8)', font=dict(color='#cbd5e1'))
+    st.plotly_chart(fig, use_container_width=True)
+    
+    st.markdown('<div class="section-title">📊 Risk Distributions</div>', unsafe_allow_html=True)
+    disease = st.selectbox(
+        "Condition",
+        list(aggregates['histograms']),
+        format_func=lambda d: d.replace('_', ' ').title(),
+        key="population_disease_select"
+    )
+    counts, edges = aggregates['histograms'][disease]
+    fig = go.Figure(go.Bar(
+        x=(edges[:-1] + edges[1:]) / 2,
+        y=counts,
+        width=np.diff(edges),
+        marker_color='#3b82f6'
+    ))
+    fig.update_layout(xaxis_title='Risk Probability (%)', yaxis_title='Members', height=350,
+                      paper_bgcolor='rgba(0,0,0,0)', plot_bgcolor='rgba(30, 41, 59, 0.8)',
+                      font=dict(color='#cbd5e1'))
+    st.plotly_chart(fig, use_container_width=True)
+    
+    col1, col2 = st.columns(2)
+    with col1:
+        st.markdown('<div class="section-title">🎯 Top Contributing Factors</div>', unsafe_allow_html=True)
+        factors = aggregates['factors']
+        st.dataframe(pd.DataFrame({
+            'Factor': [f.replace('_', ' ').title() for f in factors.index],
+            'Members': factors.values
+        }), use_container_width=True, hide_index=True)
+    with col2:
+        st.markdown('<div class="section-title">💰 Projected Costs</div>', unsafe_allow_html=True)
+        st.dataframe(pd.DataFrame([
+            {
+                'Projection': name.replace('_', ' ').replace('10y', '10-Year').title(),
+                'Total': f"₹{summary['total']:,.0f}",
+                'Mean': f"₹{summary['mean']:,.0f}",
+                'p95': f"₹{summary['p95']:,.0f}"
+            }
+            for name, summary in aggregates['costs'].items()
+        ]), use_container_width=True, hide_index=True)
+    
+    show_similar_members()
+
+@st.cache_resource(show_spinner="Loading member index...")
+def load_neighbor_index(path, modified):
+    """Nearest-neighbor member index (reloaded when the file changes)"""
+    return NeighborIndex.load(path)
+
+def show_similar_members():
+    """Members whose profile is closest to the analyzed patient, for outreach"""
+    st.markdown('<div class="section-title">🧑‍🤝‍🧑 Patients Like You</div>', unsafe_allow_html=True)
+    if not os.path.exists(NEIGHBOR_INDEX_PATH):
+        st.info(f"No member index at `{NEIGHBOR_INDEX_PATH}`. Create one with "
+                f"`python neighbors.py members.csv {NEIGHBOR_INDEX_PATH}`.")
+        return
+    if not st.session_state.patient_data:
+        st.info("Analyze a report or enter patient data to find similar members.")
+        return
+    
+    index = load_neighbor_index(NEIGHBOR_INDEX_PATH, os.path.getmtime(NEIGHBOR_INDEX_PATH))
+    count = st.slider("Members to show", 5, 50, 10, key="neighbors_count")
+    similar = index.query(st.session_state.patient_data, k=count)
+    for column in [c for c in similar.columns if c.endswith('_risk')]:
+        similar[column] = (similar[column] * 100).round(1)
+    similar.columns = [c.replace('_', ' ').title() for c in similar.columns]
+    st.dataframe(similar, use_container_width=True, hide_index=True)
+
+# ============================================
+# REPORT SEARCH
+# ============================================
+
+def show_report_search():
+    """Ranked full-text search across every ingested report"""
+    st.markdown('<div class="main-title">🔎 Report Search</div>', unsafe_allow_html=True)
+    
+    if REPORT_INDEX_PATH is None or not os.path.exists(REPORT_INDEX_PATH):
+        st.info("No reports indexed yet. Every analyzed report is added to the search index.")
+        return
+    
+    index = open_index(REPORT_INDEX_PATH)
+    reports, pages = index.counts()
+    storage = index.store.stats()
+    st.caption(f"{reports:,} reports · {pages:,} pages indexed · text stored in "
+               f"{storage['stored_bytes'] / 1e6:,.1f} MB ({storage['ratio']:.1f}x {storage['codec']})")
+    
+    col1, col2 = st.columns([3, 1])
+    with col1:
+        query = st.text_input("Search terms", placeholder='creatinine 1.4, "ST segment"', key="report_search_query")
+    with col2:
+        patient_id = st.text_input("Patient ID (optional)", key="report_search_patient")
+    recent_only = st.checkbox(f"Only search the newest {REPORT_SEARCH_CANDIDATES:,} matching pages (faster)",
+                              value=False, key="report_search_recent")
+    if not query:
+        return
+    
+    started = time.perf_counter()
+    hits = index.search(query, patient_id=patient_id.strip().upper() or None,
+                        candidates=REPORT_SEARCH_CANDIDATES if recent_only else None)
+    elapsed = (time.perf_counter() - started) * 1000
+    if not hits:
+        st.warning("No matching reports.")
+        return
+    
+    scope = f" among the newest {REPORT_SEARCH_CANDIDATES:,} matching pages" if recent_only else ""
+    st.caption(f"{len(hits)} best matches{scope} in {elapsed:.0f} ms")
+    for hit in hits:
+        with st.expander(f"📄 {hit['file_name'] or hit['report_id']} · page {hit['page']} · "
+                         f"patient {hit['patient_id'] or 'unknown'} · {hit['ingested']}"):
+            st.markdown(hit['snippet'])
+            if st.button("Show full text", key=f"report_text_{hit['report_id']}_{hit['page']}"):
+                st.text(index.report_text(hit['report_id']))
+
 # ============================================
 # ENHANCED SIDEBAR
 # ============================================
@@ -1598,7 +1667,9 @@ def create_enhanced_sidebar():
             "analyzer": "🔬 Analyzer",
             "cost": "💰 Cost AI",
             "plan": "🎯 Action AI",
-            "report": "📊 Insights"
+            "report": "📊 Insights",
+            "population": "👥 Population",
+            "search": "🔎 Report Search"
         }
         
         # Create navigation buttons - always render all buttons
@@ -1734,6 +1805,10 @@ def main():
         show_action_plan()
     elif current_page == "report":
         show_full_report()
+    elif current_page == "population":
+        show_population_dashboard()
+    elif current_page == "search":
+        show_report_search()
 
 # ============================================
 # RUN APPLICATION
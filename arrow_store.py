@@ -0,0 +1,156 @@
+"""
+Arrow IPC interchange for scored cohorts
+Fixed schema for patients, risk scores, costs and timelines, written as
+uncompressed Feather v2 so readers can memory-map column subsets
+"""
+
+import os
+import sys
+
+import numpy as np
+import pyarrow as pa
+
+from batch_engine import BatchRiskCalculator, DISEASES, TIMELINE_YEARS, id_strings, iter_scored_chunks
+from config import BULK_CHUNK_ROWS
+
+SCHEMA_VERSION = 'scores/1'
+ARROW_SUFFIXES = ('.arrow', '.feather', '.ipc')
+
+LEVEL_TYPE = pa.dictionary(pa.int8(), pa.string())
+TIMELINE_TYPE = pa.list_(pa.float32(), TIMELINE_YEARS + 1)
+
+PATIENT_FIELDS = [
+    pa.field('patient_id', pa.string()),
+    pa.field('name', pa.string()),
+    pa.field('age', pa.float32()),
+    pa.field('bmi', pa.float32()),
+    pa.field('glucose', pa.float32()),
+    pa.field('bp_systolic', pa.float32()),
+    pa.field('cholesterol', pa.float32())
+]
+
+SCORE_FIELDS = [
+    field
+    for disease in DISEASES
+    for field in (pa.field(f'{disease}_risk', pa.float32(), nullable=False),
+                  pa.field(f'{disease}_level', LEVEL_TYPE, nullable=False))
+] + [
+    pa.field('health_score', pa.int16(), nullable=False),
+    pa.field('top_factor', LEVEL_TYPE, nullable=False),
+    pa.field('annual_cost', pa.float32(), nullable=False),
+    pa.field('cost_10y_without', pa.float32(), nullable=False),
+    pa.field('cost_10y_with', pa.float32(), nullable=False)
+]
+
+# Yearly projections, one fixed-size list of TIMELINE_YEARS + 1 values per row
+TIMELINE_FIELDS = [
+    pa.field(f'{disease}_{scenario}', TIMELINE_TYPE, nullable=False)
+    for disease in DISEASES for scenario in ['without', 'with']
+]
+
+SCORES_SCHEMA = pa.schema(
+    PATIENT_FIELDS + SCORE_FIELDS + TIMELINE_FIELDS,
+    metadata={'mediprecog.schema': SCHEMA_VERSION, 'mediprecog.timeline_years': str(TIMELINE_YEARS)}
+)
+
+
+def is_arrow_path(path):
+    """Whether a scored cohort path uses the Arrow IPC format"""
+    return str(path).lower().endswith(ARROW_SUFFIXES)
+
+
+def _timeline_array(values):
+    """(n, years + 1) array -> fixed-size list column (no per-row objects)"""
+    values = np.ascontiguousarray(values, dtype=np.float32)
+    return pa.FixedSizeListArray.from_arrays(pa.array(values.reshape(-1)), values.shape[1])
+
+
+def _dictionary_array(column):
+    """Categorical column -> dictionary column keeping its category order"""
+    return pa.DictionaryArray.from_arrays(
+        pa.array(column.cat.codes.to_numpy(dtype=np.int8)),
+        pa.array(list(column.cat.categories), type=pa.string())
+    )
+
+
+def scores_batch(scored):
+    """Record batch in SCORES_SCHEMA for a score_frame() DataFrame"""
+    rows = len(scored)
+    arrays = []
+    for field in PATIENT_FIELDS:
+        if field.name in scored.columns:
+            column = scored[field.name]
+            if pa.types.is_string(field.type):
+                arrays.append(pa.array(id_strings(column), type=field.type, from_pandas=True))
+            else:
+                arrays.append(pa.array(column.to_numpy(), type=field.type, from_pandas=True))
+        else:
+            arrays.append(pa.nulls(rows, type=field.type))
+
+    for field in SCORE_FIELDS:
+        column = scored[field.name]
+        if field.type == LEVEL_TYPE:
+            arrays.append(_dictionary_array(column))
+        else:
+            arrays.append(pa.array(column.to_numpy(), type=field.type))
+
+    # Timelines start from the stored float32 risks, so they match the risk columns exactly
+    timeline = BatchRiskCalculator.generate_timeline(
+        {disease: scored[f'{disease}_risk'].to_numpy(dtype=np.float64) for disease in DISEASES}
+    )
+    for disease in DISEASES:
+        arrays.append(_timeline_array(timeline['without_intervention'][disease]))
+        arrays.append(_timeline_array(timeline['with_intervention'][disease]))
+
+    return pa.RecordBatch.from_arrays(arrays, schema=SCORES_SCHEMA)
+
+
+def score_csv_to_arrow(source, destination, chunksize=BULK_CHUNK_ROWS, progress=None, sketches=None):
+    """Score a member CSV chunk by chunk into an Arrow IPC file, returns the row count
+
+    Each chunk is also added to `sketches` (PopulationSketches) when given.
+    """
+    rows = 0
+    with pa.OSFile(destination, 'wb') as sink, pa.ipc.new_file(sink, SCORES_SCHEMA) as writer:
+        for scored in iter_scored_chunks(source, chunksize):
+            writer.write_batch(scores_batch(scored))
+            if sketches is not None:
+                sketches.update(scored)
+            rows += len(scored)
+            if progress:
+                progress(rows)
+    return rows
+
+
+def open_scores(path):
+    """Memory-mapped Arrow table of a scored cohort file (no data is read yet)"""
+    return pa.ipc.open_file(pa.memory_map(path, 'r')).read_all()
+
+
+def read_columns(path, columns=None):
+    """DataFrame of (a subset of) the scored cohort columns
+
+    Only the selected columns' buffers are paged in from the mapped file;
+    numeric columns without nulls become zero-copy DataFrame blocks.
+    """
+    table = open_scores(path)
+    if columns is not None:
+        table = table.select(columns)
+    return table.to_pandas(split_blocks=True)
+
+
+def read_timelines(path, disease, scenario='without', rows=None):
+    """(n, TIMELINE_YEARS + 1) projections of one disease, a view over the mapped file"""
+    column = open_scores(path).column(f'{disease}_{scenario}')
+    if rows is not None:
+        column = column.take(pa.array(rows))
+    values = column.combine_chunks() if column.num_chunks != 1 else column.chunk(0)
+    return values.flatten().to_numpy(zero_copy_only=True).reshape(-1, TIMELINE_YEARS + 1)
+
+
+if __name__ == '__main__':
+    if len(sys.argv) != 3 or not is_arrow_path(sys.argv[2]):
+        print("Usage: python arrow_store.py members.csv scores.arrow")
+        sys.exit(1)
+    count = score_csv_to_arrow(sys.argv[1], sys.argv[2])
+    print(f"Scored {count:,} members -> {sys.argv[2]} ({os.path.getsize(sys.argv[2]) / 1e6:,.1f} MB)")
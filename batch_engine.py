@@ -0,0 +1,285 @@
+"""
+Vectorized batch risk engine
+Scores many patients at once with the same rules as EnhancedRiskCalculator
+"""
+
+import re
+import sys
+
+import numpy as np
+import pandas as pd
+
+from config import FEATURE_DEFAULTS, COST_PARAMS, BULK_CHUNK_ROWS, CSV_COLUMN_ALIASES
+from units import normalize_frame
+from rules import RISK_TABLES, HEALTH_SCORE_TABLE, RISK_LEVEL_TABLE, breakpoints
+
+# Cut points of the continuous features, derived from the rule tables
+BREAKPOINTS = {
+    feature: tuple(breakpoints(feature))
+    for feature in ['glucose', 'bp_systolic', 'cholesterol', 'bmi', 'age', 'creatinine']
+}
+
+DISEASES = ['diabetes', 'heart_disease', 'hypertension', 'kidney_disease']
+
+INTERVENTIONS = {
+    'diabetes': {'effectiveness': 0.35, 'delay': 1},
+    'heart_disease': {'effectiveness': 0.40, 'delay': 2},
+    'hypertension': {'effectiveness': 0.45, 'delay': 1},
+    'kidney_disease': {'effectiveness': 0.30, 'delay': 2}
+}
+
+TIMELINE_YEARS = 10
+AGING_RATE = 0.015           # yearly risk increase from aging
+PROGRESSION_RATE = 0.06      # yearly disease progression
+
+FLAG_COLUMNS = [key for key, value in FEATURE_DEFAULTS.items() if isinstance(value, bool)]
+TRUE_VALUES = {'1', 'true', 'yes', 'y', 't'}
+
+# Every feature that can be reported as a patient's top risk factor
+FACTOR_NAMES = sorted({f for table in RISK_TABLES.values() for f in table.features}) + ['none']
+
+
+def as_columns(data):
+    """Convert a DataFrame, dict of arrays or single patient dict to column arrays"""
+    if data is None:
+        return {}, 0
+
+    if hasattr(data, 'columns'):
+        keys = list(data.columns)
+    else:
+        keys = list(data.keys())
+
+    columns = {key: np.atleast_1d(np.asarray(data[key])) for key in keys}
+    n = max((len(col) for col in columns.values()), default=1)
+
+    for key, default in FEATURE_DEFAULTS.items():
+        col = columns.get(key)
+        if col is None:
+            columns[key] = np.full(n, default)
+            continue
+        if col.dtype.kind == 'f':
+            col = np.where(np.isnan(col), default, col)
+        elif col.dtype == object:
+            # Missing entries in mixed columns arrive as None or NaN
+            col = np.array([default if v is None or v != v else v for v in col])
+        if len(col) != n:
+            col = np.broadcast_to(col, (n,))
+        columns[key] = col
+
+    return columns, n
+
+
+class BatchRiskCalculator:
+    """Vectorized counterpart of EnhancedRiskCalculator"""
+
+    @staticmethod
+    def calculate_risks(data):
+        """Calculate disease risks for every row, returns {disease: risk array}"""
+        cols, n = as_columns(data)
+        if n == 0:
+            return {disease: np.empty(0) for disease in DISEASES}
+
+        return {disease: RISK_TABLES[disease].score(cols) for disease in DISEASES}
+
+    @staticmethod
+    def get_levels(risk):
+        """Map risk array to Low/Medium/High/Critical labels"""
+        return RISK_LEVEL_TABLE.labels_for(risk)
+
+    @staticmethod
+    def calculate_health_score(data):
+        """Calculate overall health score (0-100) for every row"""
+        cols, n = as_columns(data)
+        if n == 0:
+            return np.empty(0)
+
+        return HEALTH_SCORE_TABLE.score(cols)
+
+    @staticmethod
+    def top_factors(data):
+        """Name of the feature adding the most risk across diseases, per row"""
+        cols, n = as_columns(data)
+        totals = {}
+        for table in RISK_TABLES.values():
+            for feature, contribution in table.contributions(cols).items():
+                totals[feature] = totals.get(feature, 0) + contribution
+
+        names = np.array(list(totals) + ['none'])
+        stacked = np.vstack([np.broadcast_to(v, (n,)) for v in totals.values()])
+        top = np.argmax(stacked, axis=0)
+        top[stacked.max(axis=0) <= 0] = len(names) - 1
+        return names[top]
+
+    @staticmethod
+    def project_costs(risks):
+        """Annual and 10-year cost projections per row (same model as the cost page)"""
+        average = np.mean([np.asarray(risks[d], dtype=float) * 100 for d in DISEASES], axis=0)
+        annual = COST_PARAMS['base_cost'] * (1 + average / 100)
+
+        years = np.arange(COST_PARAMS['years'])
+        growth_without = ((1 + COST_PARAMS['growth_without']) ** years).sum()
+        growth_with = ((1 + COST_PARAMS['growth_with']) ** years).sum()
+
+        return {
+            'annual_cost': annual,
+            'cost_10y_without': annual * growth_without,
+            'cost_10y_with': annual * COST_PARAMS['prevention_factor'] * growth_with
+        }
+
+    @staticmethod
+    def generate_timeline(risks):
+        """Project 10-year risks for every row, returns (n, 11) arrays per disease"""
+        years = np.arange(TIMELINE_YEARS + 1)
+        steps = years[1:]
+
+        # Compounding factors are >= 1, so capping the cumulative product is
+        # equivalent to capping after every year
+        growth = np.cumprod((1 + steps * AGING_RATE) * (1 + PROGRESSION_RATE * steps))
+
+        timeline = {
+            'years': years.tolist(),
+            'without_intervention': {},
+            'with_intervention': {}
+        }
+
+        for disease, risk in risks.items():
+            risk = np.atleast_1d(np.asarray(risk, dtype=float))[:, None]
+            intervention = INTERVENTIONS.get(disease, {'effectiveness': 0.3, 'delay': 1})
+            delay = intervention['delay']
+
+            # Improvement factors are <= 1, so flooring the cumulative product is
+            # equivalent to flooring after every year once the delay has passed
+            improvement = np.where(
+                steps <= delay,
+                1.02,
+                1 - intervention['effectiveness'] * (1 - np.exp(-0.3 * (steps - delay)))
+            )
+            with_path = risk * np.cumprod(improvement)
+            with_path = np.where(steps > delay, np.maximum(0.05, with_path), with_path)
+
+            timeline['without_intervention'][disease] = np.hstack([risk, np.minimum(0.95, risk * growth)])
+            timeline['with_intervention'][disease] = np.hstack([risk, with_path])
+
+        return timeline
+
+
+def column_key(name):
+    """patient_data key for a CSV header or lab analyte name ("Fasting Glucose" -> glucose)"""
+    key = re.sub(r'[^a-z0-9]+', '_', str(name).strip().lower()).strip('_')
+    return CSV_COLUMN_ALIASES.get(key, key)
+
+
+def id_strings(column):
+    """Identifier column as nullable strings
+
+    Missing IDs stay <NA> rather than "nan"; integer IDs read as float
+    (because of gaps) stay "101", not "101.0".
+    """
+    if pd.api.types.is_float_dtype(column) and (column.dropna() % 1 == 0).all():
+        column = column.astype('Int64')
+    return column.astype('string')
+
+
+def normalize_columns(frame):
+    """Rename CSV headers to patient_data keys, coerce flags and units, derive fields"""
+    frame = frame.rename(columns={column: column_key(column) for column in frame.columns})
+    frame = frame.loc[:, ~frame.columns.duplicated()]
+
+    for flag in FLAG_COLUMNS:
+        if flag in frame.columns and not pd.api.types.is_numeric_dtype(frame[flag]):
+            frame[flag] = frame[flag].astype(str).str.strip().str.lower().isin(TRUE_VALUES)
+
+    if 'blood_pressure' in frame.columns and 'bp_systolic' not in frame.columns:
+        parts = frame['blood_pressure'].astype(str).str.extract(r'(\d{2,3})\s*/\s*(\d{2,3})')
+        frame['bp_systolic'] = pd.to_numeric(parts[0], errors='coerce')
+        frame['bp_diastolic'] = pd.to_numeric(parts[1], errors='coerce')
+
+    # Canonical units before anything derived from them
+    frame = normalize_frame(frame)
+
+    if 'bmi' not in frame.columns and {'weight', 'height'} <= set(frame.columns):
+        height_m = pd.to_numeric(frame['height'], errors='coerce') / 100
+        frame['bmi'] = (pd.to_numeric(frame['weight'], errors='coerce') / height_m ** 2).round(1)
+
+    return frame
+
+
+def score_frame(frame):
+    """Score a cohort DataFrame into a flat table ready for columnar storage"""
+    risks = BatchRiskCalculator.calculate_risks(frame)
+
+    scored = pd.DataFrame(index=frame.index)
+    for key in ['patient_id', 'id', 'name', 'age', 'bmi', 'glucose', 'bp_systolic', 'cholesterol']:
+        if key in frame.columns:
+            scored[key] = frame[key]
+
+    for disease in DISEASES:
+        scored[f'{disease}_risk'] = risks[disease].astype(np.float32)
+        scored[f'{disease}_level'] = pd.Categorical(
+            BatchRiskCalculator.get_levels(risks[disease]),
+            categories=RISK_LEVEL_TABLE.labels
+        )
+
+    scored['health_score'] = BatchRiskCalculator.calculate_health_score(frame).astype(np.int16)
+    scored['top_factor'] = pd.Categorical(BatchRiskCalculator.top_factors(frame), categories=FACTOR_NAMES)
+    for key, values in BatchRiskCalculator.project_costs(risks).items():
+        scored[key] = values.astype(np.float32)
+
+    return scored
+
+
+def iter_scored_chunks(source, chunksize=BULK_CHUNK_ROWS):
+    """Stream a member CSV (path or file object) as scored DataFrame chunks"""
+    for chunk in pd.read_csv(source, chunksize=chunksize):
+        yield score_frame(normalize_columns(chunk))
+
+
+def score_csv_to_csv(source, destination, chunksize=BULK_CHUNK_ROWS, progress=None):
+    """Score a member CSV chunk by chunk into a CSV file, returns a summary"""
+    summary = {'rows': 0, 'high_risk': {disease: 0 for disease in DISEASES}}
+    with open(destination, 'w', newline='') as out:
+        for scored in iter_scored_chunks(source, chunksize):
+            scored.to_csv(out, header=summary['rows'] == 0, index=False)
+            summary['rows'] += len(scored)
+            for disease in DISEASES:
+                summary['high_risk'][disease] += int(scored[f'{disease}_level'].isin(['High', 'Critical']).sum())
+            if progress:
+                progress(summary['rows'])
+    return summary
+
+
+def score_csv_to_parquet(source, destination, chunksize=BULK_CHUNK_ROWS):
+    """Score a member CSV in chunks and write the results as a Parquet file"""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    writer = None
+    rows = 0
+    try:
+        for scored in iter_scored_chunks(source, chunksize):
+            table = pa.Table.from_pandas(scored, preserve_index=False)
+            if writer is None:
+                writer = pq.ParquetWriter(destination, table.schema)
+            writer.write_table(table.cast(writer.schema))
+            rows += len(scored)
+    finally:
+        if writer is not None:
+            writer.close()
+    return rows
+
+
+if __name__ == '__main__':
+    if len(sys.argv) != 3:
+        print("Usage: python batch_engine.py members.csv scores.arrow|scores.parquet")
+        sys.exit(1)
+    from arrow_store import is_arrow_path, score_csv_to_arrow
+    from quantiles import PopulationSketches, sketch_path
+
+    if is_arrow_path(sys.argv[2]):
+        # Percentile sketches for the single-patient views are kept beside the scores
+        sketches = PopulationSketches()
+        count = score_csv_to_arrow(sys.argv[1], sys.argv[2], sketches=sketches)
+        sketches.save(sketch_path(sys.argv[2]))
+    else:
+        count = score_csv_to_parquet(sys.argv[1], sys.argv[2])
+    print(f"Scored {count:,} members -> {sys.argv[2]}")
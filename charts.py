@@ -0,0 +1,138 @@
+"""
+Chart helpers
+Shared Plotly theme, figure cache, WebGL switching and LTTB downsampling
+"""
+
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import plotly.graph_objects as go
+import plotly.io as pio
+
+from config import CHART_WEBGL_THRESHOLD, CHART_MAX_POINTS, FIGURE_CACHE_SIZE
+
+THEME_NAME = 'mediprecog'
+
+GRID_COLOR = 'rgba(255, 255, 255, 0.1)'
+PANEL_COLOR = 'rgba(30, 41, 59, 0.8)'
+
+# Layout shared by every MediPrecog chart, registered once as a Plotly template
+THEME_LAYOUT = dict(
+    paper_bgcolor='rgba(0,0,0,0)',
+    plot_bgcolor=PANEL_COLOR,
+    font=dict(color='#cbd5e1'),
+    title=dict(font=dict(size=20, color='white'), x=0.5),
+    legend=dict(bgcolor=PANEL_COLOR, bordercolor=GRID_COLOR, borderwidth=1),
+    xaxis=dict(gridcolor=GRID_COLOR, zerolinecolor=GRID_COLOR),
+    yaxis=dict(gridcolor=GRID_COLOR, zerolinecolor=GRID_COLOR),
+    polar=dict(
+        radialaxis=dict(tickfont=dict(color='#cbd5e1'), gridcolor=GRID_COLOR),
+        angularaxis=dict(tickfont=dict(color='#cbd5e1'), gridcolor=GRID_COLOR),
+        bgcolor=PANEL_COLOR
+    )
+)
+
+
+def register_theme():
+    """Register the MediPrecog template (once per process)
+
+    The template is standalone rather than layered on the default one: a
+    small template keeps the per-figure template copy cheap.
+    """
+    if THEME_NAME not in pio.templates:
+        pio.templates[THEME_NAME] = go.layout.Template(layout=THEME_LAYOUT)
+    return THEME_NAME
+
+
+def _json_default(value):
+    """Make NumPy values hashable through json.dumps"""
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, np.generic):
+        return value.item()
+    return str(value)
+
+
+class FigureCache:
+    """Process-wide LRU of built figures keyed by a hash of their input data"""
+
+    def __init__(self, max_entries=FIGURE_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(name, data):
+        """Stable hash of a chart name and its input data"""
+        payload = json.dumps([name, data], sort_keys=True, default=_json_default)
+        return hashlib.sha1(payload.encode('utf-8')).hexdigest()
+
+    def get_or_build(self, name, data, builder):
+        """Return the cached figure for these inputs, building it on a miss
+
+        Cached figures are shared between sessions and must not be mutated.
+        """
+        key = self.key(name, data)
+        with self._lock:
+            figure = self._entries.get(key)
+            if figure is not None:
+                self._entries.move_to_end(key)
+                return figure
+
+        figure = builder()
+        with self._lock:
+            self._entries[key] = figure
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return figure
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+FIGURE_CACHE = FigureCache()
+
+
+def lttb(x, y, n_out):
+    """Largest-Triangle-Three-Buckets downsampling, keeps first and last points"""
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return x, y
+
+    # n_out - 2 interior buckets between the fixed first and last points
+    edges = np.linspace(1, n - 1, n_out - 1).astype(int)
+    keep = np.empty(n_out, dtype=int)
+    keep[0], keep[-1] = 0, n - 1
+
+    anchor = 0
+    for i in range(n_out - 2):
+        start, end = edges[i], edges[i + 1]
+        next_start = edges[i + 1]
+        next_end = edges[i + 2] if i + 2 < len(edges) else n
+        avg_x = x[next_start:next_end].mean()
+        avg_y = y[next_start:next_end].mean()
+
+        # Pick the point forming the largest triangle with the previous pick
+        # and the average of the next bucket
+        area = np.abs(
+            (x[anchor] - avg_x) * (y[start:end] - y[anchor])
+            - (x[anchor] - x[start:end]) * (avg_y - y[anchor])
+        )
+        anchor = start + int(np.argmax(area))
+        keep[i + 1] = anchor
+
+    return x[keep], y[keep]
+
+
+def line_trace(x, y, max_points=CHART_MAX_POINTS, webgl_threshold=CHART_WEBGL_THRESHOLD, **kwargs):
+    """Scatter trace that downsamples long series and renders them with WebGL"""
+    if len(x) > max_points:
+        x, y = lttb(x, y, max_points)
+    trace_type = go.Scattergl if len(x) > webgl_threshold else go.Scatter
+    return trace_type(x=x, y=y, **kwargs)
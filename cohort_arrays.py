@@ -0,0 +1,206 @@
+"""
+Out-of-core cohort scoring
+Scores memory-mapped feature columns window by window into memory-mapped outputs
+"""
+
+import json
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+from batch_engine import BatchRiskCalculator, DISEASES, TIMELINE_YEARS, normalize_columns
+from config import FEATURE_DEFAULTS, BULK_CHUNK_ROWS, OUTOFCORE_WINDOW_ROWS
+
+PROGRESS_FILE = 'progress.json'
+
+# Output column -> (dtype, trailing shape)
+OUTPUT_COLUMNS = {
+    **{f'{disease}_risk': (np.float32, ()) for disease in DISEASES},
+    'health_score': (np.int16, ()),
+    **{f'{disease}_{scenario}': (np.float32, (TIMELINE_YEARS + 1,))
+       for disease in DISEASES for scenario in ['without', 'with']},
+    **{key: (np.float32, ()) for key in ['annual_cost', 'cost_10y_without', 'cost_10y_with']}
+}
+
+
+def column_dtype(feature):
+    """Storage dtype of a feature column (flags are bool, measurements float)"""
+    return np.bool_ if isinstance(FEATURE_DEFAULTS[feature], bool) else np.float64
+
+
+def feature_arrays(frame):
+    """Feature columns of a normalized frame as arrays of their storage dtype"""
+    arrays = {}
+    for feature in FEATURE_DEFAULTS:
+        if feature in frame.columns:
+            values = pd.to_numeric(frame[feature], errors='coerce')
+            if column_dtype(feature) == np.bool_:
+                values = values.fillna(0)
+            arrays[feature] = values.to_numpy(dtype=column_dtype(feature))
+    return arrays
+
+
+def csv_to_arrays(source, directory, chunksize=BULK_CHUNK_ROWS):
+    """Convert a member CSV into one memory-mapped .npy file per feature, returns the row count
+
+    Rows are normalized like the bulk scorer (aliases, flags, units, BMI).
+    Features missing from the CSV get no file and score with their defaults.
+    """
+    rows = sum(len(chunk) for chunk in pd.read_csv(source, usecols=[0], chunksize=chunksize))
+    if hasattr(source, 'seek'):
+        source.seek(0)
+    os.makedirs(directory, exist_ok=True)
+
+    arrays = None
+    start = 0
+    for chunk in pd.read_csv(source, chunksize=chunksize):
+        chunk = normalize_columns(chunk)
+        if arrays is None:
+            arrays = {
+                feature: np.lib.format.open_memmap(
+                    os.path.join(directory, f'{feature}.npy'), mode='w+',
+                    dtype=column_dtype(feature), shape=(rows,)
+                )
+                for feature in FEATURE_DEFAULTS if feature in chunk.columns
+            }
+        stop = start + len(chunk)
+        values = feature_arrays(chunk)
+        for feature, array in arrays.items():
+            array[start:stop] = values[feature]
+        start = stop
+
+    for array in (arrays or {}).values():
+        array.flush()
+    return rows
+
+
+class ColumnSource:
+    """Window reader over memory-mapped feature columns
+
+    `path` is a directory of <feature>.npy files or an Arrow IPC file; only
+    the rows of the requested window are paged in.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        if os.path.isdir(path):
+            self.table = None
+            self.columns = {
+                feature: np.load(os.path.join(path, f'{feature}.npy'), mmap_mode='r')
+                for feature in FEATURE_DEFAULTS
+                if os.path.exists(os.path.join(path, f'{feature}.npy'))
+            }
+            self.rows = len(next(iter(self.columns.values()))) if self.columns else 0
+        else:
+            import pyarrow as pa
+
+            self.table = pa.ipc.open_file(pa.memory_map(path, 'r')).read_all()
+            self.columns = [feature for feature in FEATURE_DEFAULTS if feature in self.table.column_names]
+            self.rows = self.table.num_rows
+
+    def window(self, start, stop):
+        """Feature columns of rows [start, stop) as NumPy arrays"""
+        if self.table is None:
+            return {feature: np.asarray(array[start:stop]) for feature, array in self.columns.items()}
+        frame = self.table.slice(start, stop - start).select(self.columns).to_pandas()
+        return {feature: frame[feature].to_numpy() for feature in self.columns}
+
+
+def score_window(columns, outputs, start, stop):
+    """Score one window of feature columns into output arrays at rows [start, stop)"""
+    columns = dict(columns)
+    if not columns:
+        # as_columns sizes the window from its columns
+        columns['age'] = np.full(stop - start, FEATURE_DEFAULTS['age'])
+
+    risks = BatchRiskCalculator.calculate_risks(columns)
+    for disease in DISEASES:
+        outputs[f'{disease}_risk'][start:stop] = risks[disease]
+    outputs['health_score'][start:stop] = BatchRiskCalculator.calculate_health_score(columns)
+
+    timeline = BatchRiskCalculator.generate_timeline(risks)
+    for disease in DISEASES:
+        outputs[f'{disease}_without'][start:stop] = timeline['without_intervention'][disease]
+        outputs[f'{disease}_with'][start:stop] = timeline['with_intervention'][disease]
+
+    for key, values in BatchRiskCalculator.project_costs(risks).items():
+        outputs[key][start:stop] = values
+
+
+def _read_progress(directory):
+    path = os.path.join(directory, PROGRESS_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path) as handle:
+        return json.load(handle)
+
+
+def _write_progress(directory, progress):
+    # Only this file is replaced atomically; the memmap outputs are written in
+    # place. It is written after a window's outputs are flushed, so a crash
+    # never records a window whose results are not on disk, but rows past
+    # the recorded window may hold partial results until it is rescored
+    path = os.path.join(directory, PROGRESS_FILE)
+    with open(path + '.tmp', 'w') as handle:
+        json.dump(progress, handle)
+    os.replace(path + '.tmp', path)
+
+
+def open_outputs(directory, rows, mode='r'):
+    """Memory-mapped output columns of a scored cohort directory"""
+    return {
+        name: np.lib.format.open_memmap(
+            os.path.join(directory, f'{name}.npy'), mode=mode,
+            dtype=dtype, shape=(rows,) + shape if mode == 'w+' else None
+        )
+        for name, (dtype, shape) in OUTPUT_COLUMNS.items()
+    }
+
+
+def score_arrays(source, destination, window=OUTOFCORE_WINDOW_ROWS, progress=None, resume=True):
+    """Score memory-mapped feature columns window by window, returns the row count
+
+    Outputs are one .npy file per OUTPUT_COLUMNS entry in `destination`.
+    After each window the outputs are flushed and the window recorded in
+    progress.json, so a rerun with resume=True continues after the last
+    completed window. progress(rows_done, rows_total) is called per window.
+    """
+    columns = ColumnSource(source)
+    rows = columns.rows
+    os.makedirs(destination, exist_ok=True)
+
+    state = _read_progress(destination) if resume else None
+    if state and state['rows'] == rows and state['window'] == window:
+        outputs = open_outputs(destination, rows, mode='r+')
+        done = state['done']
+    else:
+        outputs = open_outputs(destination, rows, mode='w+')
+        done = 0
+        _write_progress(destination, {'rows': rows, 'window': window, 'done': 0})
+
+    for start in range(done, rows, window):
+        stop = min(start + window, rows)
+        score_window(columns.window(start, stop), outputs, start, stop)
+        for array in outputs.values():
+            array.flush()
+        _write_progress(destination, {'rows': rows, 'window': window, 'done': stop})
+        if progress:
+            progress(stop, rows)
+
+    return rows
+
+
+if __name__ == '__main__':
+    if len(sys.argv) != 3:
+        print("Usage: python cohort_arrays.py members.csv|features_dir|features.arrow output_dir")
+        sys.exit(1)
+    source = sys.argv[1]
+    if source.endswith('.csv'):
+        features = os.path.splitext(source)[0] + '_features'
+        csv_to_arrays(source, features)
+        source = features
+    count = score_arrays(source, sys.argv[2],
+                         progress=lambda done, total: print(f"\r{done:,}/{total:,} rows", end='', flush=True))
+    print(f"\nScored {count:,} members -> {sys.argv[2]}")
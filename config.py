@@ -37,4 +37,342 @@ DISEASE_PARAMS = {
 }
 
 # Time projections
-TIME_HORIZONS = [1, 3, 5, 10]  # years
\ No newline at end of file
+TIME_HORIZONS = [1, 3, 5, 10]  # years
+
+# Feature defaults used by the rule-based scorers when a value is missing
+FEATURE_DEFAULTS = {
+    'age': 45,
+    'glucose': 95,
+    'bp_systolic': 120,
+    'cholesterol': 180,
+    'bmi': 24,
+    'creatinine': 0.8,
+    'smoking': False,
+    'alcohol': False,
+    'diabetes': False,
+    'hypertension': False,
+    'family_diabetes': False,
+    'family_heart': False
+}
+
+# Rule tables: (feature, cut points, increment added strictly above each cut)
+# Boolean flags use a single cut at 0
+RISK_RULES = {
+    'diabetes': {
+        'base': 0.08,
+        'max': 0.98,
+        'rules': [
+            ('glucose', [100, 126], [0.25, 0.40]),
+            ('bmi', [25, 30], [0.20, 0.30]),
+            ('age', [40, 50], [0.08, 0.15]),
+            ('diabetes', [0], [0.25]),
+            ('family_diabetes', [0], [0.12])
+        ]
+    },
+    'heart_disease': {
+        'base': 0.06,
+        'max': 0.98,
+        'rules': [
+            ('cholesterol', [200, 240], [0.20, 0.35]),
+            ('bp_systolic', [130, 140], [0.18, 0.30]),
+            ('smoking', [0], [0.30]),
+            ('bmi', [30], [0.25]),
+            ('age', [45, 55], [0.10, 0.20]),
+            ('family_heart', [0], [0.15])
+        ]
+    },
+    'hypertension': {
+        'base': 0.12,
+        'max': 0.98,
+        'rules': [
+            ('bp_systolic', [130, 140], [0.25, 0.40]),
+            ('bmi', [30], [0.25]),
+            ('hypertension', [0], [0.30]),
+            ('age', [45], [0.15]),
+            ('smoking', [0], [0.10])
+        ]
+    },
+    'kidney_disease': {
+        'base': 0.04,
+        'max': 0.98,
+        'rules': [
+            ('bp_systolic', [140], [0.25]),
+            ('glucose', [126], [0.20]),
+            ('creatinine', [1.2], [0.30]),
+            ('age', [60], [0.15])
+        ]
+    }
+}
+
+HEALTH_SCORE_RULES = {
+    'base': 100,
+    'min': 0,
+    'max': 100,
+    'rules': [
+        ('bmi', [25, 30], [-15, -25]),
+        ('glucose', [100, 126], [-10, -20]),
+        ('bp_systolic', [130, 140], [-10, -20]),
+        ('cholesterol', [200, 240], [-8, -15]),
+        ('smoking', [0], [-15]),
+        ('alcohol', [0], [-5])
+    ]
+}
+
+# Label bands: (cut points, labels, side) - 'right' moves values equal to a
+# cut into the upper band, 'left' keeps them in the lower band
+RISK_LEVEL_BANDS = ([0.25, 0.5, 0.75], ['Low', 'Medium', 'High', 'Critical'], 'right')
+
+RISK_DESCRIPTION_BANDS = {
+    'diabetes': ([0.25, 0.5, 0.75], ['Normal glucose control', 'Pre-diabetic range',
+                                     'High diabetes risk', 'Probable diabetes'], 'right'),
+    'heart_disease': ([0.25, 0.5, 0.75], ['Healthy cardiovascular profile', 'Moderate heart risk',
+                                          'High heart risk', 'Very high heart risk'], 'right'),
+    'hypertension': ([0.25, 0.5, 0.75], ['Normal blood pressure', 'Borderline hypertension',
+                                         'High hypertension risk', 'Probable hypertension'], 'right'),
+    'default': ([0.25, 0.5, 0.75], ['Normal kidney function', 'Moderate kidney risk',
+                                    'High kidney risk', 'Probable kidney issues'], 'right')
+}
+
+SCORE_FEEDBACK_BANDS = ([40, 60, 80], [
+    'Needs attention. Consult a healthcare provider.',
+    'Moderate health. Consider lifestyle changes.',
+    'Good health. Some areas for improvement.',
+    'Excellent health! Keep up the good habits.'
+], 'right')
+
+ONSET_TIMELINE_BANDS = ([0.3, 0.5, 0.7], ['10+ years', '5-10 years', '3-5 years', '1-3 years'], 'left')
+
+RISK_COLOR_BANDS = ([50, 70], ['#00ff88', '#ffcc00', '#ff3366'], 'right')
+
+# Cost projection parameters (cost page and batch scorer)
+COST_PARAMS = {
+    'base_cost': 50000,
+    'prevention_factor': 0.6,
+    'growth_without': 0.05,
+    'growth_with': 0.03,
+    'years': 10
+}
+
+# Scored cohort written by the batch scorer and read by the population page
+# (Arrow IPC is memory-mapped; Parquet paths are still accepted)
+POPULATION_RESULTS_PATH = 'data/population_scores.arrow'
+
+# Chart rendering: switch to WebGL and downsample above these point counts
+CHART_WEBGL_THRESHOLD = 1000
+CHART_MAX_POINTS = 2000
+
+# Maximum number of built chart figures kept in the process-wide figure cache
+FIGURE_CACHE_SIZE = 256
+
+# Local OCR (Tesseract binary) for image uploads
+TESSERACT_CMD = 'tesseract'
+OCR_TARGET_DPI = 300
+OCR_MAX_SIDE = 3508          # A4 long side at 300 DPI
+OCR_TILE_HEIGHT = 2000       # scans taller than this are OCRed in strips
+OCR_WORKERS = 4
+OCR_TIMEOUT = 60             # seconds per tile
+
+# Uploads larger than this are spooled to a temp file and memory-mapped
+UPLOAD_SPOOL_THRESHOLD = 16 * 1024 * 1024
+UPLOAD_SPOOL_DIR = None      # None = system temp directory
+
+# Bulk CSV scoring: rows per streamed chunk and header aliases -> patient_data keys
+BULK_CHUNK_ROWS = 50000
+CSV_COLUMN_ALIASES = {
+    'member_id': 'patient_id',
+    'mrn': 'patient_id',
+    'patient': 'name',
+    'patient_name': 'name',
+    'fasting_glucose': 'glucose',
+    'blood_sugar': 'glucose',
+    'fbs': 'glucose',
+    'systolic': 'bp_systolic',
+    'systolic_bp': 'bp_systolic',
+    'sbp': 'bp_systolic',
+    'diastolic': 'bp_diastolic',
+    'diastolic_bp': 'bp_diastolic',
+    'dbp': 'bp_diastolic',
+    'bp': 'blood_pressure',
+    'chol': 'cholesterol',
+    'total_cholesterol': 'cholesterol',
+    'body_mass_index': 'bmi',
+    'weight_kg': 'weight',
+    'height_cm': 'height',
+    'smoker': 'smoking',
+    'tobacco': 'smoking',
+    'drinker': 'alcohol',
+    'alcohol_use': 'alcohol',
+    'diabetic': 'diabetes',
+    'dm': 'diabetes',
+    'htn': 'hypertension',
+    'family_history_diabetes': 'family_diabetes',
+    'family_history_heart': 'family_heart',
+    'hemoglobin': 'hb',
+    'haemoglobin': 'hb',
+    'serum_creatinine': 'creatinine'
+}
+
+# Lab table headers -> normalized row field (matched on the lowercased header cell)
+LAB_TABLE_HEADERS = {
+    'analyte': ['test', 'analyte', 'parameter', 'investigation', 'name', 'component'],
+    'value': ['result', 'value', 'observed', 'finding'],
+    'unit': ['unit', 'units'],
+    'reference_range': ['reference', 'range', 'normal', 'interval', 'ref']
+}
+
+# pdfplumber table settings tried when ruled-line detection finds no table
+# (lab reports laid out with whitespace columns only)
+PDF_TABLE_TEXT_SETTINGS = {'vertical_strategy': 'text', 'horizontal_strategy': 'text'}
+
+# Background analysis jobs (SQLite-backed queue + worker processes)
+JOB_DB_PATH = 'data/jobs.sqlite3'
+JOB_SPOOL_DIR = 'data/jobs'
+JOB_WORKERS = None           # None = ADMISSION_LIMITS['extraction']['max_concurrent']
+JOB_POLL_INTERVAL = 1.0      # seconds between UI status checks
+JOB_STALE_AFTER = 900        # seconds before a running job with no live server is requeued at startup
+
+# Admission control for heavy stages (per server process)
+ADMISSION_LIMITS = {
+    'extraction': {'max_concurrent': 2, 'max_queue': 8, 'timeout': 120},
+    'scoring': {'max_concurrent': 2, 'max_queue': 8, 'timeout': 120}
+}
+JOB_MAX_QUEUED = 32          # background jobs waiting for a worker before submits are rejected
+
+# PDF text extraction runs in a killable worker process
+PDF_PAGE_TIMEOUT = 15        # seconds per page before the page is skipped
+PDF_DOC_TIMEOUT = 90         # seconds per document before partial text is returned
+PDF_MEMORY_LIMIT_MB = 1024   # worker RSS ceiling per document
+PDF_FAST_MODE_RATIO = 0.8    # switch to fast text mode at this fraction of the ceiling
+
+# Condition and lifestyle flag vocabulary (matched case-insensitively on word boundaries)
+CONDITION_KEYWORDS = {
+    'diabetes': [
+        'diabetes', 'diabetic', 'diabetes mellitus', 'dm', 'dm1', 'dm2', 't1dm', 't2dm',
+        'niddm', 'iddm', 'type 2 diabetes', 'type ii diabetes', 'type 1 diabetes',
+        'e08', 'e09', 'e10', 'e11', 'e13'
+    ],
+    'hypertension': [
+        'hypertension', 'hypertensive', 'htn', 'high bp', 'high blood pressure',
+        'elevated blood pressure', 'i10', 'i11', 'i12', 'i13', 'i15', 'i16'
+    ],
+    'smoking': [
+        'smoking', 'smoker', 'smokes', 'tobacco', 'cigarette', 'cigarettes', 'cigar',
+        'pack-year', 'pack-years', 'pack years', 'nicotine', 'vaping', 'f17', 'z72.0'
+    ],
+    'alcohol': [
+        'alcohol', 'drinking', 'drinker', 'drinks per week', 'etoh', 'alcoholism',
+        'alcohol use disorder', 'binge drinking', 'f10'
+    ]
+}
+
+# Longer phrases that contain a flag term but must not set the flag
+KEYWORD_EXCLUSIONS = [
+    'pre-diabetes', 'pre-diabetic', 'diabetes insipidus', 'passive smoking',
+    'second-hand smoke', 'secondhand smoke', 'smoking cessation counseling',
+    'alcohol swab', 'alcohol-based', 'white coat hypertension'
+]
+
+# Negation cues: 'pre' cues precede the term ("denies smoking"), 'post' cues
+# follow it ("Smoking: no"); windows are in words, within one sentence
+NEGATION_CUES = {
+    'pre': ['no', 'not', 'non', 'denies', 'denied', 'without', 'negative for', 'free of',
+            'never', 'no history of', 'no hx of', 'no evidence of', 'absence of', 'quit',
+            'former', 'ex'],
+    'post': ['no', 'none', 'denied', 'negative', 'never', 'absent', 'nil']
+}
+NEGATION_WINDOW = {'pre': 5, 'post': 2}
+# Words that end a negation cue's scope ("denies chest pain but has diabetes")
+NEGATION_TERMINATORS = ['but', 'however', 'although', 'though', 'except', 'yet', 'whereas', 'while',
+                        'apart from', 'aside from', 'and has', 'and is', 'and reports', 'and takes']
+
+# Unit normalization: canonical unit and multiplicative factor per accepted unit
+# (keys are lowercase with spaces removed)
+UNIT_CONVERSIONS = {
+    'glucose': ('mg/dL', {'mg/dl': 1.0, 'mmol/l': 18.016}),
+    'cholesterol': ('mg/dL', {'mg/dl': 1.0, 'mmol/l': 38.67}),
+    'creatinine': ('mg/dL', {'mg/dl': 1.0, 'umol/l': 1 / 88.42, 'µmol/l': 1 / 88.42,
+                             'μmol/l': 1 / 88.42}),
+    'hb': ('g/dL', {'g/dl': 1.0, 'g/l': 0.1, 'mmol/l': 1.611}),
+    'weight': ('kg', {'kg': 1.0, 'kgs': 1.0, 'lb': 0.45359237, 'lbs': 0.45359237,
+                      'pound': 0.45359237, 'pounds': 0.45359237}),
+    'height': ('cm', {'cm': 1.0, 'm': 100.0, 'in': 2.54, 'inch': 2.54, 'inches': 2.54}),
+    'bp_systolic': ('mmHg', {'mmhg': 1.0, 'kpa': 7.50062}),
+    'bp_diastolic': ('mmHg', {'mmhg': 1.0, 'kpa': 7.50062})
+}
+
+# Unit assumed for a value without a unit that is implausible in the canonical
+# unit: (bound, 'below'/'above', unit)
+UNIT_INFERENCE = {
+    'glucose': (35, 'below', 'mmol/l'),
+    'cholesterol': (25, 'below', 'mmol/l'),
+    'creatinine': (20, 'above', 'umol/l'),
+    'hb': (30, 'above', 'g/l'),
+    'height': (3, 'below', 'm')
+}
+
+# Monte Carlo timeline bands
+MC_TIMELINE_DRAWS = 10000
+MC_PROGRESSION_SIGMA = 0.25  # log-normal sigma of the yearly progression-rate multiplier
+MC_EFFECTIVENESS_SD = 0.10   # standard deviation of intervention effectiveness
+MC_PERCENTILES = (10, 50, 90)
+MC_SEED = 2024              # fixed seed keeps bands reproducible across reruns
+
+# Monte Carlo cost engine
+MC_COST_SIMULATIONS = 1000
+MC_COST_CHUNK = 2000         # members per shard (fixed, so results do not depend on worker count)
+MC_COST_SIGMA = 0.5          # log-normal sigma of annual treatment cost draws
+MC_DISEASE_COSTS = {         # mean annual treatment cost after onset (₹)
+    'diabetes': 60000,
+    'heart_disease': 150000,
+    'hypertension': 25000,
+    'kidney_disease': 200000
+}
+
+# Intervention catalog for the portfolio optimizer: annual program cost (₹),
+# relative risk reduction per disease, months-to-effect as years of delay and
+# an optional patient flag the intervention requires
+INTERVENTION_CATALOG = {
+    'glucose_monitoring': {'cost': 12000, 'delay': 1, 'effects': {'diabetes': 0.15}},
+    'diet_program': {'cost': 15000, 'delay': 1,
+                     'effects': {'diabetes': 0.15, 'heart_disease': 0.10, 'hypertension': 0.10}},
+    'exercise_program': {'cost': 10000, 'delay': 2,
+                         'effects': {'diabetes': 0.10, 'heart_disease': 0.15, 'hypertension': 0.15}},
+    'smoking_cessation': {'cost': 8000, 'delay': 1, 'requires': 'smoking',
+                          'effects': {'heart_disease': 0.20, 'hypertension': 0.05}},
+    'bp_medication': {'cost': 6000, 'delay': 1,
+                      'effects': {'hypertension': 0.30, 'heart_disease': 0.10, 'kidney_disease': 0.10}},
+    'statin_therapy': {'cost': 7000, 'delay': 1, 'effects': {'heart_disease': 0.25}},
+    'metformin': {'cost': 5000, 'delay': 1, 'effects': {'diabetes': 0.25}},
+    'kidney_screening': {'cost': 4000, 'delay': 2, 'effects': {'kidney_disease': 0.20}}
+}
+MAX_COMBINED_EFFECTIVENESS = 0.9
+OPTIMIZER_CHUNK = 10000      # patients per optimizer shard
+
+# Out-of-core cohort scoring over memory-mapped column files
+OUTOFCORE_WINDOW_ROWS = 100000   # rows scored per window (bounds memory use)
+
+# Multi-core cohort scoring over shared-memory column buffers
+PARALLEL_WORKERS = None          # None = one worker per CPU core
+
+# Population percentile sketches (KLL): larger K is more accurate and larger
+# (rank error is roughly 1.7 / K)
+KLL_K = 200
+
+# "Patients like you" nearest-neighbor index
+NEIGHBOR_INDEX_PATH = 'data/neighbor_index.npz'
+NEIGHBOR_FEATURES = ['age', 'bmi', 'glucose', 'bp_systolic', 'cholesterol', 'smoking', 'alcohol',
+                     'diabetes', 'hypertension', 'family_diabetes', 'family_heart']
+NEIGHBOR_IVF_LISTS = None        # approximate index clusters (None = sqrt of the row count)
+NEIGHBOR_IVF_PROBES = 8          # clusters scanned per approximate query
+
+# Full-text index over every ingested report (None disables indexing)
+REPORT_INDEX_PATH = 'data/reports.sqlite3'
+REPORT_SEARCH_LIMIT = 20
+REPORT_SEARCH_CANDIDATES = 5000   # newest matching pages ranked when the search is limited to recent reports
+
+# Compressed report text store next to the index, <index>_text/ (zstd with a
+# trained dictionary)
+TEXT_STORE_LEVEL = 9
+TEXT_STORE_DICT_SIZE = 64 * 1024
+TEXT_STORE_TRAIN_AFTER = 200            # records stored before the first dictionary is trained
+TEXT_STORE_SEGMENT_BYTES = 256 * 1024 * 1024
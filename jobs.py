@@ -0,0 +1,263 @@
+"""
+Background job queue for heavy report analyses
+SQLite holds job state, a pool of worker processes runs the analysis pipeline
+"""
+
+import json
+import multiprocessing
+import os
+import sqlite3
+import threading
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime, timedelta
+
+from admission import AdmissionRejected
+from config import JOB_DB_PATH, JOB_SPOOL_DIR, JOB_WORKERS, JOB_MAX_QUEUED, JOB_STALE_AFTER, ADMISSION_LIMITS
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    status TEXT NOT NULL,
+    file_name TEXT,
+    file_path TEXT,
+    created TEXT NOT NULL,
+    started TEXT,
+    finished TEXT,
+    result TEXT,
+    error TEXT
+)
+"""
+
+QUEUED, RUNNING, DONE, FAILED = 'queued', 'running', 'done', 'failed'
+
+
+def _now(offset=0):
+    return (datetime.now() + timedelta(seconds=offset)).strftime("%Y-%m-%d %H:%M:%S")
+
+
+def _connect(db_path):
+    """Open the job database (WAL so the UI can poll while workers write)"""
+    connection = sqlite3.connect(db_path, timeout=30, isolation_level=None)
+    connection.execute("PRAGMA journal_mode=WAL")
+    connection.row_factory = sqlite3.Row
+    return connection
+
+
+def run_report_job(db_path, job_id):
+    """Worker entry point: analyze the spooled report and score it"""
+    # Imported here so the parent process does not pay for it at startup
+    from analysis import EnhancedMedicalReportAnalyzer, EnhancedRiskCalculator
+
+    connection = _connect(db_path)
+    try:
+        # Claim and check in one statement: a job dispatched twice (e.g. by
+        # _recover in a second server process) runs only once
+        claimed = connection.execute(
+            "UPDATE jobs SET status = ?, started = ? WHERE id = ? AND status = ?",
+            (RUNNING, _now(), job_id, QUEUED)
+        ).rowcount
+        if not claimed:
+            return
+        row = connection.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+
+        try:
+            analysis = EnhancedMedicalReportAnalyzer.analyze_path(row['file_path'], row['file_name'])
+            risk_scores = EnhancedRiskCalculator.calculate_risks(analysis['parsed_data'])
+            result = {
+                'analysis': analysis,
+                'risk_scores': risk_scores,
+                'timeline_data': EnhancedRiskCalculator.generate_timeline(risk_scores)
+            }
+            connection.execute(
+                "UPDATE jobs SET status = ?, finished = ?, result = ? WHERE id = ?",
+                (DONE, _now(), json.dumps(result, default=str), job_id)
+            )
+        except Exception as e:
+            connection.execute(
+                "UPDATE jobs SET status = ?, finished = ?, error = ? WHERE id = ?",
+                (FAILED, _now(), str(e), job_id)
+            )
+        finally:
+            try:
+                os.remove(row['file_path'])
+            except OSError:
+                pass
+    finally:
+        connection.close()
+
+
+class JobQueue:
+    """Submit report analyses to worker processes and poll their status
+
+    Admission gates are per process, so a worker's own 'extraction' gate
+    never sees the other workers. Concurrency is bounded by the pool size
+    instead, which defaults to the gate's max_concurrent.
+    """
+
+    def __init__(self, db_path=JOB_DB_PATH, spool_dir=JOB_SPOOL_DIR, workers=JOB_WORKERS,
+                 max_queued=JOB_MAX_QUEUED):
+        self.db_path = db_path
+        self.max_queued = max_queued
+        self.spool_dir = spool_dir
+        os.makedirs(os.path.dirname(db_path) or '.', exist_ok=True)
+        os.makedirs(spool_dir, exist_ok=True)
+
+        connection = _connect(db_path)
+        connection.execute(SCHEMA)
+        connection.close()
+
+        self.workers = workers or ADMISSION_LIMITS['extraction']['max_concurrent']
+        # Reentrant: a done-callback may run inline in _dispatch and redispatch
+        self._lock = threading.RLock()
+        self._executor = self._new_executor()
+        self._recover()
+
+    def _new_executor(self):
+        # Spawned (not forked) workers: the Streamlit server is multi-threaded
+        return ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context('spawn')
+        )
+
+    def _recover(self, stale_after=JOB_STALE_AFTER):
+        """Requeue jobs left queued, or running for over stale_after seconds, by a previous server
+
+        Jobs that started more recently may still be running in another
+        live server process and are left alone.
+        """
+        connection = _connect(self.db_path)
+        try:
+            rows = connection.execute(
+                "SELECT id, status, file_path FROM jobs WHERE status = ? OR (status = ? AND started < ?)",
+                (QUEUED, RUNNING, _now(-stale_after))
+            ).fetchall()
+            for row in rows:
+                if row['file_path'] and os.path.exists(row['file_path']):
+                    connection.execute("UPDATE jobs SET status = ? WHERE id = ? AND status = ?",
+                                       (QUEUED, row['id'], row['status']))
+                    self._dispatch(row['id'])
+                else:
+                    connection.execute(
+                        "UPDATE jobs SET status = ?, error = ? WHERE id = ? AND status = ?",
+                        (FAILED, "Upload lost before processing", row['id'], row['status'])
+                    )
+        finally:
+            connection.close()
+
+    def _dispatch(self, job_id):
+        """Hand a queued job to the pool, replacing the pool if a dead worker broke it"""
+        with self._lock:
+            try:
+                future = self._executor.submit(run_report_job, self.db_path, job_id)
+            except BrokenProcessPool:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = self._new_executor()
+                future = self._executor.submit(run_report_job, self.db_path, job_id)
+        future.add_done_callback(lambda done: self._finished(job_id, done))
+        return future
+
+    def _finished(self, job_id, future):
+        """Done-callback: settle a job whose worker process died
+
+        run_report_job records its own outcome, so only an exception from
+        the pool itself lands here. A job that was running is failed (it
+        may be what killed the worker); one still queued is redispatched.
+        """
+        if future.cancelled() or future.exception() is None:
+            return
+        connection = _connect(self.db_path)
+        try:
+            row = connection.execute("SELECT status, file_path FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            if row is None:
+                return
+            if row['status'] == RUNNING:
+                connection.execute(
+                    "UPDATE jobs SET status = ?, finished = ?, error = ? WHERE id = ? AND status = ?",
+                    (FAILED, _now(), f"Analysis worker stopped unexpectedly ({future.exception()!r})",
+                     job_id, RUNNING)
+                )
+                try:
+                    os.remove(row['file_path'])
+                except OSError:
+                    pass
+        finally:
+            connection.close()
+        if row is not None and row['status'] == QUEUED:
+            self._dispatch(job_id)
+
+    def queued_count(self):
+        """Jobs waiting for a worker"""
+        connection = _connect(self.db_path)
+        try:
+            return connection.execute("SELECT COUNT(*) FROM jobs WHERE status = ?", (QUEUED,)).fetchone()[0]
+        finally:
+            connection.close()
+
+    def position(self, job_id):
+        """1-based position of a queued job among the jobs waiting for a worker"""
+        connection = _connect(self.db_path)
+        try:
+            return connection.execute(
+                "SELECT COUNT(*) FROM jobs WHERE status = ? AND rowid <= (SELECT rowid FROM jobs WHERE id = ?)",
+                (QUEUED, job_id)
+            ).fetchone()[0]
+        finally:
+            connection.close()
+
+    def submit(self, upload):
+        """Spool an UploadBuffer to disk and queue its analysis, returns the job id
+
+        Raises AdmissionRejected when max_queued jobs are already waiting.
+        """
+        job_id = uuid.uuid4().hex
+        extension = os.path.splitext(upload.name)[1]
+        path = os.path.join(self.spool_dir, job_id + extension)
+
+        view = upload.view
+        with open(path, 'wb') as out:
+            for start in range(0, len(view), 1024 * 1024):
+                out.write(view[start:start + 1024 * 1024])
+
+        # Count and insert under one write lock, so concurrent submits
+        # cannot all pass the check before any of them is queued
+        connection = _connect(self.db_path)
+        try:
+            connection.execute("BEGIN IMMEDIATE")
+            waiting = connection.execute("SELECT COUNT(*) FROM jobs WHERE status = ?", (QUEUED,)).fetchone()[0]
+            if waiting < self.max_queued:
+                connection.execute(
+                    "INSERT INTO jobs (id, kind, status, file_name, file_path, created) VALUES (?, ?, ?, ?, ?, ?)",
+                    (job_id, 'report', QUEUED, upload.name, path, _now())
+                )
+            connection.execute("COMMIT")
+        finally:
+            connection.close()
+
+        if waiting >= self.max_queued:
+            os.remove(path)
+            raise AdmissionRejected(
+                f"The analysis queue is full ({waiting} reports waiting). Please try again in a few minutes."
+            )
+
+        self._dispatch(job_id)
+        return job_id
+
+    def status(self, job_id):
+        """Job state dict (status, timestamps, error and decoded result)"""
+        connection = _connect(self.db_path)
+        try:
+            row = connection.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        finally:
+            connection.close()
+        if row is None:
+            return None
+
+        job = dict(row)
+        job['result'] = json.loads(job['result']) if job['result'] else None
+        return job
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,197 @@
+"""
+Keyword automaton for condition and lifestyle flags
+One Aho-Corasick pass finds every flag term and negation cue in a report
+"""
+
+import re
+from collections import deque
+
+from config import (
+    CONDITION_KEYWORDS, KEYWORD_EXCLUSIONS, NEGATION_CUES, NEGATION_WINDOW, NEGATION_TERMINATORS
+)
+
+# Characters that end a negation cue's scope (sentence ends and clause commas)
+SCOPE_BREAKS = frozenset('.;,\n!?')
+
+# Words between two terms that carry one negation over to both ("no smoking or alcohol")
+LIST_JOINERS = frozenset(['or', 'nor', '/', 'and/or'])
+
+
+class KeywordAutomaton:
+    """Aho-Corasick automaton over lowercase keywords, each with a payload"""
+
+    def __init__(self, keywords):
+        self._goto = [{}]
+        self._fail = [0]
+        self._out = [[]]
+
+        for keyword, payload in keywords.items():
+            node = 0
+            for char in keyword.lower():
+                nxt = self._goto[node].get(char)
+                if nxt is None:
+                    nxt = len(self._goto)
+                    self._goto[node][char] = nxt
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._out.append([])
+                node = nxt
+            self._out[node].append((len(keyword), payload))
+
+        # Breadth-first failure links; outputs inherit their failure state's outputs
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for char, nxt in self._goto[node].items():
+                queue.append(nxt)
+                fail = self._fail[node]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[nxt] = self._goto[fail].get(char, 0)
+                self._out[nxt] = self._out[nxt] + self._out[self._fail[nxt]]
+
+    def iter_matches(self, text):
+        """Yield (start, end, payload) for every keyword occurrence in one pass"""
+        goto, fail, out = self._goto, self._fail, self._out
+        node = 0
+        # Lowercasing can lengthen a character ('İ' -> 'i̇'), so each lowered
+        # character remembers the index of the original it came from
+        origins = []
+        for index, original in enumerate(text):
+            for char in original.lower():
+                origins.append(index)
+                while node and char not in goto[node]:
+                    node = fail[node]
+                node = goto[node].get(char, 0)
+                for length, payload in out[node]:
+                    yield origins[len(origins) - length], index + 1, payload
+
+
+def _is_word_char(char):
+    return char.isalnum()
+
+
+class FlagMatcher:
+    """Finds flag mentions and decides whether each one is negated"""
+
+    def __init__(self, vocabulary=CONDITION_KEYWORDS, exclusions=KEYWORD_EXCLUSIONS,
+                 negations=NEGATION_CUES, window=NEGATION_WINDOW, terminators=NEGATION_TERMINATORS):
+        keywords = {}
+        for flag, terms in vocabulary.items():
+            for term in terms:
+                keywords[term.lower()] = ('term', flag)
+        for term in exclusions:
+            keywords[term.lower()] = ('exclude', None)
+        # Cue lists may share words ("no"), so a cue payload records both sides
+        cues = {}
+        for side, terms in negations.items():
+            for term in terms:
+                cues.setdefault(term.lower(), set()).add(side)
+        for term, sides in cues.items():
+            keywords.setdefault(term, ('cue', frozenset(sides)))
+
+        self.window = dict(window)
+        self.automaton = KeywordAutomaton(keywords)
+        self.terminator = re.compile(
+            r'(?<!\w)(?:' + '|'.join(re.escape(term) for term in terminators) + r')(?!\w)', re.IGNORECASE
+        ) if terminators else None
+
+    def _matches(self, text):
+        """Whole-word matches, keeping the leftmost-longest of overlapping ones"""
+        found = []
+        for start, end, payload in self.automaton.iter_matches(text):
+            if start > 0 and _is_word_char(text[start - 1]) and _is_word_char(text[start]):
+                continue
+            if end < len(text) and _is_word_char(text[end]) and _is_word_char(text[end - 1]):
+                continue
+            found.append((start, end, payload))
+
+        found.sort(key=lambda match: (match[0], match[0] - match[1]))
+        kept = []
+        last_end = 0
+        for match in found:
+            if match[0] >= last_end:
+                kept.append(match)
+                last_end = match[1]
+        return kept
+
+    def _within(self, text, start, end, limit):
+        """True if a cue's scope reaches across text[start:end]
+
+        The scope ends at sentence ends, commas and conjunctions such as
+        "but" or "however", and spans at most limit words.
+        """
+        gap = text[start:end]
+        if any(char in SCOPE_BREAKS for char in gap):
+            return False
+        if self.terminator is not None and self.terminator.search(gap):
+            return False
+        return len(gap.split()) <= limit
+
+    def _leads(self, text, matches, index, flag):
+        """True if the cue at matches[index] opens the scope of the next term instead
+
+        "diabetes no smoking": a cue that can go either way binds forward.
+        When the next term has the same flag ("Smoking status: never
+        smoker") the cue negates both, so it does not lead away.
+        """
+        start, end, (kind, sides) = matches[index]
+        if 'pre' not in sides or index + 1 == len(matches):
+            return False
+        following = matches[index + 1]
+        return (following[2] != ('term', flag)
+                and following[2][0] == 'term' and self._within(text, end, following[0], self.window['pre']))
+
+    def _joined(self, text, start, end):
+        """True if two terms are only separated by a list joiner ("smoking or alcohol")"""
+        return text[start:end].strip().lower() in LIST_JOINERS
+
+    def find(self, text):
+        """Every flag mention as {flag, term, start, end, negated}
+
+        A cue negates only the first term in its scope; a term that follows
+        a negated one through "or"/"nor" shares its negation.
+        """
+        matches = self._matches(text)
+        mentions = []
+        negated_at = {}
+        for position, (start, end, (kind, flag)) in enumerate(matches):
+            if kind != 'term':
+                continue
+
+            negated = False
+            for index in range(position - 1, -1, -1):
+                other_start, other_end, (other_kind, sides) = matches[index]
+                if other_kind != 'cue':
+                    # The nearest cue already belongs to an earlier term
+                    negated = negated_at.get(index, False) and self._joined(text, other_end, start)
+                    break
+                if 'pre' in sides:
+                    negated = self._within(text, other_end, start, self.window['pre'])
+                    break
+            if not negated:
+                for index in range(position + 1, len(matches)):
+                    other_start, other_end, (other_kind, sides) = matches[index]
+                    if other_kind != 'cue':
+                        break
+                    if 'post' in sides:
+                        negated = (self._within(text, end, other_start, self.window['post'])
+                                   and not self._leads(text, matches, index, flag))
+                        break
+
+            negated_at[position] = negated
+            mentions.append({
+                'flag': flag,
+                'term': text[start:end],
+                'start': start,
+                'end': end,
+                'negated': negated
+            })
+        return mentions
+
+    def flags(self, text):
+        """{flag: True} for every flag with at least one non-negated mention"""
+        return {mention['flag']: True for mention in self.find(text) if not mention['negated']}
+
+
+FLAG_MATCHER = FlagMatcher()
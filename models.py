@@ -10,6 +10,8 @@ from sklearn.ensemble import RandomForestClassifier
 from sklearn.preprocessing import StandardScaler
 import json
 
+from rules import ONSET_TIMELINE_TABLE
+
 class HealthPredictor:
     """Mock ML model for health predictions"""
     
@@ -29,7 +31,7 @@ class HealthPredictor:
         risk_score += max(0, (age - 30) * 0.005)
         
         # BMI factor
-        weight = features.get('weight', 185)
+        weight = features.get('weight', 80)  # kg
         height = features.get('height', 175)
         bmi = weight / ((height/100) ** 2)
         if bmi > 25:
@@ -114,14 +116,7 @@ class HealthPredictor:
     
     def get_timeline(self, risk_score, disease='general'):
         """Get timeline prediction based on risk score"""
-        if risk_score > 0.7:
-            return "1-3 years"
-        elif risk_score > 0.5:
-            return "3-5 years"
-        elif risk_score > 0.3:
-            return "5-10 years"
-        else:
-            return "10+ years"
+        return ONSET_TIMELINE_TABLE.label(risk_score)
     
     def get_key_factors(self, features):
         """Identify key contributing factors"""
@@ -130,7 +125,7 @@ class HealthPredictor:
         if features.get('age', 35) > 40:
             factors.append("Age > 40")
         
-        weight = features.get('weight', 185)
+        weight = features.get('weight', 80)  # kg
         height = features.get('height', 175)
         bmi = weight / ((height/100) ** 2)
         if bmi > 25:
@@ -0,0 +1,191 @@
+"""
+"Patients like you" search
+Nearest neighbors over standardized feature vectors: a KD-tree for exact
+search and an inverted-file (IVF) index for approximate search on large cohorts
+"""
+
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+from batch_engine import BatchRiskCalculator, DISEASES, as_columns, id_strings, normalize_columns
+from config import (
+    BULK_CHUNK_ROWS, NEIGHBOR_FEATURES, NEIGHBOR_IVF_LISTS, NEIGHBOR_IVF_PROBES
+)
+
+OUTCOMES = [f'{disease}_risk' for disease in DISEASES] + ['health_score']
+
+
+def feature_matrix(data):
+    """(n, len(NEIGHBOR_FEATURES)) float32 matrix from a frame, column dict or patient dict"""
+    columns, n = as_columns(data)
+    return np.column_stack([np.asarray(columns[f], dtype=np.float32) for f in NEIGHBOR_FEATURES]).reshape(n, -1)
+
+
+class ExactSearcher:
+    """KD-tree over the standardized vectors (scikit-learn)"""
+
+    def __init__(self, vectors):
+        from sklearn.neighbors import KDTree
+
+        self.tree = KDTree(vectors, leaf_size=40)
+
+    def search(self, queries, k):
+        return self.tree.query(queries, k=min(k, self.tree.data.shape[0]))
+
+
+class IVFSearcher:
+    """Inverted-file index: k-means cells, only the nearest `probes` cells are scanned"""
+
+    def __init__(self, vectors, lists=NEIGHBOR_IVF_LISTS, probes=NEIGHBOR_IVF_PROBES,
+                 centroids=None, seed=0):
+        self.vectors = vectors
+        self.probes = probes
+        lists = lists or max(int(np.sqrt(len(vectors))), 1)
+        self.centroids = centroids if centroids is not None else self._train(vectors, lists, seed)
+
+        cells = self._nearest_centroid(vectors)
+        self.order = np.argsort(cells, kind='stable')
+        self.offsets = np.searchsorted(cells[self.order], np.arange(len(self.centroids) + 1))
+
+    def _nearest_centroid(self, vectors, chunk=65536):
+        cells = np.empty(len(vectors), dtype=np.int32)
+        squared = (self.centroids ** 2).sum(axis=1)
+        for start in range(0, len(vectors), chunk):
+            block = vectors[start:start + chunk]
+            cells[start:start + chunk] = np.argmin(squared - 2 * block @ self.centroids.T, axis=1)
+        return cells
+
+    def _train(self, vectors, lists, seed, iterations=10):
+        """Lloyd's k-means on a sample of the vectors"""
+        rng = np.random.default_rng(seed)
+        lists = min(lists, len(vectors))
+        sample = vectors[rng.choice(len(vectors), min(len(vectors), lists * 64), replace=False)]
+        self.centroids = sample[rng.choice(len(sample), lists, replace=False)].copy()
+        for _ in range(iterations):
+            cells = self._nearest_centroid(sample)
+            counts = np.bincount(cells, minlength=lists)
+            sums = np.zeros_like(self.centroids)
+            np.add.at(sums, cells, sample)
+            filled = counts > 0
+            self.centroids[filled] = sums[filled] / counts[filled, None]
+        return self.centroids
+
+    def search(self, queries, k):
+        distances = np.empty((len(queries), k))
+        indices = np.empty((len(queries), k), dtype=np.intp)
+        squared = (self.centroids ** 2).sum(axis=1)
+        for row, query in enumerate(queries):
+            cells = np.argsort(squared - 2 * self.centroids @ query)[:self.probes]
+            candidates = np.concatenate([self.order[self.offsets[c]:self.offsets[c + 1]] for c in cells])
+            gaps = np.sqrt(((self.vectors[candidates] - query) ** 2).sum(axis=1))
+            top = min(k, len(candidates))
+            best = np.argpartition(gaps, top - 1)[:top] if top < len(candidates) else np.arange(top)
+            best = best[np.argsort(gaps[best])]
+            distances[row, :top], indices[row, :top] = gaps[best], candidates[best]
+            distances[row, top:], indices[row, top:] = np.inf, -1
+        return distances, indices
+
+
+class NeighborIndex:
+    """Members' feature vectors, identifiers and risk outcomes with a search structure
+
+    Features are standardized with the cohort mean and standard deviation so
+    every feature (and flag) weighs the same in the Euclidean distance.
+    """
+
+    def __init__(self, features, ids, outcomes, approximate=False, centroids=None):
+        features = np.asarray(features, dtype=np.float32)
+        self.features = features
+        self.ids = np.asarray(ids)
+        self.outcomes = outcomes
+        self.mean = features.mean(axis=0) if len(features) else np.zeros(features.shape[1], np.float32)
+        scale = features.std(axis=0) if len(features) else np.ones(features.shape[1], np.float32)
+        self.scale = np.where(scale > 0, scale, 1).astype(np.float32)
+        self.approximate = approximate
+
+        vectors = self.standardize(features)
+        self.searcher = IVFSearcher(vectors, centroids=centroids) if approximate else ExactSearcher(vectors)
+
+    def standardize(self, features):
+        return ((features - self.mean) / self.scale).astype(np.float32)
+
+    def __len__(self):
+        return len(self.ids)
+
+    @staticmethod
+    def _member_arrays(frame):
+        """Features, identifiers and scored outcomes of a normalized member frame"""
+        risks = BatchRiskCalculator.calculate_risks(frame)
+        outcomes = {f'{d}_risk': risks[d].astype(np.float32) for d in DISEASES}
+        outcomes['health_score'] = BatchRiskCalculator.calculate_health_score(frame).astype(np.int16)
+        if 'patient_id' in frame.columns:
+            # Saved with np.savez (no object arrays), so a missing ID is ''
+            ids = id_strings(frame['patient_id']).fillna('').to_numpy(dtype=str)
+        else:
+            ids = np.arange(len(frame)).astype(str)
+        return feature_matrix(frame), ids, outcomes
+
+    @classmethod
+    def from_frame(cls, frame, approximate=False):
+        """Index a normalized member DataFrame, scoring its risk outcomes"""
+        return cls(*cls._member_arrays(frame), approximate=approximate)
+
+    @classmethod
+    def from_csv(cls, source, approximate=False, chunksize=BULK_CHUNK_ROWS):
+        """Index a member CSV, normalized and scored chunk by chunk like the bulk scorer"""
+        parts = [cls._member_arrays(normalize_columns(chunk))
+                 for chunk in pd.read_csv(source, chunksize=chunksize)]
+        features = np.concatenate([part[0] for part in parts])
+        ids = np.concatenate([part[1] for part in parts])
+        outcomes = {name: np.concatenate([part[2][name] for part in parts]) for name in OUTCOMES}
+        return cls(features, ids, outcomes, approximate)
+
+    def query(self, patient, k=5):
+        """Top-k most similar members to a patient dict, nearest first
+
+        Returns a DataFrame with patient_id, distance, the member's features
+        and their risk outcomes.
+        """
+        query = self.standardize(feature_matrix(patient))
+        distances, indices = self.searcher.search(query, k)
+        found = indices[0] >= 0
+        rows = indices[0][found]
+        members = self.features[rows]
+        return pd.DataFrame({
+            'patient_id': pd.Series(self.ids[rows], dtype='string').replace('', pd.NA),
+            'distance': distances[0][found],
+            **{feature: members[:, position] for position, feature in enumerate(NEIGHBOR_FEATURES)},
+            **{name: values[rows] for name, values in self.outcomes.items()}
+        })
+
+    def save(self, path):
+        arrays = {'features': self.features, 'ids': self.ids,
+                  **{f'outcome.{name}': values for name, values in self.outcomes.items()}}
+        if self.approximate:
+            arrays['centroids'] = self.searcher.centroids
+        with open(path + '.tmp', 'wb') as handle:
+            np.savez(handle, **arrays)
+        os.replace(path + '.tmp', path)
+
+    @classmethod
+    def load(cls, path):
+        """Index saved with save() (the search structure is rebuilt), or None"""
+        if not os.path.exists(path):
+            return None
+        with np.load(path) as arrays:
+            outcomes = {key.split('.', 1)[1]: arrays[key] for key in arrays.files if key.startswith('outcome.')}
+            centroids = arrays['centroids'] if 'centroids' in arrays.files else None
+            return cls(arrays['features'], arrays['ids'], outcomes,
+                       approximate=centroids is not None, centroids=centroids)
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 3:
+        print("Usage: python neighbors.py members.csv index.npz [--approximate]")
+        sys.exit(1)
+    index = NeighborIndex.from_csv(sys.argv[1], approximate='--approximate' in sys.argv)
+    index.save(sys.argv[2])
+    print(f"Indexed {len(index):,} members -> {sys.argv[2]}")
@@ -0,0 +1,136 @@
+"""
+Local OCR for scanned reports and phone photos
+Bounded-memory Pillow preprocessing feeding a local Tesseract binary
+"""
+
+import shutil
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+import numpy as np
+from PIL import Image
+
+from config import (
+    TESSERACT_CMD, OCR_TARGET_DPI, OCR_MAX_SIDE, OCR_TILE_HEIGHT, OCR_WORKERS, OCR_TIMEOUT
+)
+
+# EXIF orientation -> transpose needed to display the photo upright
+EXIF_TRANSPOSE = {
+    2: [Image.Transpose.FLIP_LEFT_RIGHT],
+    3: [Image.Transpose.ROTATE_180],
+    4: [Image.Transpose.FLIP_TOP_BOTTOM],
+    5: [Image.Transpose.TRANSPOSE],
+    6: [Image.Transpose.ROTATE_270],
+    7: [Image.Transpose.TRANSVERSE],
+    8: [Image.Transpose.ROTATE_90]
+}
+
+
+class OCRUnavailable(RuntimeError):
+    """Raised when the Tesseract binary cannot be found"""
+
+
+def tesseract_available():
+    """Check whether the local Tesseract binary is on the PATH"""
+    return shutil.which(TESSERACT_CMD) is not None
+
+
+def _target_size(image, target_dpi, max_side):
+    """Output size for OCR: no finer than target_dpi and no longer than max_side"""
+    scale = 1.0
+    dpi = image.info.get('dpi')
+    if dpi and dpi[0] and dpi[0] > target_dpi:
+        scale = target_dpi / float(dpi[0])
+    scale = min(scale, max_side / float(max(image.size)))
+    return max(1, int(image.width * scale)), max(1, int(image.height * scale))
+
+
+def _otsu_threshold(histogram):
+    """Otsu's threshold from a 256-bin grayscale histogram"""
+    hist = np.asarray(histogram[:256], dtype=np.float64)
+    levels = np.arange(256)
+    weight_bg = np.cumsum(hist)
+    weight_fg = weight_bg[-1] - weight_bg
+    mean_bg = np.cumsum(hist * levels)
+    mean_total = mean_bg[-1]
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        between = (mean_total * weight_bg - mean_bg * weight_bg[-1]) ** 2 / (weight_bg * weight_fg)
+    return int(np.nanargmax(between)) if np.isfinite(between).any() else 128
+
+
+def preprocess_image(source, target_dpi=OCR_TARGET_DPI, max_side=OCR_MAX_SIDE):
+    """Decode, downscale, grayscale and binarize an image for OCR
+
+    JPEG photos are decoded directly at reduced scale (draft mode), so the
+    full-resolution pixels of a 12-50 MP photo are never materialized. Other
+    formats are reduced right after decoding and the full decode released.
+    """
+    with Image.open(source) as image:
+        orientation = image.getexif().get(0x0112)
+        target = _target_size(image, target_dpi, max_side)
+
+        # JPEG only: let the decoder skip resolution we will throw away
+        image.draft('L', target)
+
+        factor = min(image.width // target[0], image.height // target[1])
+        reduced = image.reduce(factor) if factor >= 2 else image.copy()
+
+    gray = reduced.convert('L')
+    reduced.close()
+    del reduced
+
+    if gray.size != target and gray.width > target[0]:
+        gray = gray.resize(target, Image.Resampling.LANCZOS)
+
+    for transpose in EXIF_TRANSPOSE.get(orientation, []):
+        gray = gray.transpose(transpose)
+
+    threshold = _otsu_threshold(gray.histogram())
+    return gray.point([255 if value > threshold else 0 for value in range(256)])
+
+
+def split_tiles(image, tile_height=OCR_TILE_HEIGHT, search=200):
+    """Cut a tall page into horizontal strips at the blankest rows near each cut"""
+    if image.height <= tile_height * 1.5:
+        return [image]
+
+    ink = (np.asarray(image) == 0).sum(axis=1)
+    cuts = [0]
+    while image.height - cuts[-1] > tile_height * 1.5:
+        target = cuts[-1] + tile_height
+        low = max(cuts[-1] + 1, target - search)
+        cuts.append(low + int(np.argmin(ink[low:target + search])))
+    cuts.append(image.height)
+
+    return [image.crop((0, top, image.width, bottom)) for top, bottom in zip(cuts, cuts[1:])]
+
+
+def _run_tesseract(tile, dpi):
+    """OCR one tile with the Tesseract binary (stdin -> stdout)"""
+    buffer = BytesIO()
+    tile.save(buffer, format='PNG')
+    result = subprocess.run(
+        [TESSERACT_CMD, 'stdin', 'stdout', '--dpi', str(dpi)],
+        input=buffer.getvalue(),
+        capture_output=True,
+        timeout=OCR_TIMEOUT,
+        check=True
+    )
+    return result.stdout.decode('utf-8', errors='replace')
+
+
+def image_to_text(source, target_dpi=OCR_TARGET_DPI, workers=OCR_WORKERS):
+    """Extract text from an image path or file object"""
+    if not tesseract_available():
+        raise OCRUnavailable(f"Tesseract binary '{TESSERACT_CMD}' not found")
+
+    page = preprocess_image(source, target_dpi=target_dpi)
+    tiles = split_tiles(page)
+
+    # Tesseract runs as a subprocess, so threads are enough to use all cores
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, len(tiles)))) as pool:
+        texts = list(pool.map(lambda tile: _run_tesseract(tile, target_dpi), tiles))
+
+    return '\n'.join(text.strip('\n') for text in texts)
@@ -0,0 +1,165 @@
+"""
+Intervention portfolio optimizer
+Picks the best affordable combination of catalog interventions per patient
+"""
+
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+
+import numpy as np
+
+from batch_engine import DISEASES, TIMELINE_YEARS, AGING_RATE, PROGRESSION_RATE
+from config import (
+    INTERVENTION_CATALOG, MAX_COMBINED_EFFECTIVENESS, OPTIMIZER_CHUNK, MC_DISEASE_COSTS, COST_PARAMS
+)
+
+NAMES = list(INTERVENTION_CATALOG)
+COMBINATIONS = np.arange(2 ** len(NAMES))
+# membership[c, i]: combination c includes intervention i
+MEMBERSHIP = (COMBINATIONS[:, None] >> np.arange(len(NAMES))) & 1 == 1
+PROGRAM_COSTS = MEMBERSHIP @ np.array([INTERVENTION_CATALOG[name]['cost'] for name in NAMES], dtype=float)
+
+STEPS = np.arange(1, TIMELINE_YEARS + 1)
+GROWTH = np.cumprod((1 + STEPS * AGING_RATE) * (1 + PROGRESSION_RATE * STEPS))
+COST_GROWTH = (1 + COST_PARAMS['growth_without']) ** np.arange(TIMELINE_YEARS)
+
+OBJECTIVES = ['risk_reduction', 'cost_savings']
+
+
+def _disease_plan(disease, combination):
+    """(effectiveness, delay) a combination gives one disease, or None if untreated"""
+    remaining = 1.0
+    delay = None
+    for index, name in enumerate(NAMES):
+        effect = INTERVENTION_CATALOG[name]['effects'].get(disease)
+        if effect and combination >> index & 1:
+            remaining *= 1 - effect
+            item_delay = INTERVENTION_CATALOG[name]['delay']
+            delay = item_delay if delay is None else min(delay, item_delay)
+    if delay is None:
+        return None
+    return round(min(1 - remaining, MAX_COMBINED_EFFECTIVENESS), 6), delay
+
+
+@lru_cache(maxsize=None)
+def improvement_curve(effectiveness, delay):
+    """Cumulative with-intervention multipliers for an (effectiveness, delay) pair"""
+    improvement = np.where(
+        STEPS <= delay,
+        1.02,
+        1 - effectiveness * (1 - np.exp(-0.3 * (STEPS - delay)))
+    )
+    return np.cumprod(improvement), STEPS > delay
+
+
+@lru_cache(maxsize=None)
+def disease_options(disease):
+    """Distinct plans for a disease and, per combination, the index of its plan
+
+    Most combinations leave a given disease with the same (effectiveness,
+    delay) as many others, so each distinct plan is evaluated only once.
+    """
+    plans = [None]
+    index = np.zeros(len(COMBINATIONS), dtype=np.intp)
+    for combination in COMBINATIONS:
+        plan = _disease_plan(disease, int(combination))
+        if plan not in plans:
+            plans.append(plan)
+        index[combination] = plans.index(plan)
+    return plans, index
+
+
+def _paths(risk, plan):
+    """(rows, years) risk paths for an untreated (None) or treated disease"""
+    risk = risk[:, None]
+    if plan is None:
+        return np.minimum(0.95, risk * GROWTH)
+    curve, floored = improvement_curve(*plan)
+    path = risk * curve
+    return np.where(floored, np.maximum(0.05, path), path)
+
+
+def _plan_value(disease, risk, plan, baseline, objective):
+    """Per-row value of a disease plan relative to no intervention"""
+    paths = _paths(risk, plan)
+    if objective == 'risk_reduction':
+        # Mean yearly absolute risk reduction over the horizon
+        return (baseline - paths).mean(axis=1)
+    # Expected treatment cost = mean cost x sum of cumulative onset probability x inflation
+    mean_cost = MC_DISEASE_COSTS.get(disease, COST_PARAMS['base_cost'])
+    expected = lambda p: mean_cost * (np.maximum.accumulate(p, axis=1) * COST_GROWTH).sum(axis=1)
+    return expected(baseline) - expected(paths)
+
+
+def _optimize_shard(risks, eligibility, budget, objective):
+    """Best combination per row of one shard, returns (plan, value, program_cost)"""
+    rows = len(next(iter(risks.values())))
+    scores = np.zeros((rows, len(COMBINATIONS)))
+
+    for disease, risk in risks.items():
+        risk = np.asarray(risk, dtype=float)
+        plans, index = disease_options(disease)
+        baseline = _paths(risk, None)
+        values = np.column_stack([_plan_value(disease, risk, plan, baseline, objective) for plan in plans])
+        scores += values[:, index]
+
+    program_costs = np.broadcast_to(PROGRAM_COSTS, scores.shape)
+    if objective == 'cost_savings':
+        scores -= PROGRAM_COSTS * TIMELINE_YEARS
+
+    allowed = np.broadcast_to(PROGRAM_COSTS <= budget, scores.shape).copy()
+    for item, name in enumerate(NAMES):
+        flag = INTERVENTION_CATALOG[name].get('requires')
+        if flag:
+            # No flag given means no one is known to qualify
+            eligible = np.asarray(eligibility.get(flag, np.zeros(rows)), dtype=bool)
+            allowed &= ~(MEMBERSHIP[:, item][None, :] & ~eligible[:, None])
+
+    scores = np.where(allowed, scores, -np.inf)
+    best = scores.argmax(axis=1)
+    return best, scores[np.arange(rows), best], program_costs[np.arange(rows), best]
+
+
+def optimize_portfolio(risks, budget, objective='risk_reduction', eligibility=None, workers=None,
+                       chunk=OPTIMIZER_CHUNK):
+    """Best affordable intervention combination for every patient (or segment)
+
+    risks maps disease -> risk array (rows may be patients or cohort segment
+    representatives); budget is the annual program spend allowed per row;
+    objective is 'risk_reduction' (mean yearly absolute risk reduction summed
+    over diseases) or 'cost_savings' (expected 10-year treatment savings net
+    of program costs). eligibility maps patient flags (e.g. 'smoking') to
+    boolean arrays for interventions that require them; interventions whose
+    flag is missing are never chosen.
+
+    Returns {'plan': combination bitmasks, 'value', 'program_cost'}; use
+    plan_names to decode a bitmask.
+    """
+    if objective not in OBJECTIVES:
+        raise ValueError(f"Unknown objective '{objective}', expected one of {OBJECTIVES}")
+    risks = {d: np.atleast_1d(np.asarray(r, dtype=float)) for d, r in risks.items() if d in DISEASES}
+    eligibility = {flag: np.atleast_1d(values) for flag, values in (eligibility or {}).items()}
+    rows = len(next(iter(risks.values())))
+
+    shards = [
+        ({d: r[start:start + chunk] for d, r in risks.items()},
+         {f: v[start:start + chunk] for f, v in eligibility.items()})
+        for start in range(0, rows, chunk)
+    ]
+
+    if workers and workers > 1 and len(shards) > 1:
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn')) as pool:
+            results = list(pool.map(_optimize_shard, *zip(*shards),
+                                    [budget] * len(shards), [objective] * len(shards)))
+    else:
+        results = [_optimize_shard(shard_risks, shard_flags, budget, objective)
+                   for shard_risks, shard_flags in shards]
+
+    plan, value, cost = (np.concatenate(parts) for parts in zip(*results))
+    return {'plan': plan, 'value': value, 'program_cost': cost}
+
+
+def plan_names(plan):
+    """Intervention names in a combination bitmask"""
+    return [name for index, name in enumerate(NAMES) if int(plan) >> index & 1]
@@ -0,0 +1,149 @@
+"""
+Multi-core cohort scoring
+Worker processes score row slices of shared-memory feature columns into shared output columns
+"""
+
+import multiprocessing
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+import pandas as pd
+
+from batch_engine import normalize_columns
+from cohort_arrays import ColumnSource, OUTPUT_COLUMNS, column_dtype, feature_arrays, score_window, open_outputs
+from config import FEATURE_DEFAULTS, OUTOFCORE_WINDOW_ROWS, PARALLEL_WORKERS
+
+
+def _allocate(name, dtype, shape):
+    """Shared memory block plus its (name, dtype, shape) spec for workers"""
+    size = max(int(np.prod(shape)) * np.dtype(dtype).itemsize, 1)
+    block = shared_memory.SharedMemory(create=True, size=size)
+    return block, (block.name, np.dtype(dtype).str, shape)
+
+
+def _attach(spec):
+    """Attach to a block created by the parent, returns (block, array view)"""
+    name, dtype, shape = spec
+    # Spawned workers share the parent's resource tracker, which the parent
+    # clears when it unlinks the block
+    block = shared_memory.SharedMemory(name=name)
+    return block, np.ndarray(shape, dtype=dtype, buffer=block.buf)
+
+
+def _score_slice(inputs, outputs, start, stop, window):
+    """Worker: score rows [start, stop) of the shared inputs into the shared outputs"""
+    blocks = []
+    try:
+        columns = {}
+        for feature, spec in inputs.items():
+            block, columns[feature] = _attach(spec)
+            blocks.append(block)
+        results = {}
+        for key, spec in outputs.items():
+            block, results[key] = _attach(spec)
+            blocks.append(block)
+
+        for begin in range(start, stop, window):
+            end = min(begin + window, stop)
+            score_window({feature: array[begin:end] for feature, array in columns.items()},
+                         results, begin, end)
+        return stop - start
+    finally:
+        columns = results = None
+        for block in blocks:
+            block.close()
+
+
+def _load_columns(source):
+    """Feature columns of a ColumnSource path, DataFrame or dict of arrays, with row count
+
+    In-memory sources are normalized like csv_to_arrays (header aliases,
+    flags, units, BMI). Features missing from them score with their
+    defaults, but a source with rows and no recognizable feature at all is
+    refused rather than scored entirely on defaults.
+    """
+    if isinstance(source, (str, os.PathLike)):
+        source = ColumnSource(source)
+        return source, source.rows
+
+    frame = normalize_columns(pd.DataFrame(source))
+    columns = feature_arrays(frame)
+    if len(frame) and not columns:
+        raise ValueError(f"No feature columns in {list(frame.columns)[:10]}; "
+                         f"expected any of {', '.join(FEATURE_DEFAULTS)}")
+    return columns, len(frame)
+
+
+def score_parallel(source, workers=PARALLEL_WORKERS, destination=None, window=OUTOFCORE_WINDOW_ROWS):
+    """Score a cohort across worker processes through shared memory
+
+    `source` is a feature directory or Arrow file (as for score_arrays), a
+    DataFrame or a dict of columns. Features are copied once into shared
+    memory blocks and every worker scores a contiguous slice of rows straight
+    into shared output blocks, so only block names cross process boundaries.
+
+    Returns {output column: array}; with `destination` the outputs are also
+    written as .npy files in the score_arrays layout.
+    """
+    workers = workers or os.cpu_count() or 1
+    source, rows = _load_columns(source)
+    features = [feature for feature in FEATURE_DEFAULTS if feature in getattr(source, 'columns', source)]
+
+    blocks = []
+    try:
+        inputs = {}
+        for feature in features:
+            block, inputs[feature] = _allocate(feature, column_dtype(feature), (rows,))
+            blocks.append(block)
+            array = np.ndarray((rows,), dtype=column_dtype(feature), buffer=block.buf)
+            for start in range(0, rows, window):
+                stop = min(start + window, rows)
+                chunk = source.window(start, stop)[feature] if hasattr(source, 'window') else source[feature][start:stop]
+                array[start:stop] = chunk
+            del array
+
+        outputs = {}
+        for key, (dtype, shape) in OUTPUT_COLUMNS.items():
+            block, outputs[key] = _allocate(key, dtype, (rows,) + shape)
+            blocks.append(block)
+
+        step = -(-rows // workers) if rows else 0
+        slices = [(start, min(start + step, rows)) for start in range(0, rows, step or 1)]
+        if workers > 1 and len(slices) > 1:
+            with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn')) as pool:
+                futures = [pool.submit(_score_slice, inputs, outputs, start, stop, window)
+                           for start, stop in slices]
+                for future in futures:
+                    future.result()
+        else:
+            for start, stop in slices:
+                _score_slice(inputs, outputs, start, stop, window)
+
+        results = {}
+        for key, (name, dtype, shape) in outputs.items():
+            block = next(block for block in blocks if block.name == name)
+            results[key] = np.ndarray(shape, dtype=dtype, buffer=block.buf).copy()
+    finally:
+        for block in blocks:
+            block.close()
+            block.unlink()
+
+    if destination is not None:
+        os.makedirs(destination, exist_ok=True)
+        written = open_outputs(destination, rows, mode='w+')
+        for key, array in written.items():
+            array[:] = results[key]
+            array.flush()
+    return results
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 3:
+        print("Usage: python parallel_scoring.py features_dir|features.arrow output_dir [workers]")
+        sys.exit(1)
+    scored = score_parallel(sys.argv[1], workers=int(sys.argv[3]) if len(sys.argv) > 3 else None,
+                            destination=sys.argv[2])
+    print(f"Scored {len(scored['health_score']):,} members -> {sys.argv[2]}")
@@ -0,0 +1,302 @@
+"""
+Deadline-bounded PDF text extraction
+pdfplumber runs in a worker process that is killed when a page or the document overruns
+"""
+
+import gc
+import multiprocessing
+import os
+import re
+import resource
+import time
+
+from config import (
+    PDF_PAGE_TIMEOUT, PDF_DOC_TIMEOUT, PDF_MEMORY_LIMIT_MB, PDF_FAST_MODE_RATIO, LAB_TABLE_HEADERS,
+    PDF_TABLE_TEXT_SETTINGS
+)
+
+POLL_INTERVAL = 0.25         # seconds between cancellation checks
+
+# Lab table cells: "108", "108 H", "<0.5", "5.9 %", "70-100", "< 200"
+VALUE_PATTERN = re.compile(r'^\s*[<>]?\s*(\d+(?:\.\d+)?)\s*([A-Za-z%\u00b5/][A-Za-z0-9%\u00b5/.^]*)?')
+RANGE_PATTERN = re.compile(r'^\s*(?:[<>]=?\s*\d+(?:\.\d+)?|\d+(?:\.\d+)?\s*[-\u2013]\s*\d+(?:\.\d+)?)\s*$')
+UNIT_PATTERN = re.compile(r'^\s*[A-Za-z%\u00b5][A-Za-z0-9%\u00b5/.^]*\s*$')
+
+
+def _rss_bytes():
+    """Current resident set size of this process (peak RSS where /proc is missing)"""
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        # ru_maxrss is in kilobytes on Linux
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def _release(page):
+    """Drop a page's cached layout objects once its text has been taken"""
+    close = getattr(page, 'close', None) or page.flush_cache
+    close()
+
+
+def _header_columns(row):
+    """Map normalized field -> column index if the row looks like a lab table header"""
+    columns = {}
+    for index, cell in enumerate(row):
+        label = (cell or '').strip().lower()
+        for field, words in LAB_TABLE_HEADERS.items():
+            if field not in columns and any(word in label for word in words):
+                columns[field] = index
+                break
+    return columns if {'analyte', 'value'} <= set(columns) else None
+
+
+def _infer_columns(row):
+    """Guess columns for a headerless row: first text cell, first number, unit, range"""
+    columns = {}
+    for index, cell in enumerate(row):
+        cell = (cell or '').strip()
+        if not cell:
+            continue
+        if 'reference_range' not in columns and 'value' in columns and RANGE_PATTERN.match(cell):
+            columns['reference_range'] = index
+        elif 'value' not in columns and 'analyte' in columns and VALUE_PATTERN.match(cell):
+            columns['value'] = index
+        elif 'unit' not in columns and 'value' in columns and UNIT_PATTERN.match(cell):
+            columns['unit'] = index
+        elif 'analyte' not in columns and not VALUE_PATTERN.match(cell):
+            columns['analyte'] = index
+    return columns if {'analyte', 'value'} <= set(columns) else None
+
+
+def lab_rows(table):
+    """Normalize an extracted table (list of rows of cells) into lab result rows
+
+    Returns [{analyte, value, unit, reference_range}], skipping rows without a
+    numeric result. Header rows set the column layout for the rows below them.
+    """
+    rows = []
+    header = None
+    for row in table:
+        if not row or not any(row):
+            continue
+        columns = _header_columns(row)
+        if columns:
+            header = columns
+            continue
+        columns = header or _infer_columns(row)
+        if not columns:
+            continue
+
+        def cell(field):
+            index = columns.get(field)
+            return (row[index] or '').strip() if index is not None and index < len(row) else ''
+
+        analyte = ' '.join(cell('analyte').split())
+        match = VALUE_PATTERN.match(cell('value'))
+        if not analyte or not match:
+            continue
+        value = float(match.group(1))
+        rows.append({
+            'analyte': analyte,
+            'value': int(value) if value.is_integer() else value,
+            'unit': cell('unit') or match.group(2) or '',
+            'reference_range': re.sub(r'\s+', '', cell('reference_range'))
+        })
+    return rows
+
+
+def _extract_worker(path, start, connection, fast=False, memory_limit=None, tables=False):
+    """Worker process: stream (page, text, lab rows) messages from page `start` onwards
+
+    With tables=True, pdfplumber's table finder runs on the same Page object as
+    the text extraction, so the page layout is analyzed once and shared. Pages
+    without ruled tables are retried with PDF_TABLE_TEXT_SETTINGS.
+    Every page's layout cache is released right after extraction. Once RSS
+    reaches PDF_FAST_MODE_RATIO of memory_limit the worker switches to
+    extract_text_simple, which skips word clustering and layout reconstruction,
+    and past memory_limit in fast mode it stops with the pages read so far.
+    """
+    import pdfplumber
+
+    memory_limit = memory_limit or PDF_MEMORY_LIMIT_MB * 1024 * 1024
+    fast_threshold = memory_limit * PDF_FAST_MODE_RATIO
+
+    try:
+        with pdfplumber.open(path) as pdf:
+            connection.send(('pages', len(pdf.pages)))
+            for number in range(start, len(pdf.pages)):
+                connection.send(('page', number))
+                page = pdf.pages[number]
+                rows = []
+                try:
+                    text = (page.extract_text_simple() if fast else page.extract_text()) or ''
+                    if tables and not fast:
+                        # Ruled tables first; whitespace-aligned columns otherwise
+                        found = page.find_tables() or page.find_tables(PDF_TABLE_TEXT_SETTINGS)
+                        for table in found:
+                            rows.extend(lab_rows(table.extract()))
+                except Exception as e:
+                    connection.send(('failed', number, str(e)))
+                    continue
+                finally:
+                    _release(page)
+                connection.send(('text', number, text, rows))
+
+                rss = _rss_bytes()
+                connection.send(('rss', rss))
+                if fast and rss >= memory_limit:
+                    connection.send(('error', f"Memory limit of {memory_limit // 2 ** 20} MB reached"))
+                    break
+                if not fast and rss >= fast_threshold:
+                    gc.collect()
+                    if _rss_bytes() >= fast_threshold:
+                        fast = True
+                        connection.send(('fast', number + 1))
+    except Exception as e:
+        connection.send(('error', str(e)))
+    connection.send(('done',))
+    connection.close()
+
+
+def _stop(worker):
+    """Terminate a worker process, escalating to kill if it ignores SIGTERM"""
+    if worker.is_alive():
+        worker.terminate()
+        worker.join(1)
+        if worker.is_alive():
+            worker.kill()
+    worker.join()
+
+
+def extract_text(path, page_timeout=PDF_PAGE_TIMEOUT, doc_timeout=PDF_DOC_TIMEOUT, cancel=None,
+                 memory_limit=None, tables=False):
+    """Extract text from a PDF on disk under per-page and per-document deadlines
+
+    A page that overruns page_timeout is recorded and extraction restarts in a
+    fresh worker from the next page. When doc_timeout passes, or cancel (an
+    Event) is set, the worker is killed and the text gathered so far returned.
+
+    Returns a dict with text, page_count, timed_out_pages, failed_pages,
+    skipped_pages (1-based), fast_mode_from (first page read in fast text
+    mode, or None), peak_rss (bytes), error, complete and pages: (1-based page
+    number, text) for every page with text. With tables=True it
+    also holds lab_rows: normalized table rows (see lab_rows) tagged with page.
+    """
+    result = {
+        'text': '',
+        'pages': [],
+        'page_count': None,
+        'timed_out_pages': [],
+        'failed_pages': [],
+        'skipped_pages': [],
+        'fast_mode_from': None,
+        'peak_rss': 0,
+        'lab_rows': [],
+        'error': None,
+        'complete': False
+    }
+    texts = {}
+    context = multiprocessing.get_context('spawn')
+    doc_deadline = time.monotonic() + doc_timeout
+    start = 0
+    finished = False
+
+    while not finished:
+        receiver, sender = context.Pipe(duplex=False)
+        fast = result['fast_mode_from'] is not None
+        worker = context.Process(
+            target=_extract_worker,
+            args=(path, start, sender, fast, memory_limit, tables),
+            daemon=True
+        )
+        worker.start()
+        sender.close()
+
+        current = None
+        page_deadline = None
+        restart = None
+        try:
+            while True:
+                now = time.monotonic()
+                deadline = doc_deadline if page_deadline is None else min(doc_deadline, page_deadline)
+                if cancel is not None and cancel.is_set():
+                    result['error'] = "Extraction cancelled"
+                    break
+                if now >= deadline:
+                    if current is not None:
+                        result['timed_out_pages'].append(current + 1)
+                        if now < doc_deadline:
+                            restart = current + 1
+                    if restart is None and result['error'] is None:
+                        result['error'] = f"Document deadline of {doc_timeout:g}s reached"
+                    break
+                if not receiver.poll(min(deadline - now, POLL_INTERVAL)):
+                    continue
+
+                try:
+                    message = receiver.recv()
+                except EOFError:
+                    # Worker died (crash or OOM kill) while on the current page
+                    if current is not None:
+                        result['failed_pages'].append(current + 1)
+                        restart = current + 1
+                    else:
+                        result['error'] = "PDF worker exited unexpectedly"
+                    break
+
+                kind = message[0]
+                if kind == 'pages':
+                    result['page_count'] = message[1]
+                elif kind == 'page':
+                    current = message[1]
+                    page_deadline = time.monotonic() + page_timeout
+                elif kind == 'text':
+                    texts[message[1]] = message[2]
+                    result['lab_rows'].extend(dict(row, page=message[1] + 1) for row in message[3])
+                    current = page_deadline = None
+                elif kind == 'failed':
+                    result['failed_pages'].append(message[1] + 1)
+                    current = page_deadline = None
+                elif kind == 'rss':
+                    result['peak_rss'] = max(result['peak_rss'], message[1])
+                elif kind == 'fast':
+                    result['fast_mode_from'] = message[1] + 1
+                elif kind == 'error':
+                    result['error'] = message[1]
+                elif kind == 'done':
+                    break
+        finally:
+            _stop(worker)
+            receiver.close()
+
+        if restart is not None and result['page_count'] is not None and restart < result['page_count']:
+            start = restart
+        else:
+            finished = True
+
+    if result['page_count'] is not None:
+        handled = set(texts) | {page - 1 for page in result['timed_out_pages'] + result['failed_pages']}
+        result['skipped_pages'] = [n + 1 for n in range(result['page_count']) if n not in handled]
+
+    result['text'] = ''.join(texts[n] + "\n" for n in sorted(texts) if texts[n])
+    result['pages'] = [(n + 1, texts[n]) for n in sorted(texts) if texts[n]]
+    result['complete'] = (
+        result['page_count'] is not None and result['error'] is None
+        and not (result['timed_out_pages'] or result['failed_pages'] or result['skipped_pages'])
+    )
+    return result
+
+
+def describe_gaps(result):
+    """Short note listing pages that were not extracted, or '' if none"""
+    notes = []
+    for key, label in [('timed_out_pages', 'timed out'), ('failed_pages', 'failed'),
+                       ('skipped_pages', 'not reached')]:
+        if result[key]:
+            notes.append(f"pages {', '.join(map(str, result[key]))} {label}")
+    if result['fast_mode_from'] is not None:
+        notes.append(f"pages {result['fast_mode_from']}+ read in fast text mode (memory limit)")
+    if result['error'] and not notes:
+        notes.append(result['error'])
+    return '; '.join(notes)
@@ -0,0 +1,63 @@
+"""
+Population analytics over scored cohorts
+Reads the batch scorer's columnar output and aggregates it for the cohort view
+"""
+
+import os
+
+import numpy as np
+import pandas as pd
+
+from batch_engine import DISEASES
+from rules import RISK_LEVEL_TABLE
+
+HISTOGRAM_BINS = np.linspace(0, 100, 21)
+
+
+def load_scores(path, columns=None):
+    """Read (a subset of) the scored cohort columns from an Arrow IPC or Parquet file"""
+    if not os.path.exists(path):
+        return None
+    from arrow_store import is_arrow_path, read_columns
+
+    if is_arrow_path(path):
+        return read_columns(path, columns)
+    return pd.read_parquet(path, columns=columns)
+
+
+def level_counts(scores):
+    """Members per risk level for every disease (diseases x levels)"""
+    counts = {}
+    for disease in DISEASES:
+        column = scores[f'{disease}_level']
+        counts[disease] = column.value_counts().reindex(RISK_LEVEL_TABLE.labels, fill_value=0)
+    return pd.DataFrame(counts).T
+
+
+def risk_histograms(scores, bins=HISTOGRAM_BINS):
+    """Binned risk percentage counts per disease, so charts never see raw rows"""
+    histograms = {}
+    for disease in DISEASES:
+        counts, edges = np.histogram(scores[f'{disease}_risk'].to_numpy() * 100, bins=bins)
+        histograms[disease] = (counts, edges)
+    return histograms
+
+
+def factor_counts(scores, top=8):
+    """Most common top contributing factors across the cohort"""
+    counts = scores['top_factor'].value_counts()
+    counts = counts[(counts.index != 'none') & (counts > 0)]
+    return counts.head(top)
+
+
+def cost_summary(scores):
+    """Total, mean and p95 projected costs across the cohort"""
+    summary = {}
+    for column in ['annual_cost', 'cost_10y_without', 'cost_10y_with']:
+        values = scores[column].to_numpy(dtype=np.float64)
+        summary[column] = {
+            'total': float(values.sum()),
+            'mean': float(values.mean()) if len(values) else 0.0,
+            'p95': float(np.percentile(values, 95)) if len(values) else 0.0
+        }
+    return summary
@@ -0,0 +1,189 @@
+"""
+Streaming population percentiles
+Mergeable KLL quantile sketches per metric, built from the batch scorer's output
+"""
+
+import os
+import sys
+
+import numpy as np
+
+from batch_engine import DISEASES
+from config import KLL_K
+
+METRICS = ['health_score'] + [f'{disease}_risk' for disease in DISEASES]
+
+
+class KLLSketch:
+    """KLL quantile sketch: bounded-size, mergeable summary of a stream of values
+
+    Level h holds items standing for 2**h original values each; while the
+    sketch is over capacity, its lowest overfull level is sorted and every
+    other item (random offset) promoted to the next.
+    """
+
+    def __init__(self, k=KLL_K, seed=0):
+        self.k = k
+        self.count = 0
+        self.levels = [np.empty(0)]
+        self._rng = np.random.default_rng(seed)
+        self._sorted = None
+
+    def _capacity(self, level):
+        depth = len(self.levels) - 1 - level
+        return max(int(np.ceil(self.k * (2 / 3) ** depth)), 2)
+
+    def _compress(self):
+        """Compact the lowest overfull level, one at a time, until the sketch fits"""
+        while sum(len(items) for items in self.levels) > sum(self._capacity(h) for h in range(len(self.levels))):
+            h = next(h for h in range(len(self.levels)) if len(self.levels[h]) > self._capacity(h))
+            if h + 1 == len(self.levels):
+                self.levels.append(np.empty(0))
+            items = np.sort(self.levels[h])
+            # An odd item out stays behind so the promoted pairs stay exact
+            keep, items = items[:len(items) % 2], items[len(items) % 2:]
+            promoted = items[self._rng.integers(2)::2]
+            self.levels[h] = keep
+            self.levels[h + 1] = np.concatenate([self.levels[h + 1], promoted])
+
+    def update(self, values):
+        """Add values (scalar or array, NaN ignored)"""
+        values = np.atleast_1d(np.asarray(values, dtype=np.float64))
+        values = values[~np.isnan(values)]
+        if not len(values):
+            return self
+        self.levels[0] = np.concatenate([self.levels[0], values])
+        self.count += len(values)
+        self._sorted = None
+        self._compress()
+        return self
+
+    def merge(self, other):
+        """Fold another sketch into this one (same result as one sketch over both streams)"""
+        while len(self.levels) < len(other.levels):
+            self.levels.append(np.empty(0))
+        for h, items in enumerate(other.levels):
+            self.levels[h] = np.concatenate([self.levels[h], items])
+        self.count += other.count
+        self._sorted = None
+        self._compress()
+        return self
+
+    def _cumulative(self):
+        if self._sorted is None:
+            items = np.concatenate(self.levels)
+            weights = np.concatenate([np.full(len(items), 2 ** h) for h, items in enumerate(self.levels)])
+            order = np.argsort(items, kind='stable')
+            self._sorted = (items[order], np.cumsum(weights[order]))
+        return self._sorted
+
+    def percentile(self, value):
+        """Share (0-100) of the population below value, counting ties as half
+
+        Binary search over the sorted sketch items, O(log k) per value.
+        """
+        if not self.count:
+            return np.nan
+        items, cumulative = self._cumulative()
+        cumulative = np.concatenate([[0], cumulative])
+        below = cumulative[np.searchsorted(items, value, side='left')]
+        at_or_below = cumulative[np.searchsorted(items, value, side='right')]
+        return 100 * (below + at_or_below) / 2 / cumulative[-1]
+
+    def quantile(self, q):
+        """Approximate value at quantile q (0-1)"""
+        if not self.count:
+            return np.nan
+        items, cumulative = self._cumulative()
+        index = np.searchsorted(cumulative, np.asarray(q) * cumulative[-1], side='left')
+        return items[np.minimum(index, len(items) - 1)]
+
+    def to_arrays(self):
+        """Flat arrays for storage: (items, level sizes)"""
+        return np.concatenate(self.levels), np.array([len(items) for items in self.levels])
+
+    @classmethod
+    def from_arrays(cls, items, sizes, count, k=KLL_K):
+        sketch = cls(k)
+        sketch.levels = list(np.split(np.asarray(items, dtype=np.float64), np.cumsum(sizes)[:-1]))
+        sketch.count = int(count)
+        return sketch
+
+
+class PopulationSketches:
+    """One KLL sketch per population metric (health score and disease risks)"""
+
+    def __init__(self, k=KLL_K):
+        self.sketches = {metric: KLLSketch(k, seed=index) for index, metric in enumerate(METRICS)}
+
+    def update(self, scores):
+        """Add scored rows (DataFrame or dict of columns from the batch scorer)"""
+        for metric, sketch in self.sketches.items():
+            if metric in scores:
+                sketch.update(np.asarray(scores[metric], dtype=np.float64))
+        return self
+
+    def merge(self, other):
+        for metric, sketch in self.sketches.items():
+            sketch.merge(other.sketches[metric])
+        return self
+
+    @property
+    def count(self):
+        return self.sketches['health_score'].count
+
+    def percentile(self, metric, value):
+        """Population percentile of a single patient's metric value"""
+        return float(self.sketches[metric].percentile(value))
+
+    def save(self, path):
+        arrays = {}
+        for metric, sketch in self.sketches.items():
+            arrays[f'{metric}.items'], arrays[f'{metric}.sizes'] = sketch.to_arrays()
+            arrays[f'{metric}.meta'] = np.array([sketch.count, sketch.k])
+        # Written beside the target then swapped in, so readers never see half a file
+        with open(path + '.tmp', 'wb') as handle:
+            np.savez(handle, **arrays)
+        os.replace(path + '.tmp', path)
+
+    @classmethod
+    def load(cls, path):
+        """Sketches saved with save(), or None if there is no file"""
+        if not os.path.exists(path):
+            return None
+        sketches = cls()
+        with np.load(path) as arrays:
+            for metric in METRICS:
+                if f'{metric}.items' in arrays:
+                    count, k = arrays[f'{metric}.meta']
+                    sketches.sketches[metric] = KLLSketch.from_arrays(
+                        arrays[f'{metric}.items'], arrays[f'{metric}.sizes'], count, int(k)
+                    )
+        return sketches
+
+
+def sketch_path(scores_path):
+    """Sketch file kept beside a scored cohort file"""
+    return os.path.splitext(scores_path)[0] + '_sketches.npz'
+
+
+def sketches_from_scores(path, sketches=None):
+    """Add every row of a scored cohort file (Arrow or Parquet) to the sketches"""
+    from population import load_scores
+
+    sketches = sketches or PopulationSketches()
+    scores = load_scores(path, columns=METRICS)
+    if scores is not None:
+        sketches.update(scores)
+    return sketches
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2:
+        print("Usage: python quantiles.py scores.arrow [sketches.npz]")
+        sys.exit(1)
+    destination = sys.argv[2] if len(sys.argv) > 2 else sketch_path(sys.argv[1])
+    # New scores are folded into an existing sketch file instead of rebuilding it
+    result = sketches_from_scores(sys.argv[1], PopulationSketches.load(destination))
+    result.save(destination)
+    print(f"Sketched {result.count:,} scores -> {destination}")
@@ -0,0 +1,285 @@
+"""
+Full-text search over ingested reports
+Contentless SQLite FTS5 index of every extracted report page, updated on each
+ingestion; the page texts themselves live compressed in a TextStore
+"""
+
+import hashlib
+import os
+import re
+import sqlite3
+import sys
+from datetime import datetime
+from functools import lru_cache
+
+from config import REPORT_INDEX_PATH, REPORT_SEARCH_LIMIT
+from text_store import TextStore
+
+# Stored as PRAGMA user_version; a database from newer code is refused
+SCHEMA_VERSION = 1
+
+SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS reports (
+    id INTEGER PRIMARY KEY,
+    report_id TEXT UNIQUE NOT NULL,
+    patient_id TEXT,
+    file_name TEXT,
+    ingested TEXT NOT NULL,
+    pages INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS reports_patient ON reports (patient_id);
+CREATE TABLE IF NOT EXISTS pages (
+    id INTEGER PRIMARY KEY,
+    report INTEGER NOT NULL REFERENCES reports (id),
+    page INTEGER NOT NULL
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS page_terms USING fts5(
+    body, patient, content = '', tokenize = 'unicode61 remove_diacritics 2'
+);
+PRAGMA user_version = {SCHEMA_VERSION};
+"""
+
+SNIPPET_CHARS = 160
+
+# Quoted phrases or single whitespace-separated terms of a search box query
+QUERY_TERM = re.compile(r'"([^"]+)"|(\S+)')
+
+
+def query_terms(text):
+    """Terms and "quoted phrases" of a search box query"""
+    terms = []
+    for phrase, word in QUERY_TERM.findall(text):
+        term = (phrase or word).replace('"', '')
+        if term.strip():
+            terms.append(term)
+    return terms
+
+
+def match_query(text):
+    """FTS5 MATCH expression for free text: every term or "quoted phrase" must appear
+
+    Terms are quoted so input like "1.4" or "ST-segment" is matched as a
+    phrase instead of being parsed as FTS5 syntax.
+    """
+    return ' AND '.join(f'"{term}"' for term in query_terms(text))
+
+
+def snippet(text, query, width=SNIPPET_CHARS):
+    """Window of text around the first query match, matches in **bold**
+
+    Terms match like the index tokenizer: word tokens in order, any
+    punctuation or spacing between them.
+    """
+    patterns = []
+    for term in query_terms(query):
+        words = re.findall(r'\w+', term)
+        if words:
+            patterns.append(r'(?<!\w)' + r'\W+'.join(map(re.escape, words)) + r'(?!\w)')
+    if not patterns:
+        return text[:width]
+    matcher = re.compile('|'.join(patterns), re.IGNORECASE)
+    first = matcher.search(text)
+    start = max(0, first.start() - width // 3) if first else 0
+    end = min(len(text), start + width)
+    window = matcher.sub(lambda match: f'**{match.group(0)}**', text[start:end])
+    return ('…' if start else '') + window + ('…' if end < len(text) else '')
+
+
+def patient_token(patient_id):
+    """Patient identifier as one index token ("PAT-2024-001" -> "PAT2024001")
+
+    A single rare token keeps patient filters a short doclist lookup instead
+    of a phrase match over common fragments like "pat".
+    """
+    return re.sub(r'[^0-9A-Za-z]', '', patient_id) if patient_id else None
+
+
+def text_dir_for(db_path):
+    """Text store directory of an index database ("data/reports.sqlite3" -> "data/reports_text")"""
+    return os.path.splitext(db_path)[0] + '_text'
+
+
+def report_key(pages):
+    """Content-derived report identifier, so re-ingesting a report is a no-op"""
+    digest = hashlib.sha1()
+    for number, text in pages:
+        digest.update(f'{number}\0{text}\0'.encode('utf-8', 'replace'))
+    return digest.hexdigest()[:16]
+
+
+class ReportIndex:
+    """Inverted index of report pages with ranked (BM25) search
+
+    Only term statistics are kept in SQLite; page texts are stored once,
+    compressed, in a TextStore keyed by report_id.
+    """
+
+    def __init__(self, db_path=REPORT_INDEX_PATH, text_dir=None):
+        self.db_path = db_path
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        connection = self._connect()
+        try:
+            version = connection.execute("PRAGMA user_version").fetchone()[0]
+            if version > SCHEMA_VERSION:
+                raise RuntimeError(f"{db_path} has schema version {version}, "
+                                   f"newer than this code ({SCHEMA_VERSION})")
+            connection.executescript(SCHEMA)
+        finally:
+            connection.close()
+        self.store = TextStore(text_dir or text_dir_for(db_path))
+
+    def _connect(self):
+        # WAL lets job workers ingest while the UI searches
+        connection = sqlite3.connect(self.db_path, timeout=30)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.row_factory = sqlite3.Row
+        return connection
+
+    def add(self, pages, file_name=None, patient_id=None):
+        """Index a report's [(page number, text)], returns its report_id
+
+        One transaction per report; a report already indexed is left as is.
+        """
+        pages = [(number, text) for number, text in pages if text and text.strip()]
+        report_id = report_key(pages)
+        ingested = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        # Text first: an indexed page must always have its text in the store
+        self.store.put(report_id, {'file_name': file_name, 'patient_id': patient_id,
+                                   'ingested': ingested, 'pages': pages})
+
+        connection = self._connect()
+        try:
+            with connection:
+                cursor = connection.execute(
+                    "INSERT OR IGNORE INTO reports (report_id, patient_id, file_name, ingested, pages) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    (report_id, patient_id, file_name, ingested, len(pages))
+                )
+                if cursor.rowcount:
+                    report = cursor.lastrowid
+                    for number, text in pages:
+                        page = connection.execute(
+                            "INSERT INTO pages (report, page) VALUES (?, ?)", (report, number)
+                        ).lastrowid
+                        connection.execute(
+                            "INSERT INTO page_terms (rowid, body, patient) VALUES (?, ?, ?)",
+                            (page, text, patient_token(patient_id))
+                        )
+        finally:
+            connection.close()
+        return report_id
+
+    def search(self, query, limit=REPORT_SEARCH_LIMIT, patient_id=None, candidates=None):
+        """Best-matching pages for a free-text query, most relevant first
+
+        Every matching page is ranked by default. With `candidates`, only
+        that many most recently ingested matching pages are ranked, so common
+        terms cost a bounded doclist scan, but older reports can be missed.
+        Returns [{report_id, patient_id, file_name, ingested, page, snippet,
+        score}]; a lower score (BM25) is a better match.
+        """
+        expression = match_query(query)
+        if not expression:
+            return []
+        expression = f'body : ({expression})'
+        if patient_token(patient_id):
+            expression += f' AND patient : "{patient_token(patient_id)}"'
+
+        connection = self._connect()
+        try:
+            # bm25 with the patient column weighted 0
+            if candidates is None:
+                hits = connection.execute(
+                    """
+                    SELECT rowid, bm25(page_terms, 1.0, 0.0) AS score
+                    FROM page_terms WHERE page_terms MATCH ?
+                    ORDER BY score LIMIT ?
+                    """,
+                    (expression, limit)
+                ).fetchall()
+            else:
+                # Rowid order lets FTS5 stop after `candidates` matches
+                hits = connection.execute(
+                    """
+                    SELECT rowid, score FROM (
+                        SELECT rowid, bm25(page_terms, 1.0, 0.0) AS score
+                        FROM page_terms WHERE page_terms MATCH ?
+                        ORDER BY rowid DESC LIMIT ?
+                    ) ORDER BY score LIMIT ?
+                    """,
+                    (expression, candidates, limit)
+                ).fetchall()
+            rows = connection.execute(
+                f"""
+                SELECT p.id, p.page, r.report_id, r.patient_id, r.file_name, r.ingested
+                FROM pages AS p JOIN reports AS r ON r.id = p.report
+                WHERE p.id IN ({','.join('?' * len(hits))})
+                """,
+                [hit['rowid'] for hit in hits]
+            ).fetchall() if hits else []
+        except sqlite3.OperationalError:
+            # Input the quoting cannot make valid (e.g. only punctuation)
+            return []
+        finally:
+            connection.close()
+
+        # Snippets come from the stored text, one decompression per report
+        found = {row['id']: dict(row) for row in rows}
+        texts = {}
+        results = []
+        for hit in hits:
+            row = found.get(hit['rowid'])
+            if row is None:
+                continue
+            if row['report_id'] not in texts:
+                record = self.store.get(row['report_id'])
+                texts[row['report_id']] = dict(map(tuple, record['pages'])) if record else {}
+            row['snippet'] = snippet(texts[row['report_id']].get(row['page'], ''), query)
+            row['score'] = hit['score']
+            del row['id']
+            results.append(row)
+        return results
+
+    def report_text(self, report_id):
+        """Full text of an indexed report, pages in order"""
+        record = self.store.get(report_id)
+        if record is None:
+            return ''
+        return '\n'.join(text for _, text in sorted(record['pages']))
+
+    def counts(self):
+        """(reports, pages) in the index"""
+        connection = self._connect()
+        try:
+            reports, pages = connection.execute(
+                "SELECT COUNT(*), COALESCE(SUM(pages), 0) FROM reports"
+            ).fetchone()
+        finally:
+            connection.close()
+        return reports, pages
+
+    def optimize(self):
+        """Merge FTS5 index segments after large ingestions (faster queries)"""
+        connection = self._connect()
+        try:
+            with connection:
+                connection.execute("INSERT INTO page_terms (page_terms) VALUES ('optimize')")
+        finally:
+            connection.close()
+
+
+@lru_cache(maxsize=None)
+def open_index(db_path=REPORT_INDEX_PATH, text_dir=None):
+    """Process-wide ReportIndex, so the text store's offset index is loaded once"""
+    return ReportIndex(db_path, text_dir)
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2:
+        print('Usage: python report_index.py "search terms" [index.sqlite3]')
+        sys.exit(1)
+    index = open_index(sys.argv[2] if len(sys.argv) > 2 else REPORT_INDEX_PATH)
+    for hit in index.search(sys.argv[1]):
+        print(f"{hit['report_id']}  {hit['patient_id'] or '-':12s} p{hit['page']}  {hit['snippet']}")
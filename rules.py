@@ -0,0 +1,152 @@
+"""
+Threshold table compiler for the rule-based scorers
+Turns the declarative tables in config.py into sorted breakpoint arrays
+"""
+
+from bisect import bisect_left, bisect_right
+
+import numpy as np
+
+from config import (
+    FEATURE_DEFAULTS, RISK_RULES, HEALTH_SCORE_RULES, RISK_LEVEL_BANDS,
+    RISK_DESCRIPTION_BANDS, SCORE_FEEDBACK_BANDS, ONSET_TIMELINE_BANDS, RISK_COLOR_BANDS
+)
+
+
+def _check_cuts(cuts):
+    """Validate that cut points are strictly increasing"""
+    if any(b <= a for a, b in zip(cuts, cuts[1:])):
+        raise ValueError(f"Cut points must be strictly increasing: {cuts}")
+
+
+class ScoreTable:
+    """Additive scorer: base plus one increment per feature band, then clipped"""
+
+    def __init__(self, base, rules, low=None, high=None):
+        self.base = base
+        self.low = low
+        self.high = high
+
+        # Merge rules on the same feature into one breakpoint array per feature
+        merged = {}
+        for feature, cuts, increments in rules:
+            cuts = list(cuts)
+            _check_cuts(cuts)
+            if len(increments) != len(cuts):
+                raise ValueError(f"Rule for '{feature}' needs one increment per cut point")
+            values = [0] + list(increments)
+
+            if feature in merged:
+                old_cuts, old_values = merged[feature]
+                all_cuts = sorted(set(old_cuts) | set(cuts))
+                # Band above cut c holds every increment whose cut is <= c
+                values = [old_values[bisect_right(old_cuts, c)] + values[bisect_right(cuts, c)]
+                          for c in [float('-inf')] + all_cuts]
+                cuts = all_cuts
+            merged[feature] = (cuts, values)
+
+        self.rules = [(feature, cuts, values, np.asarray(cuts, dtype=float), np.asarray(values))
+                      for feature, (cuts, values) in merged.items()]
+
+    @property
+    def features(self):
+        return [rule[0] for rule in self.rules]
+
+    def breakpoints(self, feature):
+        """Cut points used for a feature (empty if the table ignores it)"""
+        for name, cuts, _, _, _ in self.rules:
+            if name == feature:
+                return cuts
+        return []
+
+    def score(self, columns):
+        """Score column arrays (all features present) with one searchsorted per rule"""
+        total = self.base
+        for feature, _, _, cuts, values in self.rules:
+            column = np.asarray(columns[feature], dtype=float)
+            total = total + values[np.searchsorted(cuts, column, side='left')]
+        if self.low is not None or self.high is not None:
+            total = np.clip(total, self.low, self.high)
+        return total
+
+    def contributions(self, columns):
+        """Per-feature increment arrays (the terms summed by score)"""
+        return {
+            feature: values[np.searchsorted(cuts, np.asarray(columns[feature], dtype=float), side='left')]
+            for feature, _, _, cuts, values in self.rules
+        }
+
+    def score_one(self, record):
+        """Score a single patient dict without NumPy overhead"""
+        total = self.base
+        for feature, cuts, values, _, _ in self.rules:
+            total += values[bisect_left(cuts, record.get(feature, FEATURE_DEFAULTS.get(feature, 0)))]
+        if self.high is not None:
+            total = min(self.high, total)
+        if self.low is not None:
+            total = max(self.low, total)
+        return total
+
+
+class LabelTable:
+    """Maps a value to a label by the band it falls into"""
+
+    def __init__(self, cuts, labels, side='right'):
+        _check_cuts(list(cuts))
+        if len(labels) != len(cuts) + 1:
+            raise ValueError("Label table needs one more label than cut points")
+        self.cuts = list(cuts)
+        self.labels = list(labels)
+        self.side = side
+        self._cuts = np.asarray(cuts, dtype=float)
+        self._labels = np.asarray(labels)
+        self._bisect = bisect_right if side == 'right' else bisect_left
+
+    def label(self, value):
+        """Label for a single value"""
+        return self.labels[self._bisect(self.cuts, value)]
+
+    def labels_for(self, values):
+        """Labels for an array of values"""
+        return self._labels[np.searchsorted(self._cuts, values, side=self.side)]
+
+
+# ============================================
+# COMPILED TABLES
+# ============================================
+
+RISK_TABLES = {
+    disease: ScoreTable(spec['base'], spec['rules'], spec.get('min'), spec.get('max'))
+    for disease, spec in RISK_RULES.items()
+}
+
+HEALTH_SCORE_TABLE = ScoreTable(
+    HEALTH_SCORE_RULES['base'], HEALTH_SCORE_RULES['rules'],
+    HEALTH_SCORE_RULES.get('min'), HEALTH_SCORE_RULES.get('max')
+)
+
+RISK_LEVEL_TABLE = LabelTable(*RISK_LEVEL_BANDS)
+
+RISK_DESCRIPTION_TABLES = {
+    disease: LabelTable(*bands) for disease, bands in RISK_DESCRIPTION_BANDS.items()
+}
+
+SCORE_FEEDBACK_TABLE = LabelTable(*SCORE_FEEDBACK_BANDS)
+
+ONSET_TIMELINE_TABLE = LabelTable(*ONSET_TIMELINE_BANDS)
+
+RISK_COLOR_TABLE = LabelTable(*RISK_COLOR_BANDS)
+
+
+def breakpoints(feature):
+    """Union of a feature's cut points across the risk and health score tables"""
+    cuts = set(HEALTH_SCORE_TABLE.breakpoints(feature))
+    for table in RISK_TABLES.values():
+        cuts.update(table.breakpoints(feature))
+    return sorted(cuts)
+
+
+def describe_risk(disease, risk):
+    """Descriptive text for a disease risk value"""
+    table = RISK_DESCRIPTION_TABLES.get(disease, RISK_DESCRIPTION_TABLES['default'])
+    return table.label(risk)
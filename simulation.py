@@ -0,0 +1,262 @@
+"""
+Monte Carlo projections over the timeline model
+Timeline percentile bands and cohort cost distributions
+"""
+
+import multiprocessing
+import sys
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+
+import numpy as np
+
+from batch_engine import (
+    BatchRiskCalculator, DISEASES, INTERVENTIONS, TIMELINE_YEARS, AGING_RATE, PROGRESSION_RATE
+)
+from config import (
+    MC_TIMELINE_DRAWS, MC_PROGRESSION_SIGMA, MC_EFFECTIVENESS_SD, MC_PERCENTILES, MC_SEED,
+    MC_COST_SIMULATIONS, MC_COST_CHUNK, MC_COST_SIGMA, MC_DISEASE_COSTS, COST_PARAMS
+)
+
+SCENARIOS = {
+    'without_intervention': COST_PARAMS['growth_without'],
+    'with_intervention': COST_PARAMS['growth_with']
+}
+
+DEFAULT_INTERVENTION = {'effectiveness': 0.3, 'delay': 1}
+
+
+def draw_parameters(disease, draws=MC_TIMELINE_DRAWS, rng=None):
+    """Perturbed (progression rate, intervention effectiveness) per draw
+
+    The progression rate is scaled by a log-normal factor and effectiveness
+    gets a normal perturbation, clipped to [0, 0.95].
+    """
+    rng = rng if rng is not None else np.random.default_rng()
+    intervention = INTERVENTIONS.get(disease, DEFAULT_INTERVENTION)
+    rate = PROGRESSION_RATE * rng.lognormal(0.0, MC_PROGRESSION_SIGMA, size=draws)
+    effectiveness = np.clip(rng.normal(intervention['effectiveness'], MC_EFFECTIVENESS_SD, size=draws), 0.0, 0.95)
+    return rate, effectiveness
+
+
+def factor_curves(disease, rate, effectiveness):
+    """Cumulative risk multipliers per year, shape (len(rate), TIMELINE_YEARS)
+
+    Growth factors stay >= 1 and improvement factors <= 1, so capping the
+    cumulative products matches the year-by-year caps of generate_timeline.
+    """
+    steps = np.arange(1, TIMELINE_YEARS + 1)
+    delay = INTERVENTIONS.get(disease, DEFAULT_INTERVENTION)['delay']
+    rate = np.asarray(rate, dtype=float)[:, None]
+    effectiveness = np.asarray(effectiveness, dtype=float)[:, None]
+
+    growth = np.cumprod((1 + steps * AGING_RATE) * (1 + rate * steps), axis=1)
+    improvement = np.where(
+        steps <= delay,
+        1.02,
+        1 - effectiveness * (1 - np.exp(-0.3 * (steps - delay)))
+    )
+    return growth, np.cumprod(improvement, axis=1)
+
+
+def trajectory_factors(disease, draws=MC_TIMELINE_DRAWS, rng=None):
+    """Growth and improvement multipliers for every draw, shape (draws, TIMELINE_YEARS)"""
+    return factor_curves(disease, *draw_parameters(disease, draws, rng))
+
+
+def disease_rng(disease, seed):
+    """Generator for one disease's draws (independent streams per disease)"""
+    if seed is None:
+        return np.random.default_rng()
+    return np.random.default_rng([seed, zlib.crc32(disease.encode())])
+
+
+def _factor_percentiles(disease, draws, seed, percentiles):
+    """Percentiles of the growth and improvement factors, shape (len(percentiles), years)
+
+    Every year's growth factor increases with the progression rate and every
+    improvement factor decreases with effectiveness, so the factor percentiles
+    are the curves at the matching parameter percentiles: only the 1-D draws
+    need ranking, not the whole (draws, years) trajectory matrix.
+    """
+    rate, effectiveness = draw_parameters(disease, draws, disease_rng(disease, seed))
+    return factor_curves(
+        disease,
+        np.percentile(rate, percentiles),
+        np.percentile(effectiveness, [100 - p for p in percentiles])
+    )
+
+
+# Seeded factor percentiles do not depend on the patient, so they are reused
+_cached_factor_percentiles = lru_cache(maxsize=64)(_factor_percentiles)
+
+
+def timeline_bands(risks, draws=MC_TIMELINE_DRAWS, seed=MC_SEED, percentiles=MC_PERCENTILES):
+    """Percentile bands of the 10-year timeline for one patient or a cohort
+
+    risks maps disease -> risk (scalar) or risk array. Trajectories are
+    risk * factor with monotone caps, so each percentile of a patient's
+    trajectories equals the capped risk times the percentile of the factors:
+    the draws are taken once per disease and every patient reuses them.
+
+    Returns {'years', 'percentiles', 'without_intervention', 'with_intervention'}
+    where each scenario maps disease -> {'p10': ..., 'p50': ..., 'p90': ...},
+    lists for a scalar risk and (n, 11) arrays for risk arrays. With a seed
+    the factor percentiles are cached, so repeat calls cost microseconds.
+    """
+    percentiles = tuple(percentiles)
+    steps = np.arange(1, TIMELINE_YEARS + 1)
+    bands = {
+        'years': list(range(TIMELINE_YEARS + 1)),
+        'percentiles': list(percentiles),
+        'without_intervention': {},
+        'with_intervention': {}
+    }
+
+    for disease, risk in risks.items():
+        scalar = np.ndim(risk) == 0
+        risk = np.atleast_1d(np.asarray(risk, dtype=float))[:, None]
+        delay = INTERVENTIONS.get(disease, DEFAULT_INTERVENTION)['delay']
+
+        factors = _factor_percentiles if seed is None else _cached_factor_percentiles
+        growth_q, improvement_q = factors(disease, draws, seed, percentiles)
+
+        without, with_int = {}, {}
+        for p, g, i in zip(percentiles, growth_q, improvement_q):
+            with_path = risk * i
+            with_path = np.where(steps > delay, np.maximum(0.05, with_path), with_path)
+            without[f'p{p}'] = np.hstack([risk, np.minimum(0.95, risk * g)])
+            with_int[f'p{p}'] = np.hstack([risk, with_path])
+
+        if scalar:
+            without = {key: values[0].tolist() for key, values in without.items()}
+            with_int = {key: values[0].tolist() for key, values in with_int.items()}
+        bands['without_intervention'][disease] = without
+        bands['with_intervention'][disease] = with_int
+
+    return bands
+
+
+# ============================================
+# COST DISTRIBUTION ENGINE
+# ============================================
+
+def _onset_years(cumulative, draws):
+    """Index of the first year whose cumulative probability exceeds each draw
+
+    cumulative is (rows, years) and non-decreasing per row, draws is
+    (simulations, rows); the result is `years` where no onset happens.
+    """
+    onset = np.zeros(draws.shape, dtype=np.intp)
+    for year in range(cumulative.shape[1]):
+        onset += cumulative[:, year] <= draws
+    return onset
+
+
+def _simulate_shard(risks, simulations, seed, shard):
+    """10-year cost totals per simulation for one shard of members
+
+    Onset is sampled from each scenario's timeline (running maximum, read as
+    cumulative onset probability); from the onset year a member pays a
+    log-normal annual treatment cost that grows with the scenario's inflation.
+    Both scenarios share the uniform and cost draws, so savings have low noise.
+    """
+    rng = np.random.default_rng(np.random.SeedSequence(seed, spawn_key=(shard,)))
+    timeline = BatchRiskCalculator.generate_timeline(risks)
+    members = len(next(iter(risks.values())))
+    years = np.arange(TIMELINE_YEARS)
+
+    growth = {scenario: (1 + rate) ** years for scenario, rate in SCENARIOS.items()}
+    # weights[k]: grown cost of being ill from year k+1 to the horizon (0 if never)
+    weights = {scenario: np.append(np.cumsum(g[::-1])[::-1], 0.0) for scenario, g in growth.items()}
+    totals = {
+        scenario: np.full(simulations, members * COST_PARAMS['base_cost'] * g.sum())
+        for scenario, g in growth.items()
+    }
+
+    for disease in risks:
+        mean_cost = MC_DISEASE_COSTS.get(disease, COST_PARAMS['base_cost'])
+        draws = rng.random((simulations, members))
+        annual = rng.lognormal(np.log(mean_cost) - MC_COST_SIGMA ** 2 / 2, MC_COST_SIGMA,
+                               size=(simulations, members))
+        for scenario in SCENARIOS:
+            cumulative = np.maximum.accumulate(timeline[scenario][disease][:, 1:], axis=1)
+            onset = _onset_years(cumulative, draws)
+            totals[scenario] += (annual * weights[scenario][onset]).sum(axis=1)
+
+    return totals
+
+
+def _summary(totals, members):
+    return {
+        'mean': float(totals.mean()),
+        'p50': float(np.percentile(totals, 50)),
+        'p95': float(np.percentile(totals, 95)),
+        'per_member_mean': float(totals.mean() / max(members, 1))
+    }
+
+
+def simulate_costs(risks, simulations=MC_COST_SIMULATIONS, seed=MC_SEED, workers=None,
+                   chunk=MC_COST_CHUNK):
+    """Distribution of 10-year cohort costs with and without intervention
+
+    risks maps disease -> risk (scalar for one patient) or risk array. Members
+    are split into fixed shards of `chunk`, each with its own seeded stream,
+    so a seed reproduces the same result serially or with `workers` processes.
+
+    Returns {'members', 'simulations', 'without_intervention',
+    'with_intervention', 'savings'}, each scenario a {mean, p50, p95,
+    per_member_mean} summary, plus 'totals' holding the per-simulation arrays.
+    """
+    risks = {disease: np.atleast_1d(np.asarray(risk, dtype=float)) for disease, risk in risks.items()}
+    members = len(next(iter(risks.values()))) if risks else 0
+    shards = [
+        {disease: values[start:start + chunk] for disease, values in risks.items()}
+        for start in range(0, members, chunk)
+    ]
+
+    totals = {scenario: np.zeros(simulations) for scenario in SCENARIOS}
+    if workers and workers > 1 and len(shards) > 1:
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn')) as pool:
+            futures = [pool.submit(_simulate_shard, shard, simulations, seed, index)
+                       for index, shard in enumerate(shards)]
+            results = (future.result() for future in futures)
+            for result in results:
+                for scenario in SCENARIOS:
+                    totals[scenario] += result[scenario]
+    else:
+        for index, shard in enumerate(shards):
+            result = _simulate_shard(shard, simulations, seed, index)
+            for scenario in SCENARIOS:
+                totals[scenario] += result[scenario]
+
+    savings = totals['without_intervention'] - totals['with_intervention']
+    return {
+        'members': members,
+        'simulations': simulations,
+        'without_intervention': _summary(totals['without_intervention'], members),
+        'with_intervention': _summary(totals['with_intervention'], members),
+        'savings': _summary(savings, members),
+        'totals': {**totals, 'savings': savings}
+    }
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2:
+        print("Usage: python simulation.py scores.arrow|scores.parquet [workers]")
+        sys.exit(1)
+    from population import load_scores
+
+    scores = load_scores(sys.argv[1], columns=[f'{disease}_risk' for disease in DISEASES])
+    if scores is None:
+        print(f"No scored cohort at {sys.argv[1]}")
+        sys.exit(1)
+    result = simulate_costs(
+        {disease: scores[f'{disease}_risk'].to_numpy(dtype=np.float64) for disease in DISEASES},
+        workers=int(sys.argv[2]) if len(sys.argv) > 2 else None
+    )
+    for key in ['without_intervention', 'with_intervention', 'savings']:
+        summary = result[key]
+        print(f"{key:22s} mean ₹{summary['mean']:,.0f}  p95 ₹{summary['p95']:,.0f}  "
+              f"per member ₹{summary['per_member_mean']:,.0f}")
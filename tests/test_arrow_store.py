@@ -0,0 +1,32 @@
+"""Arrow IPC interchange for scored cohorts"""
+
+import pandas as pd
+
+from arrow_store import open_scores, read_columns, read_timelines, score_csv_to_arrow, SCORES_SCHEMA
+
+
+def scored_ids(tmp_path, ids):
+    csv = tmp_path / 'members.csv'
+    pd.DataFrame({'patient_id': ids, 'age': [40, 55, 70], 'glucose': [90, 130, 180]}).to_csv(csv, index=False)
+    destination = str(tmp_path / 'scores.arrow')
+    assert score_csv_to_arrow(str(csv), destination) == 3
+    return open_scores(destination).column('patient_id').to_pylist(), destination
+
+
+def test_missing_patient_ids_stay_null(tmp_path):
+    ids, _ = scored_ids(tmp_path, ['PAT-1', None, 'PAT-3'])
+    assert ids == ['PAT-1', None, 'PAT-3']
+
+
+def test_integer_ids_with_gaps(tmp_path):
+    ids, _ = scored_ids(tmp_path, [101, None, 103])
+    assert ids == ['101', None, '103']
+
+
+def test_schema_and_timelines(tmp_path):
+    _, destination = scored_ids(tmp_path, ['a', 'b', 'c'])
+    frame = read_columns(destination)
+    assert list(frame.columns) == SCORES_SCHEMA.names
+    timelines = read_timelines(destination, 'diabetes')
+    assert timelines.shape[0] == 3
+    assert abs(timelines[:, 0] - frame['diabetes_risk'].to_numpy()).max() < 1e-6
@@ -0,0 +1,172 @@
+"""Background job queue"""
+
+import io
+import os
+import sqlite3
+import threading
+
+import pytest
+
+import analysis
+import jobs
+from admission import AdmissionRejected
+from jobs import DONE, QUEUED, RUNNING, JobQueue, run_report_job
+from uploads import UploadBuffer
+
+REPORT = b"Patient: Test\nAge: 58\nGlucose: 132 mg/dL\nCholesterol: 240 mg/dL\nBP: 150/95\n"
+
+
+def upload(name='report.txt', data=REPORT):
+    file = io.BytesIO(data)
+    file.name = name
+    return UploadBuffer(file)
+
+
+@pytest.fixture
+def queue(tmp_path, monkeypatch):
+    # Jobs run inline in the tests (no worker processes, no search index)
+    monkeypatch.setattr(JobQueue, '_dispatch', lambda self, job_id: None)
+    monkeypatch.setattr(analysis, 'REPORT_INDEX_PATH', None)
+    queue = JobQueue(str(tmp_path / 'jobs.sqlite3'), str(tmp_path / 'spool'), workers=1, max_queued=3)
+    yield queue
+    queue.shutdown()
+
+
+def test_submit_and_run(queue):
+    job_id = queue.submit(upload())
+    job = queue.status(job_id)
+    assert job['status'] == QUEUED and os.path.exists(job['file_path'])
+    assert queue.position(job_id) == 1
+
+    run_report_job(queue.db_path, job_id)
+    job = queue.status(job_id)
+    assert job['status'] == DONE, job['error']
+    assert job['result']['analysis']['parsed_data']['glucose'] == 132
+    assert not os.path.exists(job['file_path'])
+
+
+def test_job_is_claimed_once(queue):
+    job_id = queue.submit(upload())
+    connection = sqlite3.connect(queue.db_path)
+    connection.execute("UPDATE jobs SET status = ? WHERE id = ?", (RUNNING, job_id))
+    connection.commit()
+    connection.close()
+
+    # A second dispatch of a job another worker already claimed is a no-op
+    run_report_job(queue.db_path, job_id)
+    job = queue.status(job_id)
+    assert job['status'] == RUNNING and job['result'] is None
+    assert os.path.exists(job['file_path'])
+
+
+def test_concurrent_runs_of_one_job(queue):
+    job_id = queue.submit(upload())
+    runs = []
+    original = analysis.EnhancedMedicalReportAnalyzer.analyze_path
+
+    def counted(path, name=None):
+        runs.append(name)
+        return original(path, name)
+
+    analysis.EnhancedMedicalReportAnalyzer.analyze_path = staticmethod(counted)
+    try:
+        threads = [threading.Thread(target=run_report_job, args=(queue.db_path, job_id)) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    finally:
+        analysis.EnhancedMedicalReportAnalyzer.analyze_path = staticmethod(original)
+    assert len(runs) == 1
+    assert queue.status(job_id)['status'] == DONE
+
+
+def test_queue_limit_holds_under_concurrent_submits(queue, tmp_path):
+    accepted, rejected = [], []
+
+    def submit():
+        try:
+            accepted.append(queue.submit(upload()))
+        except AdmissionRejected:
+            rejected.append(True)
+
+    threads = [threading.Thread(target=submit) for _ in range(12)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(accepted) == 3 and len(rejected) == 9
+    assert queue.queued_count() == 3
+    # Rejected uploads leave nothing behind in the spool
+    assert len(os.listdir(tmp_path / 'spool')) == 3
+
+
+def test_recover_requeues_and_fails_lost_uploads(queue, tmp_path):
+    kept = queue.submit(upload())
+    lost = queue.submit(upload())
+    os.remove(queue.status(lost)['file_path'])
+
+    recovered = JobQueue(queue.db_path, queue.spool_dir, workers=1)
+    recovered.shutdown()
+    assert queue.status(kept)['status'] == QUEUED
+    assert queue.status(lost)['status'] == jobs.FAILED
+
+
+def test_pool_is_sized_by_the_extraction_limit(tmp_path, monkeypatch):
+    monkeypatch.setitem(jobs.ADMISSION_LIMITS, 'extraction', {'max_concurrent': 3, 'max_queue': 1, 'timeout': 1})
+    queue = JobQueue(str(tmp_path / 'jobs.sqlite3'), str(tmp_path / 'spool'), workers=None)
+    queue.shutdown()
+    assert queue.workers == 3
+    assert queue._executor._max_workers == 3
+
+
+def test_recover_leaves_recent_running_jobs(queue):
+    recent = queue.submit(upload())
+    stale = queue.submit(upload())
+    connection = sqlite3.connect(queue.db_path)
+    connection.execute("UPDATE jobs SET status = ?, started = ? WHERE id = ?", (RUNNING, jobs._now(), recent))
+    connection.execute("UPDATE jobs SET status = ?, started = ? WHERE id = ?",
+                       (RUNNING, jobs._now(-jobs.JOB_STALE_AFTER - 60), stale))
+    connection.commit()
+    connection.close()
+
+    JobQueue(queue.db_path, queue.spool_dir, workers=1).shutdown()
+    assert queue.status(recent)['status'] == RUNNING
+    assert queue.status(stale)['status'] == QUEUED
+
+
+def test_dead_worker_fails_its_job_and_requeues_the_rest(queue, monkeypatch):
+    from concurrent.futures import Future
+    from concurrent.futures.process import BrokenProcessPool
+
+    running = queue.submit(upload())
+    waiting = queue.submit(upload())
+    connection = sqlite3.connect(queue.db_path)
+    connection.execute("UPDATE jobs SET status = ?, started = ? WHERE id = ?", (RUNNING, jobs._now(), running))
+    connection.commit()
+    connection.close()
+    redispatched = []
+    monkeypatch.setattr(JobQueue, '_dispatch', lambda self, job_id: redispatched.append(job_id))
+
+    for job_id in (running, waiting):
+        future = Future()
+        future.set_exception(BrokenProcessPool('worker killed'))
+        queue._finished(job_id, future)
+
+    job = queue.status(running)
+    assert job['status'] == jobs.FAILED and 'stopped unexpectedly' in job['error']
+    assert not os.path.exists(job['file_path'])
+    assert queue.status(waiting)['status'] == QUEUED
+    assert redispatched == [waiting]
+
+
+def test_broken_pool_is_replaced(tmp_path):
+    queue = JobQueue(str(tmp_path / 'jobs.sqlite3'), str(tmp_path / 'spool'), workers=1)
+    try:
+        with pytest.raises(Exception):
+            queue._executor.submit(os._exit, 1).result(timeout=60)
+        # No such job: the worker claims nothing and returns
+        assert queue._dispatch('missing').result(timeout=120) is None
+    finally:
+        queue.shutdown()
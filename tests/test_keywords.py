@@ -0,0 +1,59 @@
+"""Flag matching and negation scope"""
+
+import pytest
+
+from keywords import FLAG_MATCHER, KeywordAutomaton
+
+
+@pytest.mark.parametrize('text, flags', [
+    # Plain mentions
+    ("Known diabetic, smoker", {'diabetes': True, 'smoking': True}),
+    ("History of hypertension", {'hypertension': True}),
+    # Negated mentions
+    ("No diabetes", {}),
+    ("Patient denies smoking", {}),
+    ("Diabetes: no", {}),
+    ("Negative for hypertension.", {}),
+    # The cue carries across an "or" list
+    ("Denies smoking or alcohol", {}),
+    # Conjunctions end the cue's scope
+    ("Patient denies chest pain but has diabetes", {'diabetes': True}),
+    ("No chest pain, however hypertension noted", {'hypertension': True}),
+    # Commas end the cue's scope
+    ("No history of diabetes, smoker", {'smoking': True}),
+    ("Former smoker, drinks alcohol socially", {'alcohol': True}),
+    ("Diabetes, no smoking", {'diabetes': True}),
+    # A cue between two mentions of one flag negates both
+    ("Smoking status: never smoker", {}),
+    ("Alcohol: none, non-drinker", {}),
+    ("Smoking: no, never smoked", {}),
+    # A cue negates only the first term it reaches
+    ("Quit smoking and drinks alcohol daily", {'alcohol': True}),
+    # Sentence ends close the scope
+    ("No smoking. Diabetes mellitus type 2.", {'diabetes': True}),
+])
+def test_negation_scope(text, flags):
+    assert FLAG_MATCHER.flags(text) == flags
+
+
+def test_exclusions_do_not_set_flags():
+    assert FLAG_MATCHER.flags("Pre-diabetes, passive smoking exposure") == {}
+
+
+def test_whole_words_only():
+    assert FLAG_MATCHER.flags("Admitted for dmso treatment") == {}
+
+
+def test_offsets_survive_lengthening_lowercase():
+    # 'İ'.lower() is two characters; spans must still index the original text
+    text = "İİİ diabetes no smoking"
+    mentions = FLAG_MATCHER.find(text)
+    assert [(m['term'], m['negated']) for m in mentions] == [('diabetes', False), ('smoking', True)]
+    for mention in mentions:
+        assert text[mention['start']:mention['end']] == mention['term']
+    assert FLAG_MATCHER.flags(text) == {'diabetes': True}
+
+
+def test_automaton_matches_every_occurrence():
+    automaton = KeywordAutomaton({'he': 1, 'she': 2, 'hers': 3})
+    assert sorted(automaton.iter_matches("uSHErs")) == [(1, 4, 2), (2, 4, 1), (2, 6, 3)]
@@ -0,0 +1,83 @@
+"""Nearest-neighbor member index"""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from neighbors import NeighborIndex, feature_matrix
+
+pytest.importorskip('sklearn')
+
+
+def cohort(rows=600, seed=11):
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        'patient_id': [f'M{number:04d}' for number in range(rows)],
+        'age': rng.integers(20, 90, rows),
+        'bmi': rng.uniform(18, 40, rows).round(1),
+        'glucose': rng.uniform(70, 220, rows).round(),
+        'bp_systolic': rng.integers(100, 180, rows),
+        'cholesterol': rng.uniform(140, 300, rows).round(),
+        'smoking': rng.random(rows) < 0.3,
+        'diabetes': rng.random(rows) < 0.2,
+    })
+
+
+PATIENT = {'age': 58, 'bmi': 31.0, 'glucose': 140, 'bp_systolic': 150, 'cholesterol': 240,
+           'smoking': True, 'diabetes': False}
+
+
+def brute_force(index, patient, k):
+    """Indices of the k nearest standardized vectors, by a full scan"""
+    vectors = index.standardize(index.features)
+    query = index.standardize(feature_matrix(patient))[0]
+    distances = np.sqrt(((vectors - query) ** 2).sum(axis=1))
+    order = np.argsort(distances, kind='stable')[:k]
+    return index.ids[order].tolist(), distances[order]
+
+
+def test_exact_search_matches_brute_force():
+    index = NeighborIndex.from_frame(cohort())
+    expected_ids, expected_distances = brute_force(index, PATIENT, 10)
+    found = index.query(PATIENT, k=10)
+    assert found['patient_id'].tolist() == expected_ids
+    np.testing.assert_allclose(found['distance'], expected_distances, rtol=1e-5)
+
+
+def test_ivf_search_matches_brute_force_when_every_cell_is_probed():
+    index = NeighborIndex.from_frame(cohort(), approximate=True)
+    index.searcher.probes = len(index.searcher.centroids)
+    expected_ids, expected_distances = brute_force(index, PATIENT, 10)
+    found = index.query(PATIENT, k=10)
+    assert found['patient_id'].tolist() == expected_ids
+    np.testing.assert_allclose(found['distance'], expected_distances, rtol=1e-5)
+
+
+def test_ivf_default_probes_find_most_true_neighbors():
+    index = NeighborIndex.from_frame(cohort(), approximate=True)
+    expected_ids, _ = brute_force(index, PATIENT, 10)
+    found = index.query(PATIENT, k=10)
+    assert np.all(np.diff(found['distance']) >= 0)
+    assert len(set(found['patient_id']) & set(expected_ids)) >= 8
+
+
+def test_csv_ids_with_gaps(tmp_path):
+    frame = cohort(rows=4).assign(patient_id=[101, None, 103, 104])
+    frame.to_csv(tmp_path / 'members.csv', index=False)
+    index = NeighborIndex.from_csv(str(tmp_path / 'members.csv'))
+    assert index.ids.tolist() == ['101', '', '103', '104']
+
+    found = index.query(PATIENT, k=4)
+    assert set(found['patient_id'].dropna()) == {'101', '103', '104'}
+    assert found['patient_id'].isna().sum() == 1
+
+
+def test_save_and_load(tmp_path):
+    path = str(tmp_path / 'index.npz')
+    for approximate in (False, True):
+        index = NeighborIndex.from_frame(cohort(rows=200), approximate=approximate)
+        index.save(path)
+        loaded = NeighborIndex.load(path)
+        assert loaded.approximate == approximate
+        pd.testing.assert_frame_equal(loaded.query(PATIENT, k=5), index.query(PATIENT, k=5))
+    assert NeighborIndex.load(str(tmp_path / 'missing.npz')) is None
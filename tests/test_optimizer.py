@@ -0,0 +1,46 @@
+"""Intervention portfolio optimizer"""
+
+import numpy as np
+import pytest
+
+from config import INTERVENTION_CATALOG
+from optimizer import NAMES, optimize_portfolio, plan_names
+
+GATED = [name for name in NAMES if INTERVENTION_CATALOG[name].get('requires')]
+RISKS = {'heart_disease': [0.4, 0.4], 'diabetes': [0.3, 0.3], 'hypertension': [0.5, 0.5]}
+BUDGET = sum(item['cost'] for item in INTERVENTION_CATALOG.values())
+
+
+def chosen(result, row):
+    return set(plan_names(result['plan'][row]))
+
+
+@pytest.mark.skipif(not GATED, reason="no intervention requires a patient flag")
+def test_missing_eligibility_flag_means_ineligible():
+    result = optimize_portfolio(RISKS, BUDGET)
+    assert not chosen(result, 0) & set(GATED)
+
+
+@pytest.mark.skipif(not GATED, reason="no intervention requires a patient flag")
+def test_eligibility_per_row():
+    flag = INTERVENTION_CATALOG[GATED[0]]['requires']
+    result = optimize_portfolio(RISKS, BUDGET, eligibility={flag: [True, False]})
+    assert GATED[0] in chosen(result, 0)
+    assert GATED[0] not in chosen(result, 1)
+
+
+def test_budget_and_objectives():
+    for objective in ['risk_reduction', 'cost_savings']:
+        result = optimize_portfolio(RISKS, 10000, objective)
+        assert (result['program_cost'] <= 10000).all()
+    assert optimize_portfolio(RISKS, 0)['plan'].tolist() == [0, 0]
+    with pytest.raises(ValueError):
+        optimize_portfolio(RISKS, 1000, 'fastest')
+
+
+def test_shards_match_a_single_pass():
+    rng = np.random.default_rng(3)
+    risks = {disease: rng.uniform(0.05, 0.8, 50) for disease in RISKS}
+    whole = optimize_portfolio(risks, 30000, chunk=50)
+    sharded = optimize_portfolio(risks, 30000, chunk=7)
+    np.testing.assert_array_equal(whole['plan'], sharded['plan'])
@@ -0,0 +1,61 @@
+"""Multi-core cohort scoring"""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from cohort_arrays import OUTPUT_COLUMNS, csv_to_arrays, open_outputs, score_arrays
+from parallel_scoring import score_parallel
+
+
+def member_csv(path, rows=300):
+    rng = np.random.default_rng(7)
+    frame = pd.DataFrame({
+        'Member ID': np.arange(rows),
+        'Age': rng.integers(20, 90, rows),
+        'Fasting Glucose': rng.uniform(70, 220, rows),
+        'Blood Pressure': [f'{s}/{d}' for s, d in zip(rng.integers(100, 180, rows), rng.integers(60, 110, rows))],
+        'Cholesterol': rng.uniform(140, 300, rows),
+        'Weight': rng.uniform(50, 120, rows),
+        'Height': rng.uniform(150, 195, rows),
+        'Smoking': rng.choice(['yes', 'no', 'Y', 'N'], rows),
+        'Diabetes': rng.choice(['true', 'false'], rows),
+    })
+    frame.loc[::7, 'Fasting Glucose'] = np.nan
+    frame.to_csv(path, index=False)
+    return path
+
+
+def test_frame_matches_score_arrays(tmp_path):
+    csv = member_csv(tmp_path / 'members.csv')
+    csv_to_arrays(str(csv), str(tmp_path / 'features'))
+    rows = score_arrays(str(tmp_path / 'features'), str(tmp_path / 'scores'), window=64)
+    expected = open_outputs(str(tmp_path / 'scores'), rows)
+
+    # Raw CSV headers, string flags and "120/80" blood pressure, like an upload
+    scored = score_parallel(pd.read_csv(csv), workers=2, window=64)
+    assert set(scored) == set(OUTPUT_COLUMNS)
+    for key in OUTPUT_COLUMNS:
+        np.testing.assert_allclose(scored[key], expected[key], rtol=1e-6, err_msg=key)
+
+
+def test_directory_source_and_destination(tmp_path):
+    csv = member_csv(tmp_path / 'members.csv', rows=50)
+    csv_to_arrays(str(csv), str(tmp_path / 'features'))
+    scored = score_parallel(str(tmp_path / 'features'), workers=1, destination=str(tmp_path / 'out'))
+    written = open_outputs(str(tmp_path / 'out'), 50)
+    np.testing.assert_array_equal(written['health_score'], scored['health_score'])
+
+
+def test_rows_come_from_the_frame(tmp_path):
+    # Only a feature the scorer derives (BMI from weight and height)
+    frame = pd.DataFrame({'Weight': [70.0, 95.0, 120.0], 'Height': [175.0, 175.0, 175.0]})
+    scored = score_parallel(frame, workers=1)
+    assert len(scored['health_score']) == 3
+    assert scored['diabetes_risk'][2] > scored['diabetes_risk'][0]
+
+
+def test_frame_without_features_is_refused():
+    with pytest.raises(ValueError, match='No feature columns'):
+        score_parallel(pd.DataFrame({'member': [1, 2], 'plan': ['a', 'b']}), workers=1)
+    assert len(score_parallel(pd.DataFrame({'age': []}), workers=1)['health_score']) == 0
@@ -0,0 +1,66 @@
+"""PDF text and lab table extraction"""
+
+import pytest
+
+from analysis import EnhancedMedicalReportAnalyzer
+from pdf_extract import extract_text, lab_rows
+
+pytest.importorskip('pdfplumber')
+
+ROWS = [['Test', 'Result', 'Unit', 'Reference Range'],
+        ['Glucose', '132', 'mg/dL', '70-100'],
+        ['Creatinine', '1.4', 'mg/dL', '0.6-1.2'],
+        ['Cholesterol', '241', 'mg/dL', '<200']]
+
+
+def write_pdf(path, rows, ruled):
+    """One-page PDF with a lab table, with or without cell borders"""
+    x0, widths, height, top = 50, [160, 90, 80, 110], 20, 700
+    xs = [x0]
+    for width in widths:
+        xs.append(xs[-1] + width)
+    parts = ["BT /F1 14 Tf 50 750 Td (Lab Report) Tj ET", "0.5 w"]
+    if ruled:
+        for i in range(len(rows) + 1):
+            parts.append(f"{xs[0]} {top - i * height} m {xs[-1]} {top - i * height} l S")
+        for x in xs:
+            parts.append(f"{x} {top} m {x} {top - len(rows) * height} l S")
+    for i, row in enumerate(rows):
+        for j, cell in enumerate(row):
+            parts.append(f"BT /F1 10 Tf {xs[j] + 4} {top - (i + 1) * height + 6} Td ({cell}) Tj ET")
+    content = '\n'.join(parts)
+    objects = ["<< /Type /Catalog /Pages 2 0 R >>", "<< /Type /Pages /Kids [4 0 R] /Count 1 >>",
+               "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+               "<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+               "/Resources << /Font << /F1 3 0 R >> >> /Contents 5 0 R >>",
+               f"<< /Length {len(content)} >>\nstream\n{content}\nendstream"]
+    out, offsets = "%PDF-1.4\n", []
+    for number, body in enumerate(objects, 1):
+        offsets.append(len(out))
+        out += f"{number} 0 obj\n{body}\nendobj\n"
+    xref = len(out)
+    out += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n" + ''.join(f"{o:010d} 00000 n \n" for o in offsets)
+    out += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n"
+    path.write_text(out)
+    return str(path)
+
+
+def test_lab_rows_with_headers():
+    rows = lab_rows(ROWS)
+    assert [(row['analyte'], row['value'], row['unit']) for row in rows] == [
+        ('Glucose', 132, 'mg/dL'), ('Creatinine', 1.4, 'mg/dL'), ('Cholesterol', 241, 'mg/dL')]
+    assert rows[0]['reference_range'] == '70-100'
+
+
+@pytest.mark.parametrize('ruled', [True, False], ids=['ruled', 'whitespace'])
+def test_tables_are_found(tmp_path, ruled):
+    result = extract_text(write_pdf(tmp_path / 'report.pdf', ROWS, ruled), tables=True)
+    values = {row['analyte']: row['value'] for row in result['lab_rows']}
+    assert values == {'Glucose': 132, 'Creatinine': 1.4, 'Cholesterol': 241}
+
+
+def test_text_regexes_skip_table_values():
+    text = "Glucose: 99\nAge: 61\nBP: 140/90"
+    parsed = EnhancedMedicalReportAnalyzer.parse_medical_report(text, skip={'glucose': 132})
+    assert 'glucose' not in parsed
+    assert parsed['age'] == 61 and parsed['bp_systolic'] == 140
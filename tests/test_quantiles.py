@@ -0,0 +1,83 @@
+"""KLL population percentile sketches"""
+
+import numpy as np
+import pytest
+
+from quantiles import KLLSketch, METRICS, PopulationSketches
+
+# Rank error bound in percentile points (~1.7 / K)
+BOUND = 100 * 1.7 / 200
+
+
+def exact_percentiles(data, values):
+    ordered = np.sort(data)
+    below = np.searchsorted(ordered, values, side='left')
+    at_or_below = np.searchsorted(ordered, values, side='right')
+    return 100 * (below + at_or_below) / 2 / len(data)
+
+
+def max_rank_error(sketch, data):
+    probes = np.quantile(data, np.linspace(0.001, 0.999, 999))
+    estimated = np.array([sketch.percentile(value) for value in probes])
+    return np.abs(estimated - exact_percentiles(data, probes)).max()
+
+
+@pytest.fixture(scope='module')
+def stream():
+    return np.random.default_rng(0).normal(size=1_000_000)
+
+
+def test_rank_error_within_bound(stream):
+    sketch = KLLSketch(200)
+    for chunk in np.array_split(stream, 200):
+        sketch.update(chunk)
+    assert sketch.count == len(stream)
+    assert max_rank_error(sketch, stream) < BOUND
+    # The sketch uses the room it has rather than compacting early
+    assert sum(len(items) for items in sketch.levels) > 400
+
+
+def test_small_streams_are_exact():
+    data = np.arange(100, dtype=float)
+    sketch = KLLSketch(200).update(data)
+    np.testing.assert_allclose([sketch.percentile(v) for v in data], exact_percentiles(data, data))
+    assert np.isnan(KLLSketch().percentile(1.0))
+
+
+def test_merge_matches_a_single_stream(stream):
+    data = stream[:200_000]
+    whole = KLLSketch(200)
+    parts = [KLLSketch(200, seed=seed) for seed in range(4)]
+    for index, chunk in enumerate(np.array_split(data, 40)):
+        whole.update(chunk)
+        parts[index % 4].update(chunk)
+    merged = parts[0]
+    for part in parts[1:]:
+        merged.merge(part)
+
+    assert merged.count == whole.count == len(data)
+    assert max_rank_error(merged, data) < BOUND
+    assert abs(merged.quantile(0.5) - whole.quantile(0.5)) < 0.05
+    # Merging sketches that fit without compaction loses nothing
+    small = KLLSketch(200).update(data[:50]).merge(KLLSketch(200).update(data[50:100]))
+    np.testing.assert_array_equal(np.sort(small.levels[0]), np.sort(data[:100]))
+
+
+def test_save_and_load_round_trip(tmp_path, stream):
+    sketches = PopulationSketches()
+    rng = np.random.default_rng(1)
+    for _ in range(20):
+        sketches.update({'health_score': rng.integers(0, 101, 5000),
+                         **{metric: rng.random(5000) for metric in METRICS[1:]}})
+    path = str(tmp_path / 'sketches.npz')
+    sketches.save(path)
+    loaded = PopulationSketches.load(path)
+
+    assert loaded.count == sketches.count == 100_000
+    for metric in METRICS:
+        original, restored = sketches.sketches[metric], loaded.sketches[metric]
+        assert restored.k == original.k
+        for a, b in zip(original.levels, restored.levels):
+            np.testing.assert_array_equal(a, b)
+        assert loaded.percentile(metric, 0.5) == sketches.percentile(metric, 0.5)
+    assert PopulationSketches.load(str(tmp_path / 'missing.npz')) is None
@@ -0,0 +1,83 @@
+"""Full-text report index"""
+
+import sqlite3
+
+import pytest
+
+from report_index import ReportIndex, match_query, snippet
+
+
+@pytest.fixture
+def index(tmp_path):
+    return ReportIndex(str(tmp_path / 'reports.sqlite3'), str(tmp_path / 'text'))
+
+
+def filler(number):
+    return f"Routine panel {number}. Creatinine within normal limits. Glucose normal."
+
+
+def test_add_is_idempotent_and_searchable(index):
+    pages = [(1, "Serum creatinine 1.4 mg/dL, elevated"), (2, "ECG: ST segment depression")]
+    report_id = index.add(pages, 'a.pdf', 'PAT-2024-001')
+    assert index.add(pages, 'a.pdf', 'PAT-2024-001') == report_id
+    assert index.counts() == (1, 2)
+
+    hits = index.search('"ST segment"')
+    assert [(hit['report_id'], hit['page']) for hit in hits] == [(report_id, 2)]
+    assert '**ST segment**' in hits[0]['snippet']
+    assert index.report_text(report_id).startswith('Serum creatinine')
+
+
+def test_patient_filter(index):
+    index.add([(1, "HbA1c 8.1 %")], 'a.pdf', 'PAT-2024-001')
+    index.add([(1, "HbA1c 5.2 %")], 'b.pdf', 'PAT-2024-002')
+    assert len(index.search('hba1c')) == 2
+    hits = index.search('hba1c', patient_id='PAT-2024-002')
+    assert [hit['file_name'] for hit in hits] == ['b.pdf']
+
+
+def test_old_reports_are_ranked_by_default(index):
+    best = index.add([(1, "Creatinine creatinine creatinine 3.2, acute kidney injury")], 'old.pdf')
+    for number in range(60):
+        index.add([(1, filler(number))], f'{number}.pdf')
+
+    assert index.search('creatinine', limit=1)[0]['report_id'] == best
+    # The recency cutoff only ranks the newest matching pages
+    recent = index.search('creatinine', limit=5, candidates=10)
+    assert best not in [hit['report_id'] for hit in recent]
+
+
+def test_query_syntax_is_quoted(index):
+    index.add([(1, "ST-segment elevation, troponin 1.4")], 'a.pdf')
+    assert match_query('ST-segment 1.4') == '"ST-segment" AND "1.4"'
+    assert len(index.search('ST-segment 1.4')) == 1
+    assert index.search('"') == []
+    assert index.search('AND OR NOT (') == []
+
+
+def test_snippet_marks_matches():
+    text = "x " * 200 + "Creatinine 1.4 mg/dL" + " y" * 200
+    window = snippet(text, 'creatinine')
+    assert '**Creatinine**' in window and window.startswith('…') and window.endswith('…')
+
+
+def test_index_failure_does_not_fail_analysis(monkeypatch, caplog):
+    import analysis
+
+    def broken(path):
+        raise sqlite3.OperationalError('database is locked')
+
+    monkeypatch.setattr(analysis, 'open_index', broken)
+    with caplog.at_level('ERROR', logger='analysis'):
+        report_id = analysis.EnhancedMedicalReportAnalyzer.index_report([(1, 'text')], 'a.pdf', 'text')
+    assert report_id is None
+    assert 'a.pdf' in caplog.text
+
+
+def test_newer_schema_is_refused(tmp_path):
+    db_path = str(tmp_path / 'reports.sqlite3')
+    connection = sqlite3.connect(db_path)
+    connection.execute("PRAGMA user_version = 99")
+    connection.close()
+    with pytest.raises(RuntimeError, match='newer'):
+        ReportIndex(db_path)
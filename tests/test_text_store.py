@@ -0,0 +1,158 @@
+"""Compressed append-only record store"""
+
+import json
+import random
+import threading
+
+import pytest
+
+from text_store import INDEX_DTYPE, TextStore
+
+
+def lab_report(number):
+    rng = random.Random(number)
+    lines = ["MediLabs Diagnostics - Department of Clinical Pathology",
+             f"Patient ID: PAT-{number:06d}   Age: {rng.randint(20, 90)}",
+             "Test  Result  Unit  Reference Range"]
+    for name in ['Glucose', 'Creatinine', 'Cholesterol', 'HDL', 'LDL', 'Triglycerides', 'HbA1c']:
+        lines.append(f"{name}  {rng.uniform(0.5, 250):.1f}  mg/dL  {rng.randint(1, 99)}-{rng.randint(100, 200)}")
+    lines.append("This report is electronically verified and does not require a signature.")
+    return '\n'.join(lines)
+
+
+def record(number):
+    return {'file_name': f'{number}.pdf', 'pages': [[1, lab_report(number)]]}
+
+
+@pytest.fixture
+def store_dir(tmp_path):
+    return str(tmp_path)
+
+
+def test_round_trip_and_duplicates(store_dir):
+    store = TextStore(store_dir, train_after=50)
+    for number in range(120):
+        assert store.put(f'r{number}', record(number))
+    assert not store.put('r7', {'other': True})
+
+    assert store.get('r7') == json.loads(json.dumps(record(7)))
+    assert store.get('missing') is None
+    assert len(store) == 120 and 'r119' in store
+
+
+def test_dictionary_is_trained_and_shrinks_records(store_dir):
+    store = TextStore(store_dir, train_after=100)
+    for number in range(300):
+        store.put(f'r{number}', record(number))
+
+    entries = store._entries
+    assert entries['dictionary'][:100].max() == 0
+    assert entries['dictionary'][100:].min() == 1
+    before = entries['length'][:100].mean()
+    after = entries['length'][100:].mean()
+    assert after < before * 0.8
+    assert store.get('r250') == json.loads(json.dumps(record(250)))
+
+
+def test_reopened_store_and_other_writers(store_dir):
+    writer = TextStore(store_dir, train_after=50)
+    reader = TextStore(store_dir)
+    writer.put('a', record(1))
+    assert reader.get('a')['file_name'] == '1.pdf'
+    # Entries appended after the reader loaded its index are picked up on demand
+    for number in range(100):
+        writer.put(f'r{number}', record(number))
+    assert reader.get('r99')['file_name'] == '99.pdf'
+    assert TextStore(store_dir).stats()['records'] == 101
+
+
+def test_segments_rotate(store_dir):
+    store = TextStore(store_dir, segment_bytes=2000)
+    for number in range(40):
+        store.put(f'r{number}', record(number))
+    assert store._entries['segment'].max() > 0
+    assert all(store.get(f'r{number}')['file_name'] == f'{number}.pdf' for number in range(40))
+
+
+def test_concurrent_reads_and_writes(store_dir):
+    store = TextStore(store_dir, train_after=100)
+    for number in range(500):
+        store.put(f'r{number}', record(number))
+    expected = {number: lab_report(number) for number in range(500)}
+    errors = []
+
+    def read(seed):
+        rng = random.Random(seed)
+        try:
+            for _ in range(400):
+                number = rng.randrange(500)
+                if store.get(f'r{number}')['pages'][0][1] != expected[number]:
+                    errors.append(f'wrong text for r{number}')
+        except Exception as e:
+            errors.append(repr(e))
+
+    def write(start):
+        try:
+            for number in range(start, start + 50):
+                store.put(f'w{number}', record(number))
+        except Exception as e:
+            errors.append(repr(e))
+
+    threads = [threading.Thread(target=read, args=(seed,)) for seed in range(8)]
+    threads += [threading.Thread(target=write, args=(start,)) for start in (0, 25)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    assert len(store) == 575
+    assert store.get('w74')['file_name'] == '74.pdf'
+
+
+def test_torn_index_tail_is_dropped(store_dir):
+    import os
+
+    store = TextStore(store_dir)
+    store.put('a', record(1))
+    # A crash mid-append leaves part of an index entry behind
+    with open(os.path.join(store_dir, 'index.bin'), 'ab') as handle:
+        handle.write(b'\x01' * 10)
+
+    store = TextStore(store_dir)
+    assert store.put('b', record(2))
+    assert store.get('b')['file_name'] == '2.pdf'
+    assert TextStore(store_dir).get('b')['file_name'] == '2.pdf'
+    assert len(TextStore(store_dir)) == 2
+
+
+def test_long_keys_are_rejected(store_dir):
+    store = TextStore(store_dir)
+    assert store.put('k' * 32, record(1))
+    with pytest.raises(ValueError):
+        store.put('k' * 33, record(2))
+    with pytest.raises(ValueError):
+        store.put('é' * 17, record(3))
+    assert len(store) == 1
+
+
+def test_zlib_stores_are_read_only(tmp_path):
+    import zlib
+
+    import numpy as np
+
+    # Layout of a store written with zlib, one record with a dictionary
+    dictionary = b'Reference Range mg/dL Glucose Creatinine'
+    payload = json.dumps(record(5), separators=(',', ':')).encode()
+    compressor = zlib.compressobj(9, zdict=dictionary)
+    data = compressor.compress(payload) + compressor.flush()
+    (tmp_path / 'store.json').write_text(json.dumps({'codec': 'zlib'}))
+    (tmp_path / 'dict-0001.bin').write_bytes(dictionary)
+    (tmp_path / 'segment-00000.dat').write_bytes(data)
+    (tmp_path / 'index.bin').write_bytes(
+        np.array([(b'r5', 0, 0, len(data), len(payload), 1)], dtype=INDEX_DTYPE).tobytes())
+
+    store = TextStore(str(tmp_path))
+    assert store.get('r5') == json.loads(payload)
+    with pytest.raises(RuntimeError, match='read-only'):
+        store.put('r6', record(6))
@@ -0,0 +1,267 @@
+"""
+Compressed append-only record store
+Each record is compressed on its own with a shared trained dictionary and
+appended to segment files; an offset index gives random access to one record
+"""
+
+import json
+import os
+import sys
+import threading
+import zlib
+from contextlib import contextmanager
+
+import numpy as np
+import zstandard
+
+from config import (
+    TEXT_STORE_LEVEL, TEXT_STORE_DICT_SIZE, TEXT_STORE_TRAIN_AFTER,
+    TEXT_STORE_SEGMENT_BYTES
+)
+
+try:
+    import fcntl
+except ImportError:      # Windows: only threads of one process are serialized
+    fcntl = None
+
+# One fixed-size entry per record, appended after the record's bytes are written
+INDEX_DTYPE = np.dtype([
+    ('key', 'S32'),
+    ('segment', '<u4'),
+    ('offset', '<u8'),
+    ('length', '<u4'),
+    ('raw_length', '<u4'),
+    ('dictionary', '<u2')      # 0 = no dictionary
+])
+
+class TextStore:
+    """Append-only store of JSON records keyed by a short string id
+
+    Layout of `directory`: store.json (codec), index.bin (INDEX_DTYPE
+    entries), dict-NNNN.bin (trained dictionaries) and segment-NNNNN.dat
+    (concatenated compressed records). Nothing is rewritten in place, so
+    readers in other processes only ever see whole records.
+
+    Records are written with zstd. Stores written with zlib (before
+    zstandard was required) can still be read, but not appended to.
+    """
+
+    def __init__(self, directory, level=TEXT_STORE_LEVEL,
+                 train_after=TEXT_STORE_TRAIN_AFTER, segment_bytes=TEXT_STORE_SEGMENT_BYTES):
+        self.directory = directory
+        self.level = level
+        self.train_after = train_after
+        self.segment_bytes = segment_bytes
+        os.makedirs(directory, exist_ok=True)
+
+        meta_path = os.path.join(directory, 'store.json')
+        if os.path.exists(meta_path):
+            with open(meta_path) as handle:
+                self.codec = json.load(handle)['codec']
+        else:
+            self.codec = 'zstd'
+            with open(meta_path + '.tmp', 'w') as handle:
+                json.dump({'codec': self.codec}, handle)
+            os.replace(meta_path + '.tmp', meta_path)
+
+        self._lock = threading.Lock()
+        self._index_lock = threading.Lock()
+        self._entries = np.empty(0, dtype=INDEX_DTYPE)
+        self._positions = {}
+        self._dictionary_lock = threading.Lock()
+        self._dictionaries = {}
+        # zstd (de)compression contexts are not thread-safe: one set per thread
+        self._codecs = threading.local()
+
+    # ---------- index ----------
+
+    def _path(self, name):
+        return os.path.join(self.directory, name)
+
+    def _refresh(self):
+        """Pick up index entries appended since the last read (possibly by other processes)"""
+        path = self._path('index.bin')
+        if not os.path.exists(path):
+            return
+        with self._index_lock:
+            known = len(self._entries)
+            with open(path, 'rb') as handle:
+                handle.seek(known * INDEX_DTYPE.itemsize)
+                tail = handle.read()
+            # A writer may be mid-append; only whole entries are used
+            count = len(tail) // INDEX_DTYPE.itemsize
+            if not count:
+                return
+            new = np.frombuffer(tail[:count * INDEX_DTYPE.itemsize], dtype=INDEX_DTYPE)
+            self._positions.update(zip(new['key'].tolist(), range(known, known + count)))
+            self._entries = np.concatenate([self._entries, new])
+
+    def __contains__(self, key):
+        self._refresh()
+        return key.encode() in self._positions
+
+    def __len__(self):
+        self._refresh()
+        return len(self._entries)
+
+    # ---------- dictionaries ----------
+
+    def _dictionary(self, dictionary_id):
+        with self._dictionary_lock:
+            if dictionary_id not in self._dictionaries:
+                with open(self._path(f'dict-{dictionary_id:04d}.bin'), 'rb') as handle:
+                    self._dictionaries[dictionary_id] = handle.read()
+            return self._dictionaries[dictionary_id]
+
+    def _codec(self, kind, dictionary_id):
+        """This thread's zstd compressor or decompressor for a dictionary"""
+        codecs = getattr(self._codecs, kind, None)
+        if codecs is None:
+            codecs = {}
+            setattr(self._codecs, kind, codecs)
+        if dictionary_id not in codecs:
+            dictionary = (zstandard.ZstdCompressionDict(self._dictionary(dictionary_id))
+                          if dictionary_id else None)
+            if kind == 'compressors':
+                codecs[dictionary_id] = zstandard.ZstdCompressor(
+                    level=self.level, dict_data=dictionary, write_content_size=True, write_checksum=False
+                )
+            else:
+                codecs[dictionary_id] = zstandard.ZstdDecompressor(dict_data=dictionary)
+        return codecs[dictionary_id]
+
+    def _latest_dictionary(self):
+        """Highest trained dictionary id, 0 if none"""
+        ids = [int(name[5:9]) for name in os.listdir(self.directory)
+               if name.startswith('dict-') and name.endswith('.bin')]
+        return max(ids, default=0)
+
+    def train(self, samples, size=TEXT_STORE_DICT_SIZE):
+        """Train a shared dictionary from sample payloads, used for every later record
+
+        Returns the new dictionary id. Earlier records keep the dictionary
+        they were written with.
+        """
+        samples = [sample if isinstance(sample, bytes) else sample.encode() for sample in samples]
+        data = zstandard.train_dictionary(size, samples, level=self.level).as_bytes()
+
+        dictionary_id = self._latest_dictionary() + 1
+        path = self._path(f'dict-{dictionary_id:04d}.bin')
+        with open(path + '.tmp', 'wb') as handle:
+            handle.write(data)
+        os.replace(path + '.tmp', path)
+        return dictionary_id
+
+    def _compress(self, payload, dictionary_id):
+        return self._codec('compressors', dictionary_id).compress(payload)
+
+    def _decompress(self, data, dictionary_id, raw_length):
+        if self.codec == 'zstd':
+            return self._codec('decompressors', dictionary_id).decompress(data, max_output_size=raw_length)
+        # Read fallback for stores written with zlib
+        if dictionary_id:
+            decompressor = zlib.decompressobj(zdict=self._dictionary(dictionary_id))
+        else:
+            decompressor = zlib.decompressobj()
+        return decompressor.decompress(data) + decompressor.flush()
+
+    # ---------- records ----------
+
+    @contextmanager
+    def _locked(self):
+        """Exclusive writer lock across threads and (where supported) processes"""
+        with self._lock, open(self._path('write.lock'), 'a') as handle:
+            if fcntl is not None:
+                fcntl.flock(handle, fcntl.LOCK_EX)
+            yield
+
+    def put(self, key, record):
+        """Store a JSON-serializable record under key; returns False if key already exists
+
+        Keys are at most 32 bytes of UTF-8 (the index key field); longer ones
+        raise ValueError.
+        """
+        encoded = key.encode()
+        if len(encoded) > INDEX_DTYPE['key'].itemsize:
+            raise ValueError(f"Key {key!r} is longer than {INDEX_DTYPE['key'].itemsize} bytes")
+        payload = json.dumps(record, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+        if self.codec != 'zstd':
+            raise RuntimeError(f"{self.directory} is a read-only {self.codec} store; "
+                               f"new records need a new (zstd) store")
+        with self._locked():
+            self._refresh()
+            if encoded in self._positions:
+                return False
+
+            dictionary_id = self._latest_dictionary()
+            if not dictionary_id and len(self._entries) and len(self._entries) % self.train_after == 0:
+                # The records so far are the training samples for the shared dictionary;
+                # too little sample data just means another try train_after records later
+                samples = [self._read(position) for position in range(len(self._entries))]
+                try:
+                    dictionary_id = self.train(samples)
+                except Exception:
+                    dictionary_id = 0
+            data = self._compress(payload, dictionary_id)
+
+            segment, offset = 0, 0
+            if len(self._entries):
+                last = self._entries[-1]
+                segment, offset = int(last['segment']), int(last['offset'] + last['length'])
+                if offset + len(data) > self.segment_bytes:
+                    segment, offset = segment + 1, 0
+
+            # Record bytes first, then the index entry, so the index never
+            # points at data that is not on disk
+            with open(self._path(f'segment-{segment:05d}.dat'), 'ab') as handle:
+                handle.truncate(offset)     # drop bytes of an interrupted write
+                handle.write(data)
+            entry = np.array([(encoded, segment, offset, len(data), len(payload), dictionary_id)],
+                             dtype=INDEX_DTYPE)
+            with open(self._path('index.bin'), 'ab') as handle:
+                # Drop a partial entry left by an interrupted append
+                handle.truncate(len(self._entries) * INDEX_DTYPE.itemsize)
+                handle.write(entry.tobytes())
+            self._refresh()
+        return True
+
+    def _read(self, position):
+        entry = self._entries[position]
+        with open(self._path(f"segment-{int(entry['segment']):05d}.dat"), 'rb') as handle:
+            handle.seek(int(entry['offset']))
+            data = handle.read(int(entry['length']))
+        return self._decompress(data, int(entry['dictionary']), int(entry['raw_length']))
+
+    def get(self, key):
+        """Record stored under key (only that record is read and decompressed), or None"""
+        encoded = key.encode()
+        position = self._positions.get(encoded)
+        if position is None:
+            self._refresh()
+            position = self._positions.get(encoded)
+            if position is None:
+                return None
+        return json.loads(self._read(position))
+
+    def stats(self):
+        """Record count, raw and stored bytes and the compression ratio"""
+        self._refresh()
+        raw = int(self._entries['raw_length'].sum())
+        stored = int(self._entries['length'].sum())
+        return {
+            'records': len(self._entries),
+            'raw_bytes': raw,
+            'stored_bytes': stored,
+            'ratio': raw / stored if stored else 0.0,
+            'codec': self.codec
+        }
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2:
+        print('Usage: python text_store.py <store directory>')
+        sys.exit(1)
+    store = TextStore(sys.argv[1])
+    stats = store.stats()
+    print(f"{stats['records']:,} records, {stats['raw_bytes'] / 1e6:,.1f} MB raw -> "
+          f"{stats['stored_bytes'] / 1e6:,.1f} MB stored ({stats['ratio']:.1f}x, {stats['codec']})")
@@ -0,0 +1,106 @@
+"""
+Unit normalization for extracted and uploaded lab values
+Converts values to the canonical units the scorers expect (mg/dL, kg, cm, mmHg)
+"""
+
+import re
+
+import numpy as np
+import pandas as pd
+
+from config import UNIT_CONVERSIONS, UNIT_INFERENCE
+
+# "Weight (lbs)", "glucose_mmol_l" -> column suffix of the unit
+SUFFIXES = {
+    feature: {re.sub(r'[^a-z0-9]+', '_', unit).strip('_'): unit for unit in factors}
+    for feature, (_, factors) in UNIT_CONVERSIONS.items()
+}
+
+
+def unit_key(unit):
+    """Lookup key for a unit string ('mmol/L' -> 'mmol/l')"""
+    return str(unit).replace(' ', '').lower()
+
+
+def factor(feature, unit):
+    """Multiplier converting `unit` to the feature's canonical unit (None if unknown)"""
+    spec = UNIT_CONVERSIONS.get(feature)
+    if spec is None or not unit:
+        return None
+    return spec[1].get(unit_key(unit))
+
+
+def _inferred_factor(feature, value):
+    """Factor implied by an implausible unitless value, or 1.0"""
+    rule = UNIT_INFERENCE.get(feature)
+    if rule is None:
+        return 1.0
+    bound, side, unit = rule
+    if (value < bound) if side == 'below' else (value > bound):
+        return UNIT_CONVERSIONS[feature][1][unit]
+    return 1.0
+
+
+def normalize_record(record, units=None):
+    """Convert one patient dict to canonical units
+
+    units maps features to the unit they were reported in; unknown or missing
+    units fall back to plausibility inference (e.g. glucose 6.1 -> mmol/L).
+    """
+    units = units or {}
+    normalized = dict(record)
+    for feature in UNIT_CONVERSIONS:
+        value = normalized.get(feature)
+        if value is None or isinstance(value, bool):
+            continue
+        scale = factor(feature, units.get(feature)) or _inferred_factor(feature, value)
+        if scale != 1.0:
+            normalized[feature] = round(value * scale, 1)
+    return normalized
+
+
+def normalize_frame(frame):
+    """Convert a patient DataFrame to canonical units with column-wise operations
+
+    Units are taken from a '<feature>_unit' column (per row) or from a unit
+    suffix on the column name ('weight_lbs', 'glucose_mmol_l'); values without
+    a unit use plausibility inference. Columns are replaced on `frame` itself.
+    """
+    for feature, suffixes in SUFFIXES.items():
+        if feature in frame.columns:
+            continue
+        for suffix, unit in suffixes.items():
+            column = f'{feature}_{suffix}'
+            if column in frame.columns:
+                values = pd.to_numeric(frame[column], errors='coerce')
+                frame[feature] = (values * UNIT_CONVERSIONS[feature][1][unit]).round(1)
+                frame = frame.drop(columns=column)
+                break
+
+    for feature, (_, factors) in UNIT_CONVERSIONS.items():
+        if feature not in frame.columns:
+            continue
+        values = pd.to_numeric(frame[feature], errors='coerce').to_numpy(dtype=np.float64)
+        scale = np.ones(len(values))
+
+        unit_column = f'{feature}_unit'
+        if unit_column in frame.columns:
+            keys = frame[unit_column].astype(str).str.replace(' ', '', regex=False).str.lower()
+            scale = keys.map(factors).to_numpy(dtype=np.float64, na_value=np.nan, copy=True)
+            known = ~np.isnan(scale)
+            scale[~known] = 1.0
+        else:
+            known = np.zeros(len(values), dtype=bool)
+
+        rule = UNIT_INFERENCE.get(feature)
+        if rule is not None:
+            bound, side, unit = rule
+            implausible = values < bound if side == 'below' else values > bound
+            scale = np.where(~known & implausible, factors[unit], scale)
+
+        converted = scale != 1.0
+        if converted.any():
+            # Only converted rows are rounded, so results do not depend on chunking
+            frame[feature] = np.where(converted, np.round(values * scale, 1), values)
+
+    return frame
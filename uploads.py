@@ -0,0 +1,166 @@
+"""
+Upload handling without extra copies
+Zero-copy views of in-memory uploads, spill-to-disk and memory mapping for large files
+"""
+
+import io
+import mmap
+import os
+import tempfile
+
+from config import UPLOAD_SPOOL_THRESHOLD, UPLOAD_SPOOL_DIR
+
+SPOOL_CHUNK = 1024 * 1024
+
+
+class MemoryViewReader(io.RawIOBase):
+    """Seekable read-only file object over a buffer, copying only what is read"""
+
+    def __init__(self, view, name=None):
+        self._view = memoryview(view)
+        self._pos = 0
+        self.name = name
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def readinto(self, buffer):
+        count = min(len(buffer), len(self._view) - self._pos)
+        if count <= 0:
+            return 0
+        buffer[:count] = self._view[self._pos:self._pos + count]
+        self._pos += count
+        return count
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self._pos
+        elif whence == io.SEEK_END:
+            offset += len(self._view)
+        self._pos = max(0, offset)
+        return self._pos
+
+    def tell(self):
+        return self._pos
+
+    def close(self):
+        self._view.release()
+        super().close()
+
+
+class UploadBuffer:
+    """Read-only view of an uploaded file, in memory or spooled to disk
+
+    Small uploads are exposed through getbuffer() without copying. Uploads
+    above the spool threshold (or when a path is needed) are written to a
+    temp file in chunks and memory-mapped, so parsers read from the page
+    cache instead of private heap copies.
+    """
+
+    def __init__(self, file, spool_threshold=UPLOAD_SPOOL_THRESHOLD, spool_dir=UPLOAD_SPOOL_DIR):
+        self.name = getattr(file, 'name', 'upload')
+        self._file = file
+        self._spool_dir = spool_dir
+        self._source = self._buffer_of(file)
+        self.size = len(self._source)
+        self._mmap = None
+        self._readers = []
+        self.path = None
+        self._owns_path = False
+
+        if self.size > spool_threshold:
+            self._spool()
+
+    @staticmethod
+    def _buffer_of(file):
+        """Zero-copy memoryview of a BytesIO-like upload (falls back to one read)"""
+        if hasattr(file, 'getbuffer'):
+            return file.getbuffer()
+        file.seek(0)
+        return memoryview(file.read())
+
+    @classmethod
+    def from_path(cls, path, name=None):
+        """Memory-map a file that is already on disk"""
+        upload = cls.__new__(cls)
+        upload.name = name or os.path.basename(path)
+        upload._file = None
+        upload._spool_dir = None
+        upload._readers = []
+        upload._mmap = None
+        upload.path = path
+        upload._owns_path = False
+        upload.size = os.path.getsize(path)
+        upload._map()
+        return upload
+
+    def _spool(self):
+        """Write the upload to a temp file and replace the in-memory view with a mapping"""
+        suffix = os.path.splitext(self.name)[1]
+        handle, path = tempfile.mkstemp(prefix='mediprecog_', suffix=suffix, dir=self._spool_dir)
+        with os.fdopen(handle, 'wb') as out:
+            for start in range(0, self.size, SPOOL_CHUNK):
+                out.write(self._source[start:start + SPOOL_CHUNK])
+
+        # Open readers keep their own view of the old buffer alive
+        if not self._readers:
+            self._source.release()
+        self.path = path
+        self._owns_path = True
+        self._map()
+
+    def _map(self):
+        """Memory-map self.path read-only"""
+        if self.size == 0:
+            self._source = memoryview(b'')
+            return
+        with open(self.path, 'rb') as handle:
+            self._mmap = mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ)
+        self._source = memoryview(self._mmap)
+
+    @property
+    def view(self):
+        """memoryview over the whole upload"""
+        return self._source
+
+    def open(self):
+        """Seekable binary file object over the upload (for pdfplumber, Pillow, ...)"""
+        reader = MemoryViewReader(self._source, name=self.name)
+        self._readers.append(reader)
+        return reader
+
+    def text(self, encoding='utf-8', errors='replace'):
+        """Decode the upload straight from the buffer (no intermediate bytes copy)"""
+        return str(self._source, encoding, errors)
+
+    def as_path(self):
+        """Path of a file holding the upload, spooling it if necessary"""
+        if self.path is None:
+            self._spool()
+        return self.path
+
+    def close(self):
+        """Release views, unmap and delete any spooled file"""
+        for reader in self._readers:
+            reader.close()
+        self._readers = []
+        self._source.release()
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+        if self.path and getattr(self, '_owns_path', False):
+            try:
+                os.remove(self.path)
+            except OSError:
+                pass
+            self.path = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
@@ -6,6 +6,8 @@ import numpy as np
 from datetime import datetime, timedelta
 import random
 
+from rules import RISK_COLOR_TABLE
+
 def calculate_disease_risk(age, weight, glucose=100, bp=120, creatinine=1.0):
     """
     Calculate disease risks based on patient metrics
@@ -133,13 +135,8 @@ def format_currency(amount):
     return f"${amount:,.0f}"
 
 def get_risk_color(percentage):
-    """Get color based on risk percentage"""
-    if percentage >= 70:
-        return '#ff3366'  # Red for high risk
-    elif percentage >= 50:
-        return '#ffcc00'  # Yellow for medium risk
-    else:
-        return '#00ff88'  # Green for low risk
+    """Get color based on risk percentage (green / yellow / red bands)"""
+    return RISK_COLOR_TABLE.label(percentage)
 
 def get_prevention_plan(risks):
     """Generate personalized prevention plan based on risks"""
@@ -0,0 +1,87 @@
+"""
+What-if simulator
+Precomputes a patient's risk response surface so slider moves become array lookups
+"""
+
+import numpy as np
+
+from batch_engine import BatchRiskCalculator, BREAKPOINTS, DISEASES
+
+# Slider ranges offered by the simulator (match the analyzer inputs)
+WHATIF_RANGES = {
+    'glucose': (50, 300),
+    'bp_systolic': (80, 200),
+    'cholesterol': (100, 400),
+    'bmi': (15.0, 45.0)
+}
+
+AXES = list(WHATIF_RANGES)
+
+
+class WhatIfSimulator:
+    """Risk response surface for one patient over the what-if sliders"""
+
+    def __init__(self, patient_data):
+        self.patient_data = dict(patient_data or {})
+        self.cuts = {axis: np.asarray(BREAKPOINTS[axis], dtype=float) for axis in AXES}
+
+        # calculate_risks is piecewise-constant between cut points, so one
+        # representative value per segment describes the whole slider range
+        representatives = []
+        for axis in AXES:
+            cuts = self.cuts[axis]
+            representatives.append(np.concatenate([cuts[:1], np.nextafter(cuts, np.inf)]))
+
+        grid = np.meshgrid(*representatives, indexing='ij')
+        self.shape = grid[0].shape
+        size = grid[0].size
+
+        rows = {key: np.repeat(np.atleast_1d(value), size)
+                for key, value in self.patient_data.items()
+                if isinstance(value, (int, float, bool, np.number, np.bool_))}
+        for axis, values in zip(AXES, grid):
+            rows[axis] = values.ravel()
+
+        risks = BatchRiskCalculator.calculate_risks(rows)
+        timeline = BatchRiskCalculator.generate_timeline(risks)
+
+        self.years = timeline['years']
+        self.risks = {d: risks[d].reshape(self.shape) for d in DISEASES}
+        self.health_scores = BatchRiskCalculator.calculate_health_score(rows).reshape(self.shape)
+        self.without = {d: timeline['without_intervention'][d].reshape(self.shape + (-1,)) for d in DISEASES}
+        self.with_int = {d: timeline['with_intervention'][d].reshape(self.shape + (-1,)) for d in DISEASES}
+
+    def _cell(self, values):
+        """Locate the surface cell for the given slider values"""
+        cell = []
+        for axis in AXES:
+            value = values.get(axis, self.patient_data.get(axis))
+            if value is None:
+                value = self.cuts[axis][0]
+            cell.append(int(np.searchsorted(self.cuts[axis], value, side='left')))
+        return tuple(cell)
+
+    def lookup(self, **values):
+        """Look up risks, health score and timeline for slider values"""
+        cell = self._cell(values)
+
+        risk_scores = {}
+        for disease in DISEASES:
+            risk = float(self.risks[disease][cell])
+            risk_scores[disease] = {
+                'risk': risk,
+                'level': str(BatchRiskCalculator.get_levels(risk)),
+                'percentage': round(risk * 100, 1)
+            }
+
+        timeline = {
+            'years': self.years,
+            'without_intervention': {d: self.without[d][cell].tolist() for d in DISEASES},
+            'with_intervention': {d: self.with_int[d][cell].tolist() for d in DISEASES}
+        }
+
+        return {
+            'risk_scores': risk_scores,
+            'health_score': float(self.health_scores[cell]),
+            'timeline': timeline
+        }